@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+
+import logging
+
+from collections import OrderedDict, defaultdict
+
+from tornado import gen
+from tornado.locks import Semaphore
+from tornado.web import HTTPError
+
+import metrics
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 100  # certificate downloads in progress
+DEFAULT_MAX_QUEUED = 200  # downloads waiting for a slot
+DEFAULT_MAX_PER_CLIENT = 10  # downloads in progress or waiting, per client
+DEFAULT_RETRY_AFTER = 1  # seconds
+
+
+class RejectedError(HTTPError):
+    def __init__(self, status_code, reason, retry_after):
+        self.retry_after = retry_after
+        super(RejectedError, self).__init__(
+            status_code=status_code, reason=reason)
+
+
+class AdmissionController(object):
+    """
+    Bounds the work in progress: at most `max_concurrent` downloads run at
+    once and at most `max_queued` more wait for a slot. Each client may have
+    at most `max_per_client` requests in progress, counted per request
+    rather than per download, so that callers sharing a download are each
+    held to their own limit.
+
+    Anything over those limits is rejected straight away (503 when the
+    server is full, 429 when one client is over its share) rather than
+    queueing for longer than a client will wait.
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 max_queued=DEFAULT_MAX_QUEUED,
+                 max_per_client=DEFAULT_MAX_PER_CLIENT,
+                 retry_after=DEFAULT_RETRY_AFTER):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_per_client = max_per_client
+        self.retry_after = retry_after
+
+        self._slots = Semaphore(max_concurrent)
+        self._per_client = defaultdict(int)
+
+        self.running = 0
+        self.queued = 0
+        self.rejected_busy = 0
+        self.rejected_client = 0
+
+    def admit(self, client):
+        """
+        Count a request against `client`'s share, for use as
+        `with admission.admit(ip):`. A `client` of None isn't subject to the
+        per-client limit.
+        """
+        if client is not None:
+            if self._per_client[client] >= self.max_per_client:
+                self.rejected_client += 1
+                raise RejectedError(
+                    429,
+                    'Too many requests in progress from {}.'.format(client),
+                    self.retry_after)
+
+            self._per_client[client] += 1
+
+        return _Admitted(self._release_client, client)
+
+    @gen.coroutine
+    def acquire(self):
+        """
+        Wait for a download slot, for use as
+        `with (yield admission.acquire()):`.
+        """
+        if self.running >= self.max_concurrent and \
+                self.queued >= self.max_queued:
+            self.rejected_busy += 1
+            LOG.warning('Server busy, rejecting download')
+            raise RejectedError(
+                503, 'Server busy, try again shortly.', self.retry_after)
+
+        self.queued += 1
+        try:
+            with metrics.timed('queue_wait'):
+                yield self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        raise gen.Return(_Admitted(self._release_slot))
+
+    def _release_slot(self):
+        self.running -= 1
+        self._slots.release()
+
+    def _release_client(self, client):
+        if client is None:
+            return
+
+        self._per_client[client] -= 1
+        if self._per_client[client] == 0:
+            del self._per_client[client]
+
+    def stats(self):
+        return OrderedDict([
+            ('running', self.running),
+            ('queued', self.queued),
+            ('rejected_busy', self.rejected_busy),
+            ('rejected_client', self.rejected_client),
+        ])
+
+
+class _Admitted(object):
+    def __init__(self, release, *args):
+        self._release = release
+        self._args = args
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._release(*self._args)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+Memory held per cached certificate, comparing CertificateRecord with the
+previous representation: a LazyFields mapping of memoised getters per
+certificate, measured after a JSON request (two fields read) and after an
+HTML request (every field read).
+
+tracemalloc only sees Python allocations. The old mapping also kept each
+OpenSSL X509 object alive, so its real cost is higher than reported.
+
+Usage, from the `app` directory:
+
+    python -m benchmarks.bench_certificate_memory [certificates]
+"""
+
+import gc
+import pickle
+import sys
+import tracemalloc
+
+from functools import partial
+
+import OpenSSL
+
+from benchmarks.tls_fleet import make_certificate_chain
+from format_response import (
+    LazyFields, SUBJECT_FIELDS, format_certificate, format_der_as_utf8,
+    get_certificate_asn1_as_binary, get_certificate_pem_as_utf8,
+    get_certificate_text_as_utf8, get_fingerprint)
+from parse_certificate import (
+    parse_expiry, parse_serial_number, parse_subject_components)
+
+
+def main(count=1000):
+    x509s = [_make_x509() for _ in range(count)]
+
+    print('{:<28} {:>14} {:>14}'.format(
+        'representation', 'bytes/entry', 'pickled bytes'))
+
+    for label, make_entry, fields in [
+            ('LazyFields, after JSON', _lazy_fields,
+             ['serial_number', 'expiry_datetime']),
+            ('LazyFields, after HTML', _lazy_fields, None),
+            ('CertificateRecord', format_certificate, None)]:
+
+        per_entry, entries = _measure(x509s, make_entry, fields)
+        pickled = _pickled_size(entries[0])
+
+        print('{:<28} {:>14.0f} {:>14}'.format(label, per_entry, pickled))
+
+
+def _measure(x509s, make_entry, fields):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    entries = []
+    for x509 in x509s:
+        entry = make_entry(x509)
+        for key in (fields or list(entry)):
+            entry[key]
+        entries.append(entry)
+
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return (after - before) / float(len(x509s)), entries
+
+
+def _pickled_size(entry):
+    try:
+        return len(pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))
+    except Exception:  # closures over X509 objects don't pickle
+        return 'n/a'
+
+
+def _lazy_fields(x509):
+    """
+    The per-certificate mapping format_certificate() used to build.
+    """
+    parse_subject = _memoize(partial(parse_subject_components, x509))
+
+    cert = LazyFields()
+    cert.add('serial_number', partial(parse_serial_number, x509))
+    cert.add('expiry_datetime', lambda: str(parse_expiry(x509)))
+
+    for field_name, component_name in SUBJECT_FIELDS:
+        cert.add(field_name, partial(
+            lambda name: parse_subject().get(name), component_name))
+
+    cert.add('sha1_fingerprint', partial(get_fingerprint, x509, 'sha1'))
+    cert.add('sha256_fingerprint', partial(get_fingerprint, x509, 'sha256'))
+    cert.add('certificate.txt', partial(get_certificate_text_as_utf8, x509))
+    cert.add('certificate.pem', partial(get_certificate_pem_as_utf8, x509))
+    cert.add('certificate.der.txt', lambda: format_der_as_utf8(
+        cert['certificate.der']))
+    cert.add('certificate.der', partial(get_certificate_asn1_as_binary, x509))
+
+    return cert
+
+
+def _memoize(function):
+    results = []
+
+    def memoized():
+        if not results:
+            results.append(function())
+        return results[0]
+
+    return memoized
+
+
+def _make_x509():
+    _, chain_pem = make_certificate_chain('ec', 1)
+    return OpenSSL.crypto.load_certificate(
+        OpenSSL.crypto.FILETYPE_PEM, chain_pem)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
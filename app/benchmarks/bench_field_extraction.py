@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+CPU time to parse one certificate's fields, comparing extract_fields(),
+which reads the DER with `cryptography`, with the pyOpenSSL getters that
+format_certificate() used before, with and without the text dump that
+building every representation used to include.
+
+extract_fields() also returns fields the old path has no equivalent for
+(issuer, validity start, SANs, key type and size, extensions), so the
+comparison is not like for like in its favour.
+
+Usage, from the `app` directory:
+
+    python -m benchmarks.bench_field_extraction [iterations]
+"""
+
+import sys
+import time
+
+import OpenSSL
+
+from OpenSSL.crypto import FILETYPE_ASN1, FILETYPE_PEM, FILETYPE_TEXT
+
+from benchmarks.tls_fleet import make_certificate_chain
+from certificate_fields import extract_fields
+from parse_certificate import (
+    parse_expiry, parse_serial_number, parse_subject_components)
+
+from tests import load_example_x509
+
+
+def main(iterations=2000):
+    certificates = [
+        ('example.com (RSA 2048)', load_example_x509()),
+        ('generated (RSA 2048)', _make_x509('rsa')),
+        ('generated (EC P-256)', _make_x509('ec')),
+    ]
+
+    print('{:<24} {:>14} {:>14} {:>14} {:>8}'.format(
+        'certificate', 'getters (us)', '+ text (us)', 'DER (us)',
+        'speedup'))
+
+    for label, x509 in certificates:
+        der = OpenSSL.crypto.dump_certificate(FILETYPE_ASN1, x509)
+
+        getters = _cpu_time_per_call(
+            lambda: _pyopenssl_fields(x509), iterations)
+        with_text = _cpu_time_per_call(
+            lambda: _pyopenssl_fields_and_text(x509), iterations)
+        structured = _cpu_time_per_call(
+            lambda: extract_fields(der), iterations)
+
+        print('{:<24} {:>14.1f} {:>14.1f} {:>14.1f} {:>7.1f}x'.format(
+            label, getters * 1e6, with_text * 1e6, structured * 1e6,
+            with_text / structured))
+
+
+def _pyopenssl_fields(x509):
+    """
+    The fields format_certificate() read before extract_fields().
+    """
+    return [
+        parse_serial_number(x509),
+        str(parse_expiry(x509)),
+        parse_subject_components(x509),
+        x509.digest('sha1').decode('ascii').lower(),
+        x509.digest('sha256').decode('ascii').lower(),
+    ]
+
+
+def _pyopenssl_fields_and_text(x509):
+    fields = _pyopenssl_fields(x509)
+    fields.append(OpenSSL.crypto.dump_certificate(FILETYPE_TEXT, x509))
+    return fields
+
+
+def _make_x509(key_type):
+    _, chain_pem = make_certificate_chain(key_type, 1)
+    return OpenSSL.crypto.load_certificate(FILETYPE_PEM, chain_pem)
+
+
+def _cpu_time_per_call(function, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        function()
+    return (time.process_time() - start) / iterations
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+CPU time spent in `format_response` per endpoint, comparing the lazy
+mapping with building every representation up front (the old behaviour).
+
+Usage, from the `app` directory:
+
+    python -m benchmarks.bench_format_response [iterations]
+"""
+
+import sys
+import time
+
+from format_response import format_response
+
+from tests import load_example_x509
+
+
+# endpoint -> function reading what that endpoint's handler reads
+ENDPOINTS = [
+    ('/host (json)', lambda r: r['json_version']),
+    ('/host (html)', lambda r: [r['cert'][k] for k in r['cert']]),
+    ('/host/serial-number', lambda r: r['cert']['serial_number']),
+    ('/host/expiry-datetime', lambda r: r['cert']['expiry_datetime']),
+    ('/host/sha256-fingerprint', lambda r: r['cert']['sha256_fingerprint']),
+    ('/host/certificate.pem', lambda r: r['cert']['certificate.pem']),
+    ('/host/certificate.der', lambda r: r['cert']['certificate.der']),
+    ('/host/certificate.txt', lambda r: r['cert']['certificate.txt']),
+]
+
+
+def main(iterations=2000):
+    x509 = load_example_x509()
+
+    print('{:<28} {:>12} {:>12} {:>8}'.format(
+        'endpoint', 'eager (us)', 'lazy (us)', 'speedup'))
+
+    for endpoint, read in ENDPOINTS:
+        eager = _cpu_time_per_call(
+            lambda: read(_eager(format_response('example.com', 443, x509))),
+            iterations)
+        lazy = _cpu_time_per_call(
+            lambda: read(format_response('example.com', 443, x509)),
+            iterations)
+
+        print('{:<28} {:>12.1f} {:>12.1f} {:>7.1f}x'.format(
+            endpoint, eager * 1e6, lazy * 1e6, eager / lazy))
+
+
+def _eager(response):
+    for key in response['cert']:
+        response['cert'][key]
+    response['json_version']
+    return response
+
+
+def _cpu_time_per_call(function, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        function()
+    return (time.process_time() - start) / iterations
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""
+Colon-hex formatting of DER input from 1 KB to 64 KB, comparing
+`hex_format.format_hex_octets` with the per-octet implementation it
+replaced.
+
+Usage, from the `app` directory:
+
+    python -m benchmarks.bench_hex_format [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+from hex_format import format_hex_octets
+
+
+SIZES = [1024, 4096, 16 * 1024, 64 * 1024]
+
+
+def main(iterations=200):
+    print('{:>8} {:>14} {:>14} {:>8}'.format(
+        'bytes', 'per-octet (us)', 'bulk (us)', 'speedup'))
+
+    for size in SIZES:
+        data = os.urandom(size)
+
+        old = _time(lambda: _per_octet_format(data, 18), iterations)
+        new = _time(lambda: format_hex_octets(data, 18), iterations)
+
+        print('{:>8} {:>14.1f} {:>14.1f} {:>7.1f}x'.format(
+            size, old * 1e6, new * 1e6, old / new))
+
+
+def _per_octet_format(data, octets_per_line):
+    octet_strings = ['{0:02x}'.format(octet) for octet in bytearray(data)]
+    long_line = ':'.join(octet_strings)
+    n = 3 * octets_per_line
+    return '\n'.join(
+        [long_line[i:i + n] for i in range(0, len(long_line), n)])
+
+
+def _time(function, iterations):
+    return min(timeit.repeat(function, number=iterations, repeat=3)) / (
+        iterations)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+Rendering cost of the HTML dump view, comparing templates compiled at
+startup with looking each one up through the Jinja loader per request (the
+old behaviour: an auto-reloading Environment, no bytecode cache).
+
+Reports the first request in a fresh process, the template lookup and
+render alone, and the whole `GET /_test/example.com` with
+`Accept: text/html`.
+
+Usage, from the `app` directory:
+
+    python -m benchmarks.bench_render [requests]
+"""
+
+import logging
+import sys
+import time
+
+from jinja2 import Environment, FileSystemLoader
+from tornado.testing import AsyncHTTPTestCase
+
+import main as ssldump
+
+from format_response import format_response
+from tests import load_example_x509
+
+
+HTML_HEADERS = {'Accept': 'text/html'}
+
+
+class _Client(AsyncHTTPTestCase):
+    def get_app(self):
+        return ssldump.make_app()
+
+    def runTest(self):
+        pass
+
+
+def main(requests=500):
+    logging.disable(logging.WARNING)  # client_accepts_html logs every call
+
+    print('{:<26} {:>11} {:>14} {:>16}'.format(
+        '', 'first (ms)', 'render (us)', 'request (us)'))
+
+    for label, render in [
+            ('per-request get_template', _render_via_loader()),
+            ('precompiled', _render_precompiled())]:
+
+        original = ssldump.RenderToTemplateMixin.render_to_template
+        ssldump.RenderToTemplateMixin.render_to_template = render
+        try:
+            _report(label, render, requests)
+        finally:
+            ssldump.RenderToTemplateMixin.render_to_template = original
+
+
+def _render_via_loader():
+    env = Environment(loader=FileSystemLoader([ssldump.TEMPLATE_DIR]))
+
+    def render_to_template(self, template_name, args_dict):
+        return env.get_template(template_name).render(args_dict)
+
+    return render_to_template
+
+
+def _render_precompiled():
+    templates = ssldump.load_templates(ssldump.make_template_environment())
+
+    def render_to_template(self, template_name, args_dict):
+        return templates[template_name].render(args_dict)
+
+    return render_to_template
+
+
+def _report(label, render, requests):
+    response_data = format_response('example.com', 443, load_example_x509())
+    response_data['uri'] = 'http://localhost/example.com'
+
+    start = time.time()
+    render(None, 'dump.html', response_data)
+    first = time.time() - start
+
+    start = time.process_time()
+    for _ in range(requests):
+        render(None, 'dump.html', response_data)
+    render_cpu = (time.process_time() - start) / requests
+
+    client = _Client()
+    client.setUp()
+    try:
+        start = time.process_time()
+        for _ in range(requests):
+            client.fetch('/_test/example.com', headers=HTML_HEADERS)
+        request_cpu = (time.process_time() - start) / requests
+    finally:
+        client.tearDown()
+
+    print('{:<26} {:>11.2f} {:>14.1f} {:>16.1f}'.format(
+        label, first * 1e3, render_cpu * 1e6, request_cpu * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
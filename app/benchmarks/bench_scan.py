@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""
+Offline throughput of the batch scanner against local TLS servers.
+
+Starts stand-in TLS servers on loopback, writes a target list that cycles
+over them, and times `scan.py` with different process counts.
+
+Usage, from the `app` directory:
+
+    python -m benchmarks.bench_scan [targets] [servers]
+"""
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from contextlib import contextmanager
+
+import scan
+
+from tests import local_tls_server_in_thread
+
+
+def main(target_count=2000, server_count=8):
+    directory = tempfile.mkdtemp()
+    try:
+        with _local_servers(server_count) as ports:
+            hosts = os.path.join(directory, 'hosts.txt')
+            with open(hosts, 'w') as f:
+                for i in range(target_count):
+                    f.write('127.0.0.1:{}\n'.format(ports[i % len(ports)]))
+
+            print('{:>10} {:>10} {:>12}'.format(
+                'processes', 'seconds', 'targets/s'))
+
+            for processes in sorted(set([1, multiprocessing.cpu_count()])):
+                report = os.path.join(directory, 'report_{}.csv'.format(
+                    processes))
+
+                start = time.time()
+                scan.main([hosts, '--output', report,
+                           '--processes', str(processes)])
+                elapsed = time.time() - start
+
+                print('{:>10} {:>10.2f} {:>12.0f}'.format(
+                    processes, elapsed, target_count / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+@contextmanager
+def _local_servers(count, ports=None):
+    ports = ports or []
+    if len(ports) == count:
+        yield ports
+        return
+
+    with local_tls_server_in_thread() as port:
+        with _local_servers(count, ports + [port]) as all_ports:
+            yield all_ports
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
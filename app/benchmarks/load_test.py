@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+"""
+Load test of the running web app against a local fleet of TLS servers.
+
+Starts a fleet of stand-in TLS servers (see `tls_fleet`) and, for each
+endpoint type, a fresh `main.py` subprocess. Requests for hosts across the
+fleet are then sent at a fixed rate, whether or not earlier ones have
+finished, as real clients would. Reports throughput, latency percentiles,
+response codes and the app's CPU time per request. An endpoint whose
+requests haven't all finished within `--timeout` seconds of the run ending
+is reported as timed out, and the load test exits non-zero.
+
+CPU is measured with getrusage(RUSAGE_CHILDREN) around each app process,
+including any pre-forked workers (which the app's parent process reaps),
+less the cost of an idle start and stop.
+
+Usage, from the `app` directory:
+
+    python -m benchmarks.load_test [--rps 200] [--duration 10]
+        [--processes 1] [--fetch-mode async|blocking] [--cache-ttl 0]
+        [--healthy 8] [--failing 0] [--handshake-delay 0]
+        [--endpoints json,html,field,download] [--timeout 60]
+"""
+
+from __future__ import print_function
+
+import argparse
+import errno
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from os.path import dirname
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.ioloop import IOLoop
+from tornado.util import TimeoutError
+
+from benchmarks.tls_fleet import fleet_in_process, make_members
+
+
+APP_DIR = dirname(dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = OrderedDict([
+    ('json', ('/localhost:{}', {})),
+    ('html', ('/localhost:{}', {'Accept': 'text/html'})),
+    ('field', ('/localhost:{}/serial-number', {})),
+    ('download', ('/localhost:{}/certificate.pem', {})),
+])
+
+PERCENTILES = (50, 90, 99)
+
+DEFAULT_TIMEOUT = 60  # seconds, per request and for a run to finish
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    members = make_members(args.healthy, args.failing, args.handshake_delay)
+
+    with fleet_in_process(members) as ports:
+        idle_cpu = _measure_idle_cpu(args)
+
+        print('{:<9} {:>7} {:>8} {:>8} {:>8} {:>8} {:>10}  {}'.format(
+            'endpoint', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+            'cpu us/req', 'responses'))
+
+        timed_out = []
+        for endpoint in args.endpoints:
+            path, headers = ENDPOINTS[endpoint]
+            urls = [path.format(port) for port in ports]
+
+            with _running_app(args) as app_port:
+                cpu_before = _children_cpu()
+                try:
+                    results, elapsed = IOLoop.current().run_sync(
+                        lambda: drive(app_port, urls, headers, args.rps,
+                                      args.duration, args.timeout),
+                        timeout=args.duration + args.timeout)
+                except TimeoutError:
+                    timed_out.append(endpoint)
+                    print('{:<9} timed out after {:.0f}s'.format(
+                        endpoint, args.duration + args.timeout))
+                    continue
+            cpu = _children_cpu() - cpu_before - idle_cpu
+
+            _report(endpoint, results, elapsed, cpu)
+
+    if timed_out:
+        sys.exit('Timed out: {}'.format(', '.join(timed_out)))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rps', type=float, default=200)
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds per endpoint')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--fetch-mode', choices=['async', 'blocking'],
+                        default='async')
+    parser.add_argument('--cache-ttl', type=int, default=0,
+                        help='certificate cache TTL; 0 handshakes every time')
+    parser.add_argument('--healthy', type=int, default=8)
+    parser.add_argument('--failing', type=int, default=0)
+    parser.add_argument('--handshake-delay', type=float, default=0.0)
+    parser.add_argument(
+        '--endpoints', type=lambda value: value.split(','),
+        default=list(ENDPOINTS))
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='seconds allowed per request, and for all to '
+                             'finish after the run')
+    return parser.parse_args(argv)
+
+
+@gen.coroutine
+def drive(app_port, urls, headers, rps, duration,
+          request_timeout=DEFAULT_TIMEOUT):
+    """
+    Request `urls` in rotation at `rps` for `duration` seconds. Returns a
+    list of (seconds, status code) and the time taken for all to finish.
+    """
+    client = AsyncHTTPClient(max_clients=10000)
+    io_loop = IOLoop.current()
+    count = int(rps * duration)
+
+    start = io_loop.time()
+    requests = []
+    for i in range(count):
+        delay = start + i / rps - io_loop.time()
+        if delay > 0:
+            yield gen.sleep(delay)
+
+        url = 'http://127.0.0.1:{}{}'.format(app_port, urls[i % len(urls)])
+        requests.append(_timed_fetch(client, url, headers, request_timeout))
+
+    results = yield requests
+    raise gen.Return((results, io_loop.time() - start))
+
+
+@gen.coroutine
+def _timed_fetch(client, url, headers, request_timeout):
+    start = time.time()
+    try:
+        response = yield client.fetch(
+            url, headers=headers, raise_error=False,
+            request_timeout=request_timeout)
+    except HTTPError as e:  # timeouts are raised regardless, as 599s
+        raise gen.Return((time.time() - start, e.code))
+    raise gen.Return((time.time() - start, response.code))
+
+
+def _report(endpoint, results, elapsed, cpu):
+    latencies = sorted(seconds for seconds, _ in results)
+    codes = Counter(code for _, code in results)
+
+    print('{:<9} {:>7.0f} {} {:>8.1f} {:>10.0f}  {}'.format(
+        endpoint,
+        len(results) / elapsed,
+        ' '.join('{:>8.1f}'.format(_percentile(latencies, p) * 1e3)
+                 for p in PERCENTILES),
+        latencies[-1] * 1e3,
+        cpu / len(results) * 1e6,
+        ' '.join('{}x{}'.format(count, code)
+                 for code, count in sorted(codes.items()))))
+
+
+def _percentile(sorted_values, percent):
+    index = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def _measure_idle_cpu(args):
+    cpu_before = _children_cpu()
+    with _running_app(args):
+        pass
+    return _children_cpu() - cpu_before
+
+
+@contextmanager
+def _running_app(args):
+    """
+    Run `main.py` on a free port, then stop it and wait so that its CPU
+    time is counted in RUSAGE_CHILDREN. Yields the port.
+
+    The app runs in its own process group, which is signalled as a whole
+    and waited on until every pre-forked worker has gone too.
+    """
+    port = _free_port()
+    env = dict(
+        os.environ,
+        SSLDUMP_FETCH_MODE=args.fetch_mode,
+        SSLDUMP_CACHE_TTL=str(args.cache_ttl),
+        SSLDUMP_MAX_PER_CLIENT=str(10 ** 6))  # all requests come from here
+
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(
+            [sys.executable, 'main.py', '--port', str(port),
+             '--processes', str(args.processes)],
+            cwd=APP_DIR, env=env, stdout=devnull, stderr=devnull,
+            start_new_session=True)
+
+    try:
+        _wait_for_port(port)
+        yield port
+    finally:
+        _signal_group(process.pid, signal.SIGTERM)
+        process.wait()
+        _wait_for_group_exit(process.pid)
+
+
+def _signal_group(process_group, signum):
+    try:
+        os.killpg(process_group, signum)
+    except OSError as e:
+        if e.errno != errno.ESRCH:  # everything has already exited
+            raise
+
+
+def _wait_for_group_exit(process_group, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            os.killpg(process_group, 0)
+        except OSError as e:
+            if e.errno == errno.ESRCH:
+                return
+            raise
+
+        if time.time() > deadline:
+            _signal_group(process_group, signal.SIGKILL)
+            raise RuntimeError(
+                'App workers still running {}s after SIGTERM'.format(timeout))
+        time.sleep(0.05)
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+if __name__ == '__main__':
+    main()
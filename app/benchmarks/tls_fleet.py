@@ -0,0 +1,228 @@
+"""
+A fleet of local TLS servers standing in for the hosts ssldump looks up.
+
+Each member listens on its own loopback port and differs in certificate key
+type, chain length and handshake delay, or misbehaves in one of
+FAILURE_MODES. Certificates are issued for `localhost` by a throwaway CA
+generated at startup.
+"""
+
+from __future__ import unicode_literals
+
+import binascii
+import datetime
+import multiprocessing
+import os
+import shutil
+import socket
+import ssl
+import tempfile
+
+from collections import namedtuple
+from contextlib import contextmanager
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_sockets
+from tornado.tcpserver import TCPServer
+
+
+FAILURE_MODES = (
+    'refuse',  # nothing listening
+    'reset',  # accept, then close without a word
+    'silent',  # accept and never reply, so the client times out
+    'plaintext',  # reply with HTTP instead of a TLS handshake
+)
+
+KEY_TYPES = ('rsa', 'ec')
+
+Member = namedtuple(
+    'Member', 'key_type chain_length handshake_delay failure')
+
+
+def make_members(healthy=8, failing=0, handshake_delay=0.0):
+    """
+    Return `healthy` members cycling through key types and chain lengths
+    1-3, followed by `failing` members cycling through FAILURE_MODES.
+    """
+    members = [
+        Member(KEY_TYPES[i % len(KEY_TYPES)], 1 + i % 3, handshake_delay,
+               None)
+        for i in range(healthy)]
+    members.extend(
+        Member('rsa', 1, 0.0, FAILURE_MODES[i % len(FAILURE_MODES)])
+        for i in range(failing))
+    return members
+
+
+@contextmanager
+def fleet_in_process(members):
+    """
+    Run the fleet in a child process, so its handshakes don't compete with
+    the caller for the GIL. Yields a list of ports, one per member.
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_run_fleet, args=(members, ports))
+    process.daemon = True
+    process.start()
+
+    try:
+        yield ports.get(timeout=60)
+    finally:
+        process.terminate()
+        process.join()
+
+
+def _run_fleet(members, ports_queue):
+    directory = tempfile.mkdtemp()
+    try:
+        ports = [_start_member(member, directory, i)
+                 for i, member in enumerate(members)]
+        ports_queue.put(ports)
+        IOLoop.current().start()
+    finally:
+        shutil.rmtree(directory)
+
+
+def _start_member(member, directory, index):
+    [sock] = bind_sockets(0, '127.0.0.1', family=socket.AF_INET)
+    port = sock.getsockname()[1]
+
+    if member.failure == 'refuse':
+        sock.close()
+        return port
+
+    ssl_context = None
+    if member.failure is None:
+        ssl_context = _make_ssl_context(
+            member, os.path.join(directory, str(index)))
+
+    server = StandInServer(ssl_context, member.handshake_delay,
+                           member.failure)
+    server.add_sockets([sock])
+    return port
+
+
+class StandInServer(TCPServer):
+    def __init__(self, ssl_context, handshake_delay=0.0, failure=None):
+        super(StandInServer, self).__init__()
+        self.ssl_context = ssl_context
+        self.handshake_delay = handshake_delay
+        self.failure = failure
+        self.silent_streams = []
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        if self.failure == 'reset':
+            stream.close()
+            return
+
+        if self.failure == 'silent':
+            self.silent_streams.append(stream)
+            return
+
+        if self.failure == 'plaintext':
+            yield stream.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
+            stream.close()
+            return
+
+        if self.handshake_delay:
+            yield gen.sleep(self.handshake_delay)
+
+        try:
+            stream = yield stream.start_tls(
+                server_side=True, ssl_options=self.ssl_context)
+            yield stream.read_until_close()
+        except (StreamClosedError, ssl.SSLError, socket.error):
+            pass
+
+
+def _make_ssl_context(member, prefix):
+    key_pem, chain_pem = make_certificate_chain(
+        member.key_type, member.chain_length)
+
+    with open(prefix + '.key', 'wb') as f:
+        f.write(key_pem)
+    with open(prefix + '.pem', 'wb') as f:
+        f.write(chain_pem)
+
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    ssl_context.load_cert_chain(prefix + '.pem', prefix + '.key')
+    return ssl_context
+
+
+def make_certificate_chain(key_type='rsa', chain_length=1):
+    """
+    Return (leaf key, chain) as PEM: a `localhost` certificate followed by
+    `chain_length - 1` intermediates. The root that signs the topmost
+    certificate is not included, as servers don't usually send it.
+    """
+    issuer_key = _generate_key('ec')
+    issuer_name = _name('ssldump benchmark root')
+
+    certificates = []
+    for depth in range(chain_length - 1):
+        key = _generate_key('ec')
+        name = _name('ssldump benchmark intermediate {}'.format(depth + 1))
+        certificates.append(_issue(name, key, issuer_name, issuer_key, True))
+        issuer_name, issuer_key = name, key
+
+    leaf_key = _generate_key(key_type)
+    certificates.append(
+        _issue(_name('localhost'), leaf_key, issuer_name, issuer_key, False))
+
+    key_pem = leaf_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption())
+    chain_pem = b''.join(
+        certificate.public_bytes(serialization.Encoding.PEM)
+        for certificate in reversed(certificates))
+
+    return key_pem, chain_pem
+
+
+def _generate_key(key_type):
+    if key_type == 'ec':
+        return ec.generate_private_key(ec.SECP256R1(), default_backend())
+
+    return rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend())
+
+
+def _name(common_name):
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+
+
+def _issue(subject, key, issuer, issuer_key, is_ca):
+    now = datetime.datetime.utcnow()
+
+    builder = x509.CertificateBuilder().subject_name(
+        subject
+    ).issuer_name(
+        issuer
+    ).public_key(
+        key.public_key()
+    ).serial_number(
+        int(binascii.hexlify(os.urandom(16)), 16) >> 1
+    ).not_valid_before(
+        now - datetime.timedelta(days=1)
+    ).not_valid_after(
+        now + datetime.timedelta(days=90)
+    ).add_extension(
+        x509.BasicConstraints(ca=is_ca, path_length=None), critical=True)
+
+    if not is_ca:
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName([x509.DNSName('localhost')]),
+            critical=False)
+
+    return builder.sign(issuer_key, hashes.SHA256(), default_backend())
@@ -0,0 +1,46 @@
+from __future__ import unicode_literals
+
+import time
+
+from collections import Counter
+
+from ttl_cache import TtlCache
+
+
+DEFAULT_TTL = 300  # seconds
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_STALE_TTL = 60  # seconds an expired entry may be served for
+
+
+class CertificateCache(TtlCache):
+    """
+    Process-local cache of downloaded certificate chains, keyed by
+    (hostname, port, server_hostname, starttls). See TtlCache: N
+    simultaneous requests for one host cause a single TLS handshake.
+
+    With `track_accesses`, lookups per key are counted for a refresh-ahead
+    scheduler to collect with `take_accesses`.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 stale_ttl=0, track_accesses=False, clock=time.time):
+        super(CertificateCache, self).__init__(
+            ttl, max_entries, stale_ttl=stale_ttl, clock=clock)
+
+        # key -> lookups since take_accesses()
+        self._accesses = Counter() if track_accesses else None
+
+    def get_or_fetch(self, key, fetch):
+        if self._accesses is not None:
+            self._accesses[key] += 1
+
+        return super(CertificateCache, self).get_or_fetch(key, fetch)
+
+    def take_accesses(self):
+        """
+        Return a Counter of lookups per key since the last call.
+        """
+        accesses = self._accesses
+        if accesses is not None:
+            self._accesses = Counter()
+        return accesses or Counter()
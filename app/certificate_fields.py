@@ -0,0 +1,175 @@
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+
+from collections import OrderedDict
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import dsa, ec, rsa
+from cryptography.x509.oid import NameOID
+
+try:
+    from cryptography.hazmat.primitives.asymmetric import ed25519, ed448
+except ImportError:  # cryptography < 2.6
+    ed25519 = ed448 = None
+
+from hex_format import format_hex_octets
+from parse_certificate import decode_asn1_time, int_to_hex
+
+LOG = logging.getLogger(__name__)
+
+SUBJECT_OIDS = [  # (parse_subject_components() key, OID)
+    ('common_name', NameOID.COMMON_NAME),
+    ('organization', NameOID.ORGANIZATION_NAME),
+    ('organizational_unit', NameOID.ORGANIZATIONAL_UNIT_NAME),
+    ('street', NameOID.STREET_ADDRESS),
+    ('locality', NameOID.LOCALITY_NAME),
+    ('state', NameOID.STATE_OR_PROVINCE_NAME),
+    ('postal_code', NameOID.POSTAL_CODE),
+    ('country', NameOID.COUNTRY_NAME),
+    ('email_address', NameOID.EMAIL_ADDRESS),
+]
+
+VERSION_TAG = 0xa0  # [0] EXPLICIT, optional
+
+
+def extract_fields(der):
+    """
+    Return an OrderedDict of the fields of the DER-encoded certificate
+    `der`, read directly from its structure:
+
+    serial_number, not_before_datetime, expiry_datetime, expiry_timestamp
+    (POSIX), subject and issuer components (eg 'common_name', keyed as
+    parse_subject_components() does), subject_alt_names, public_key_type,
+    public_key_bits, extensions and the sha1 and sha256 fingerprints.
+
+    Missing name components are None; subject_alt_names and extensions are
+    tuples of strings.
+    """
+    certificate = x509.load_der_x509_certificate(der, default_backend())
+
+    fields = OrderedDict()
+    fields['serial_number'] = int_to_hex(certificate.serial_number)
+
+    not_before, not_after = read_validity(der)
+    fields['not_before_datetime'] = str(decode_asn1_time(not_before)[0])
+    expiry, fields['expiry_timestamp'] = decode_asn1_time(not_after)
+    fields['expiry_datetime'] = str(expiry)
+
+    fields['subject'] = _name_components(certificate.subject)
+    fields['issuer'] = _name_components(certificate.issuer)
+
+    extensions = _extensions(certificate)
+    fields['subject_alt_names'] = _subject_alt_names(extensions)
+    fields['public_key_type'], fields['public_key_bits'] = _describe_key(
+        certificate.public_key())
+    fields['extensions'] = tuple(
+        _oid_name(extension.oid) for extension in extensions)
+
+    fields['sha1_fingerprint'] = format_hex_octets(hashlib.sha1(der).digest())
+    fields['sha256_fingerprint'] = format_hex_octets(
+        hashlib.sha256(der).digest())
+
+    return fields
+
+
+def read_validity(der):
+    """
+    Return the raw contents of the notBefore and notAfter times of the
+    DER-encoded certificate `der`, eg b'181128120000Z', for
+    parse_certificate.decode_asn1_time().
+
+    Only the few elements before the validity are stepped over, rather
+    than the whole certificate being parsed.
+    """
+    data = bytearray(der)
+
+    _, start, _ = _read_element(data, 0)  # Certificate
+    _, start, _ = _read_element(data, start)  # TBSCertificate
+
+    tag, _, end = _read_element(data, start)
+    if tag == VERSION_TAG:
+        start = end
+
+    for _ in ('serialNumber', 'signature', 'issuer'):
+        _, _, start = _read_element(data, start)
+
+    _, start, _ = _read_element(data, start)  # Validity
+    _, not_before_start, not_before_end = _read_element(data, start)
+    _, not_after_start, not_after_end = _read_element(data, not_before_end)
+
+    return (bytes(data[not_before_start:not_before_end]),
+            bytes(data[not_after_start:not_after_end]))
+
+
+def _read_element(data, offset):
+    """
+    Return (tag, start, end) of the contents of the DER element at `offset`.
+    """
+    tag, length = data[offset], data[offset + 1]
+    start = offset + 2
+
+    if length & 0x80:  # long form: the next (length & 0x7f) octets
+        length_octets, length = length & 0x7f, 0
+        for index in range(start, start + length_octets):
+            length = (length << 8) | data[index]
+        start += length_octets
+
+    if start + length > len(data):
+        raise ValueError('Truncated DER element at offset {}'.format(offset))
+
+    return tag, start, start + length
+
+
+def _name_components(name):
+    components = {}
+    for key, oid in SUBJECT_OIDS:
+        attributes = name.get_attributes_for_oid(oid)
+        components[key] = attributes[0].value if attributes else None
+
+    return components
+
+
+def _extensions(certificate):
+    try:
+        return list(certificate.extensions)
+    except (ValueError, x509.DuplicateExtension) as e:
+        LOG.warning('Ignoring unparseable extensions: {!r}'.format(e))
+        return []
+
+
+def _subject_alt_names(extensions):
+    for extension in extensions:
+        if isinstance(extension.value, x509.SubjectAlternativeName):
+            return tuple(
+                '{}'.format(general_name.value)
+                for general_name in extension.value
+                if isinstance(general_name, (x509.DNSName, x509.IPAddress)))
+
+    return ()
+
+
+def _describe_key(public_key):
+    """
+    Return (type, size in bits) of `public_key`, eg ('RSA', 2048).
+    """
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return 'RSA', public_key.key_size
+    elif isinstance(public_key, ec.EllipticCurvePublicKey):
+        return 'EC', public_key.curve.key_size
+    elif isinstance(public_key, dsa.DSAPublicKey):
+        return 'DSA', public_key.key_size
+    elif ed25519 is not None and isinstance(
+            public_key, ed25519.Ed25519PublicKey):
+        return 'Ed25519', 256
+    elif ed448 is not None and isinstance(public_key, ed448.Ed448PublicKey):
+        return 'Ed448', 456
+
+    return type(public_key).__name__, None
+
+
+def _oid_name(oid):
+    name = getattr(oid, '_name', 'Unknown OID')
+    return oid.dotted_string if name == 'Unknown OID' else name
@@ -0,0 +1,103 @@
+from __future__ import unicode_literals
+
+import logging
+import math
+import time
+
+from collections import OrderedDict
+
+from tornado.web import HTTPError
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_BACKOFF = 10  # seconds, after the first failure
+DEFAULT_MAX_BACKOFF = 300  # seconds
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class CircuitOpenError(HTTPError):
+    """
+    A target failed recently; it won't be tried again for `retry_after`
+    seconds.
+    """
+
+    def __init__(self, error, retry_after):
+        self.retry_after = int(math.ceil(retry_after))
+        super(CircuitOpenError, self).__init__(
+            status_code=503,
+            reason='{} (not retrying for {}s)'.format(
+                error, self.retry_after))
+
+
+class CircuitBreaker(object):
+    """
+    Remembers which targets, eg (hostname, port), recently failed to connect
+    or handshake, so that requests for them fail fast instead of tying up a
+    connection or executor thread until the timeout.
+
+    After a failure the target's circuit is open for `backoff` seconds,
+    doubling with each consecutive failure up to `max_backoff`. The first
+    attempt after that goes through; success closes the circuit.
+    """
+
+    def __init__(self, backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF,
+                 max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_entries = max_entries
+        self._clock = clock
+
+        self._failures = OrderedDict()  # key -> (count, open_until, error)
+
+        self.fast_failures = 0
+        self.trips = 0
+
+    def check(self, key):
+        """
+        Raise CircuitOpenError if `key` failed too recently to try again.
+        """
+        try:
+            count, open_until, error = self._failures[key]
+        except KeyError:
+            return
+
+        retry_after = open_until - self._clock()
+        if retry_after > 0:
+            self.fast_failures += 1
+            raise CircuitOpenError(error, retry_after)
+
+    def record_failure(self, key, exception):
+        """
+        Open the circuit for `key` and return the CircuitOpenError to raise.
+        """
+        now = self._clock()
+        count, open_until, _ = self._failures.pop(key, (0, now, None))
+
+        if now - open_until > self.max_backoff:  # not consecutive
+            count = 0
+
+        backoff = min(self.backoff * 2 ** count, self.max_backoff)
+        error = repr(exception)
+        self._failures[key] = (count + 1, now + backoff, error)
+        self.trips += 1
+
+        while len(self._failures) > self.max_entries:
+            self._failures.popitem(last=False)
+
+        LOG.warning('{} failed ({}), backing off for {}s'.format(
+            key, error, backoff))
+        return CircuitOpenError(error, backoff)
+
+    def record_success(self, key):
+        self._failures.pop(key, None)
+
+    def stats(self):
+        now = self._clock()
+        return OrderedDict([
+            ('open', sum(1 for _, open_until, _ in self._failures.values()
+                         if open_until > now)),
+            ('trips', self.trips),
+            ('fast_failures', self.fast_failures),
+        ])
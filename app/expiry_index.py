@@ -0,0 +1,249 @@
+from __future__ import unicode_literals
+
+import bisect
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict, namedtuple
+
+import utcdatetime
+
+from concurrent.futures import ThreadPoolExecutor
+from tornado import gen
+from tornado.concurrent import run_on_executor
+
+
+LOG = logging.getLogger(__name__)
+
+SYNC_INTERVAL = 5  # seconds between reading other workers' writes
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MAX_AGE = 90 * 24 * 60 * 60  # seconds since a target was last seen
+
+PURGE_EVERY_N_WRITES = 100
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS expiry_index (
+        hostname TEXT NOT NULL,
+        port INTEGER NOT NULL,
+        expiry_timestamp REAL NOT NULL,
+        sha256_fingerprint TEXT NOT NULL,
+        last_seen REAL NOT NULL,
+        PRIMARY KEY (hostname, port)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS expiry_index_last_seen '
+    'ON expiry_index (last_seen)',
+]
+
+IndexEntry = namedtuple(
+    'IndexEntry',
+    'hostname port expiry_timestamp sha256_fingerprint last_seen')
+
+
+class ExpiryIndex(object):
+    """
+    Every (hostname, port) fetched, with the expiry and SHA256 fingerprint
+    of the certificate it last served and when that was, kept sorted by
+    expiry so that "what expires in the next N days?" is a binary search.
+
+    Targets not seen for `max_age` seconds are dropped, as are the least
+    recently seen beyond `max_entries`.
+
+    Without a `filename` the index is in memory only, and starts empty
+    each time. With one, entries are also written to an SQLite file, on a
+    thread so that the IOLoop never waits on its lock: they are loaded
+    from it on start, and sync_if_due() picks up writes by other worker
+    processes sharing it every SYNC_INTERVAL seconds.
+    """
+
+    # One thread, so that writes reach the file in the order they're made
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def __init__(self, filename=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_age=DEFAULT_MAX_AGE, clock=time.time):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+
+        # (hostname, port) -> IndexEntry, least recently seen first
+        self._entries = OrderedDict()
+        self._expiries = []  # sorted expiry timestamps...
+        self._targets = []  # ...and the (hostname, port) of each
+
+        self._synced_until = None
+        if filename is not None:
+            for statement in SCHEMA:
+                self._connection().execute(statement)
+            self.sync()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, hostname, port, cert):
+        """
+        Note that (hostname, port) just served `cert`, a CertificateRecord.
+
+        With a file, returns a Future for writing the entry to it.
+        """
+        entry = IndexEntry(hostname, port, cert['expiry_timestamp'],
+                           cert['sha256_fingerprint'], self._clock())
+        self._update(entry)
+        self._evict(entry.last_seen)
+
+        if self.filename is not None:
+            future = self._write(entry)
+            future.add_done_callback(_log_write_failure)
+            return future
+
+    def expiring_within(self, seconds, now=None):
+        """
+        Return the entries expiring in the next `seconds`, or that have
+        already expired, soonest first.
+        """
+        if now is None:
+            now = self._clock()
+
+        end = bisect.bisect_right(self._expiries, now + seconds)
+        return [self._entries[target] for target in self._targets[:end]]
+
+    def sync(self):
+        """
+        Load the entries written to the file since the last sync, by this
+        or any other process. Blocks: used on start.
+        """
+        now = self._clock()
+        self._load(self._read_since(self._synced_until), now)
+
+    @gen.coroutine
+    def sync_if_due(self):
+        """
+        As sync(), reading the file on a thread, if it's been SYNC_INTERVAL
+        seconds since the last one.
+        """
+        now = self._clock()
+        if self.filename is None or \
+                now - self._synced_until < SYNC_INTERVAL:
+            return
+
+        rows = yield self._read_since_async(self._synced_until)
+        self._load(rows, now)
+
+    def _load(self, rows, now):
+        loaded = 0
+        for row in rows:
+            entry = IndexEntry(*row)
+            current = self._entries.get((entry.hostname, entry.port))
+            if current is None or current.last_seen < entry.last_seen:
+                self._update(entry)
+                loaded += 1
+
+        self._evict(now)
+        LOG.debug('Loaded {} expiry index entries from {}'.format(
+            loaded, self.filename))
+        self._synced_until = now
+
+    def _read_since(self, since):
+        if since is None:
+            return self._connection().execute(
+                'SELECT * FROM expiry_index ORDER BY last_seen').fetchall()
+
+        # Allow for writes that were in progress at the last sync
+        return self._connection().execute(
+            'SELECT * FROM expiry_index WHERE last_seen >= ? '
+            'ORDER BY last_seen', (since - SYNC_INTERVAL,)).fetchall()
+
+    @run_on_executor
+    def _read_since_async(self, since):
+        return self._read_since(since)
+
+    @run_on_executor
+    def _write(self, entry):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO expiry_index '
+                '(hostname, port, expiry_timestamp, sha256_fingerprint, '
+                'last_seen) VALUES (?, ?, ?, ?, ?)', entry)
+
+        self._writes += 1
+        if self._writes % PURGE_EVERY_N_WRITES == 0:
+            self._purge(entry.last_seen)
+
+    def _purge(self, now):
+        """
+        Apply `max_age` and `max_entries` to the file.
+        """
+        connection = self._connection()
+        with connection:
+            deleted = connection.execute(
+                'DELETE FROM expiry_index WHERE last_seen < ?',
+                (now - self.max_age,)).rowcount
+            deleted += connection.execute(
+                'DELETE FROM expiry_index WHERE last_seen < ('
+                'SELECT last_seen FROM expiry_index '
+                'ORDER BY last_seen DESC LIMIT 1 OFFSET ?)',
+                (self.max_entries - 1,)).rowcount
+
+        LOG.debug('Purged {} expiry index entries from {}'.format(
+            deleted, self.filename))
+
+    def _update(self, entry):
+        target = (entry.hostname, entry.port)
+
+        if target in self._entries:
+            self._remove(target)
+
+        index = bisect.bisect_right(self._expiries, entry.expiry_timestamp)
+        self._expiries.insert(index, entry.expiry_timestamp)
+        self._targets.insert(index, target)
+        self._entries[target] = entry
+
+    def _evict(self, now):
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if len(self._entries) <= self.max_entries and \
+                    oldest.last_seen >= now - self.max_age:
+                break
+            self._remove((oldest.hostname, oldest.port))
+
+    def _remove(self, target):
+        entry = self._entries.pop(target)
+
+        index = bisect.bisect_left(self._expiries, entry.expiry_timestamp)
+        while self._targets[index] != target:  # equal expiries
+            index += 1
+        del self._expiries[index]
+        del self._targets[index]
+
+    def _connection(self):
+        # As SharedCertificateStore: one connection per (process, thread)
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            self._local.connection = sqlite3.connect(self.filename, timeout=5)
+            self._local.connection.execute('PRAGMA journal_mode=WAL')
+            self._local.pid = pid
+
+        return self._local.connection
+
+
+def _log_write_failure(future):
+    if future.exception() is not None:
+        LOG.warning('Failed to write to the expiry index: {!r}'.format(
+            future.exception()))
+
+
+def format_timestamp(timestamp):
+    """
+    Return POSIX `timestamp` as eg '2018-11-28T12:00:00Z'.
+    """
+    return str(utcdatetime.utcdatetime.from_datetime(
+        datetime.datetime.fromtimestamp(int(timestamp), utcdatetime.UTC)))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import socket
+import sys
+
+import OpenSSL
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.netutil import ThreadedResolver
+from tornado.tcpclient import TCPClient
+
+import metrics
+
+from handshake import CertificateChain, describe_handshake, get_ssl_context
+from starttls import negotiate
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = datetime.timedelta(seconds=2)
+
+READ_CHUNK_SIZE = 16 * 1024
+
+# Failures that say something about the remote host rather than about us
+NETWORK_ERRORS = (
+    socket.error, StreamClosedError, gen.TimeoutError, OpenSSL.SSL.Error)
+
+# The resolver is explicit so that name lookups never block the IOLoop, even
+# on Tornado versions whose default resolver calls getaddrinfo() inline.
+_RESOLVER = ThreadedResolver()
+
+
+def main(hostname):
+    logging.basicConfig(level=logging.DEBUG)
+    x509 = IOLoop.current().run_sync(
+        lambda: fetch_certificate(hostname, 443))
+
+    print(OpenSSL.crypto.dump_certificate(
+        OpenSSL.crypto.FILETYPE_PEM, x509).decode('ascii'))
+
+
+@gen.coroutine
+def fetch_certificate(hostname, port, **kwargs):
+    """
+    Non-blocking equivalent of `get_certificate.get_certificate`. Returns
+    the server's own certificate; see `fetch_certificate_chain`.
+    """
+    chain = yield fetch_certificate_chain(hostname, port, **kwargs)
+    raise gen.Return(chain[0])
+
+
+@gen.coroutine
+def fetch_certificate_chain(hostname, port, timeout=DEFAULT_TIMEOUT,
+                            resolver=None, shared_store=None,
+                            server_hostname=None, addresses=None,
+                            starttls=None):
+    """
+    Connect, handshake and return the CertificateChain the server sent (its
+    own certificate first, then any intermediates), entirely on the IOLoop.
+
+    The TLS handshake is driven through pyOpenSSL memory BIOs, so no thread
+    is tied up while waiting on the remote host and any number of
+    handshakes can be in flight at once.
+
+    `server_hostname` is the name sent for SNI, by default `hostname`. If
+    given, `addresses` is a list of (family, sockaddr) pairs to connect to
+    instead of resolving `hostname`.
+
+    `starttls` names the protocol (see `starttls.PROTOCOLS`) to speak to ask
+    the server to switch to TLS before the handshake, for servers such as
+    SMTP that start in plaintext.
+
+    If `shared_store` is given it is consulted before connecting and
+    updated afterwards, on its own threads.
+    """
+    if shared_store is not None:
+        chain = yield shared_store.get_async(hostname, port)
+        if chain is not None:
+            LOG.debug('Shared cache hit for {}:{}'.format(hostname, port))
+            raise gen.Return(chain)
+
+    LOG.info('Getting {} on port {}'.format(hostname, port))
+
+    try:
+        chain = yield _download_certificate_chain(
+            hostname, port, timeout, resolver or _RESOLVER,
+            server_hostname or hostname, addresses, starttls)
+    except NETWORK_ERRORS as e:
+        LOG.info('Failed to get {}:{}: {!r}'.format(hostname, port, e))
+        raise
+    except Exception as e:
+        LOG.exception(e)
+        raise
+
+    if shared_store is not None:
+        # Not waited for: the chain is ready, whether or not it's stored
+        IOLoop.current().add_future(
+            shared_store.put_async(hostname, port, chain),
+            _log_store_failure)
+
+    raise gen.Return(chain)
+
+
+@gen.coroutine
+def _download_certificate_chain(hostname, port, timeout, resolver,
+                                server_hostname, addrinfo=None, starttls=None):
+    deadline = IOLoop.current().time() + _total_seconds(timeout)
+
+    if addrinfo is None:
+        with metrics.timed('dns'):
+            addrinfo = yield gen.with_timeout(
+                deadline, resolver.resolve(hostname, port))
+
+    # TCPClient races the resolved addresses (IPv6 and IPv4) for us.
+    tcp_client = TCPClient(resolver=_ResolvedAddresses(addrinfo))
+
+    with metrics.timed('connect'):
+        connecting = tcp_client.connect(hostname, port)
+        try:
+            stream = yield gen.with_timeout(deadline, connecting)
+        except gen.TimeoutError:
+            _close_when_connected(connecting)
+            raise
+
+    try:
+        if starttls is not None:
+            with metrics.timed('starttls'):
+                yield gen.with_timeout(
+                    deadline, negotiate(starttls, stream, server_hostname),
+                    quiet_exceptions=(StreamClosedError,))
+
+        metrics.HANDSHAKES_IN_FLIGHT.inc()
+        try:
+            with metrics.timed('tls_handshake'):
+                chain = yield gen.with_timeout(
+                    deadline, _handshake(stream, server_hostname),
+                    quiet_exceptions=(StreamClosedError,))
+        finally:
+            metrics.HANDSHAKES_IN_FLIGHT.dec()
+    finally:
+        stream.close()
+
+    raise gen.Return(chain)
+
+
+@gen.coroutine
+def _handshake(stream, server_hostname):
+    start = IOLoop.current().time()
+
+    connection = OpenSSL.SSL.Connection(get_ssl_context(), None)
+    connection.set_tlsext_host_name(server_hostname.encode('ascii'))  # SNI
+    connection.set_connect_state()
+
+    while True:
+        try:
+            connection.do_handshake()
+        except OpenSSL.SSL.WantReadError:
+            yield _flush_outgoing(stream, connection)
+            data = yield stream.read_bytes(READ_CHUNK_SIZE, partial=True)
+            connection.bio_write(data)
+        else:
+            break
+
+    handshake = describe_handshake(
+        connection, IOLoop.current().time() - start)
+
+    # On the client side this includes the server's own certificate.
+    chain = connection.get_peer_cert_chain()
+    raise gen.Return(CertificateChain(
+        chain or [connection.get_peer_certificate()], handshake))
+
+
+@gen.coroutine
+def _flush_outgoing(stream, connection):
+    while True:
+        try:
+            data = connection.bio_read(READ_CHUNK_SIZE)
+        except OpenSSL.SSL.WantReadError:  # outgoing buffer is empty
+            return
+
+        yield stream.write(data)
+
+
+class _ResolvedAddresses(object):
+    """
+    Resolver for TCPClient that hands back addresses we already looked up.
+    """
+
+    def __init__(self, addrinfo):
+        self.addrinfo = addrinfo
+
+    def resolve(self, host, port, family=None):
+        future = Future()
+        future.set_result(self.addrinfo)
+        return future
+
+
+def _log_store_failure(future):
+    if future.exception() is not None:
+        LOG.warning('Failed to write to the shared store: {!r}'.format(
+            future.exception()))
+
+
+def _close_when_connected(connecting):
+    def close_stream(future):
+        if future.exception() is None:
+            future.result().close()
+
+    IOLoop.current().add_future(connecting, close_stream)
+
+
+def _total_seconds(timeout):
+    if isinstance(timeout, datetime.timedelta):
+        return timeout.total_seconds()
+    return timeout
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -5,11 +5,87 @@ import sys
 
 from collections import OrderedDict
 
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
 import OpenSSL
 from OpenSSL.crypto import FILETYPE_TEXT, FILETYPE_PEM, FILETYPE_ASN1
 
-from parse_certificate import (
-    parse_expiry, parse_serial_number, parse_subject_components)
+from certificate_fields import extract_fields
+from handshake import format_handshake
+from hex_format import format_hex_octets
+from parse_certificate import days_until
+from ttl_cache import TtlCache
+
+
+DER_OCTETS_PER_LINE = 18  # 54 characters
+
+JSON_FIELD_NAMES = ['serial_number', 'expiry_datetime']
+
+CHAIN_JSON_FIELD_NAMES = [
+    'subject_common_name',
+    'subject_organization',
+    'serial_number',
+    'expiry_datetime',
+    'sha256_fingerprint',
+]
+
+# CertificateRecords keyed by SHA256 fingerprint. The contents for a
+# fingerprint never change; the TTL only bounds memory.
+DECODED_CERTIFICATES = TtlCache(ttl=24 * 60 * 60, max_entries=10000)
+
+SUBJECT_FIELDS = [  # (field name, subject component key)
+    ('subject_common_name', 'common_name'),
+    ('subject_organization', 'organization'),
+    ('subject_organizational_unit', 'organizational_unit'),
+    ('subject_street', 'street'),
+    ('subject_locality', 'locality'),
+    ('subject_state', 'state'),
+    ('subject_postal_code', 'postal_code'),
+    ('subject_country', 'country'),
+    ('email_address', 'email_address'),
+]
+
+ISSUER_FIELDS = [  # (field name, issuer component key)
+    ('issuer_common_name', 'common_name'),
+    ('issuer_organization', 'organization'),
+]
+
+# Fields other than these and the name components are copied as they are
+# from extract_fields()
+SCALAR_FIELD_NAMES = (
+    ['serial_number', 'not_before_datetime', 'expiry_datetime',
+     'expiry_timestamp'] +
+    [field_name for field_name, _ in SUBJECT_FIELDS] +
+    [field_name for field_name, _ in ISSUER_FIELDS] +
+    ['subject_alt_names', 'public_key_type', 'public_key_bits',
+     'extensions', 'sha1_fingerprint', 'sha256_fingerprint'])
+
+STANDARD_FIELDS = OrderedDict([  # field name -> label, in display order
+    ('serial_number', 'Serial number'),
+    ('not_before_datetime', 'Valid from'),
+    ('expiry_datetime', 'Expiry'),
+    ('expiry_days_remaining', 'Days until expiry'),
+    ('subject_common_name', 'Common name'),
+    ('subject_organization', 'Organization'),
+    ('subject_organizational_unit', 'Organizational unit'),
+    ('subject_street', 'Street'),
+    ('subject_locality', 'Locality'),
+    ('subject_state', 'State or province'),
+    ('subject_postal_code', 'Postal code'),
+    ('subject_country', 'Country'),
+    ('email_address', 'Email address'),
+    ('subject_alt_names', 'Subject alternative names'),
+    ('issuer_common_name', 'Issuer'),
+    ('issuer_organization', 'Issuer organization'),
+    ('public_key_type', 'Key type'),
+    ('public_key_bits', 'Key size (bits)'),
+    ('extensions', 'Extensions'),
+    ('sha1_fingerprint', 'SHA1 Fingerprint'),
+    ('sha256_fingerprint', 'SHA256 Fingerprint'),
+])
 
 
 def main(x509_pem_filename):
@@ -21,65 +97,205 @@ def main(x509_pem_filename):
 
 
 def format_response(hostname, port, x509):
-    expiry_datetime = parse_expiry(x509)
-    subject_components = parse_subject_components(x509)
-
-    FIELDS = OrderedDict([
-        ('serial_number', parse_serial_number(x509)),
-        ('expiry_datetime', str(expiry_datetime)),
-        ('subject_common_name', subject_components.get('common_name')),
-        ('subject_organization', subject_components.get('organization')),
-
-        ('subject_organizational_unit',
-         subject_components.get('organizational_unit')),
-
-        ('subject_street', subject_components.get('street')),
-        ('subject_locality', subject_components.get('locality')),
-        ('subject_state', subject_components.get('state')),
-        ('subject_postal_code', subject_components.get('postal_code')),
-        ('subject_country', subject_components.get('country')),
-        ('email_address', subject_components.get('email_address')),
-
-        ('sha1_fingerprint', get_fingerprint(x509, 'sha1')),
-        ('sha256_fingerprint', get_fingerprint(x509, 'sha256')),
-
-        #  ('expiry_days_remaining', days_remaining),
-        ('certificate.txt', get_certificate_text_as_utf8(x509)),
-        ('certificate.pem', get_certificate_pem_as_utf8(x509)),
-        ('certificate.der.txt', get_certificate_asn1_as_utf8(x509)),
-        ('certificate.der', get_certificate_asn1_as_binary(x509)),
+    """
+    Return the response for `x509` as a mapping. `cert` is the certificate's
+    (shared, cached) CertificateRecord; the `json_version` string is
+    computed on first access.
+    """
+    cert = _format_certificate_cached(x509)
+
+    response = LazyFields()
+    response['request'] = OrderedDict([
+        ('hostname', hostname),
+        ('port', port),
     ])
-
-    json_field_names = ['serial_number', 'expiry_datetime']
-    json_version = OrderedDict([(k, FIELDS[k]) for k in json_field_names])
-
-    return OrderedDict([
-        ('request', OrderedDict([
-            ('hostname', hostname),
-            ('port', port),
-        ])),
-
-        ('cert', FIELDS),
-
-        ('standard_fields', OrderedDict([
-            ('serial_number', 'Serial number'),
-            ('expiry_datetime', 'Expiry'),
-            ('subject_common_name', 'Common name'),
-            ('subject_organization', 'Organization'),
-            ('subject_organizational_unit', 'Organizational unit'),
-            ('subject_street', 'Street'),
-            ('subject_locality', 'Locality'),
-            ('subject_state', 'State or province'),
-            ('subject_postal_code', 'Postal code'),
-            ('subject_country', 'Country'),
-            ('email_address', 'Email address'),
-            ('sha1_fingerprint', 'SHA1 Fingerprint'),
-            ('sha256_fingerprint', 'SHA256 Fingerprint'),
-        ])),
-
-        ('json_version', json.dumps(json_version, indent=4)),
+    response['cert'] = cert
+    response['standard_fields'] = STANDARD_FIELDS
+    response.add('json_version', lambda: json.dumps(
+        OrderedDict([(k, cert[k]) for k in JSON_FIELD_NAMES]), indent=4))
+
+    return response
+
+
+def format_certificate(x509):
+    """
+    Return a CertificateRecord of every field and representation of `x509`.
+
+    Fields are read from the DER encoding by extract_fields(); the text
+    dump is only made if `certificate.txt` is read from the record.
+    """
+    der = get_certificate_asn1_as_binary(x509)
+    fields = extract_fields(der)
+
+    for prefix, name_fields in [('subject', SUBJECT_FIELDS),
+                                ('issuer', ISSUER_FIELDS)]:
+        components = fields.pop(prefix)
+        for field_name, component_name in name_fields:
+            fields[field_name] = components[component_name]
+
+    return CertificateRecord(
+        der, *[fields[field_name] for field_name in SCALAR_FIELD_NAMES])
+
+
+def format_chain(hostname, port, chain):
+    """
+    Return the response for the list of certificates a server sent in one
+    handshake, including the negotiated protocol and cipher if `chain` is a
+    CertificateChain that has them.
+    """
+    certs = [_format_certificate_cached(x509) for x509 in chain]
+
+    response = LazyFields()
+    response['request'] = OrderedDict([
+        ('hostname', hostname),
+        ('port', port),
+    ])
+    response['chain'] = certs
+    response.add('chain.pem', lambda: ''.join(
+        cert['certificate.pem'] for cert in certs))
+    response.add('json_data', lambda: _chain_json_data(
+        response['request'], certs, getattr(chain, 'handshake', None)))
+    response.add('json_version', lambda: json.dumps(
+        response['json_data'], indent=4))
+
+    return response
+
+
+def _chain_json_data(request, certs, handshake):
+    data = OrderedDict([
+        ('request', request),
+        ('chain', [OrderedDict([(k, cert[k]) for k in CHAIN_JSON_FIELD_NAMES])
+                   for cert in certs]),
     ])
 
+    if handshake is not None:
+        data['handshake'] = format_handshake(handshake)
+
+    return data
+
+
+def _format_certificate_cached(x509):
+    # Certificates are decoded once per fingerprint and shared between
+    # responses, as many hosts serve the same certificates and intermediates
+    fingerprint = x509.digest('sha256')
+
+    cert = DECODED_CERTIFICATES.get(fingerprint)
+    if cert is None:
+        cert = format_certificate(x509)
+        DECODED_CERTIFICATES.put(fingerprint, cert)
+
+    return cert
+
+
+class CertificateRecord(object):
+    """
+    Immutable, compact summary of one certificate: its DER encoding and
+    scalar fields. The larger representations (`certificate.txt` etc.) are
+    derived from the DER on access rather than stored, as is
+    `expiry_days_remaining`, which depends on the date.
+
+    Fields read like a mapping, `record['serial_number']`, as the templates
+    and handlers expect. Records compare and hash by DER and pickle small.
+    """
+
+    __slots__ = ('der',) + tuple(SCALAR_FIELD_NAMES)
+
+    def __init__(self, der, *values):
+        object.__setattr__(self, 'der', der)
+        for name, value in zip(SCALAR_FIELD_NAMES, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CertificateRecord is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('CertificateRecord is immutable')
+
+    def __getitem__(self, key):
+        if key in REPRESENTATIONS:
+            return REPRESENTATIONS[key](self.der)
+
+        if key in TIME_DEPENDENT_FIELDS:
+            return TIME_DEPENDENT_FIELDS[key](self)
+
+        if key not in SCALAR_FIELD_NAMES:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return (key in SCALAR_FIELD_NAMES or key in TIME_DEPENDENT_FIELDS or
+                key in REPRESENTATIONS)
+
+    def __iter__(self):
+        return iter(SCALAR_FIELD_NAMES + list(TIME_DEPENDENT_FIELDS) +
+                    list(REPRESENTATIONS))
+
+    def keys(self):
+        return list(self)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        return isinstance(other, CertificateRecord) and self.der == other.der
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.der)
+
+    def __reduce__(self):
+        return (CertificateRecord, (self.der,) + tuple(
+            getattr(self, name) for name in SCALAR_FIELD_NAMES))
+
+    def __repr__(self):
+        return '<CertificateRecord {}>'.format(self.sha256_fingerprint)
+
+
+class LazyFields(MutableMapping):
+    """
+    Ordered mapping whose values can be given as zero-argument callables
+    with `add()`. Each callable is run the first time its key is read and
+    the result is kept.
+    """
+
+    def __init__(self):
+        self._getters = OrderedDict()
+        self._values = {}
+
+    def add(self, key, getter):
+        self._getters[key] = getter
+        self._values.pop(key, None)
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            value = self._values[key] = self._getters[key]()
+            return value
+
+    def __setitem__(self, key, value):
+        self._getters[key] = None
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        del self._getters[key]
+        self._values.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._getters)
+
+    def __len__(self):
+        return len(self._getters)
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__, list(self))
+
 
 def get_certificate_text_as_utf8(x509):
     string = OpenSSL.crypto.dump_certificate(
@@ -98,21 +314,36 @@ def get_certificate_asn1_as_binary(x509):
 
 
 def get_certificate_asn1_as_utf8(x509):
-    octets = bytearray(get_certificate_asn1_as_binary(x509))
-    octet_strings = ['{0:02x}'.format(octet) for octet in octets]
+    return format_der_as_utf8(get_certificate_asn1_as_binary(x509))
 
-    long_line = ':'.join(octet_strings)
 
-    return split_every_n(long_line, 54)
+def format_der_as_utf8(der):
+    return format_hex_octets(der, DER_OCTETS_PER_LINE)
 
 
 def get_fingerprint(x509, digest_name):
     return x509.digest(digest_name).decode('ascii').lower()  # eg '64:2d:ea...'
 
 
-def split_every_n(string, n):
-    return '\n'.join(
-        [string[i:i + n] for i in range(0, len(string), n)])
+def _load_der(der):
+    return OpenSSL.crypto.load_certificate(FILETYPE_ASN1, der)
+
+
+REPRESENTATIONS = OrderedDict([  # name -> function of the DER bytes
+    ('certificate.txt', lambda der: get_certificate_text_as_utf8(
+        _load_der(der))),
+    ('certificate.pem', lambda der: get_certificate_pem_as_utf8(
+        _load_der(der))),
+    ('certificate.der.txt', lambda der: format_der_as_utf8(der)),
+    ('certificate.der', lambda der: der),
+])
+
+
+# name -> function of the record, for fields that change with the date and
+# so can't be stored in it or cached by fingerprint
+TIME_DEPENDENT_FIELDS = OrderedDict([
+    ('expiry_days_remaining', lambda cert: days_until(cert.expiry_timestamp)),
+])
 
 
 if __name__ == '__main__':
@@ -3,14 +3,22 @@
 from __future__ import unicode_literals
 
 import logging
+import select
 import socket
 import sys
+import time
 
 import OpenSSL
 
+import metrics
+
+from handshake import CertificateChain, describe_handshake, get_ssl_context
+
 
 LOG = logging.getLogger(__name__)
 
+TIMEOUT = 2  # seconds, to connect and again to handshake
+
 
 def main(hostname):
     logging.basicConfig(level=logging.DEBUG)
@@ -29,40 +37,110 @@ def main(hostname):
         print('Wrote out {}'.format(filename))
 
 
-def get_certificate(hostname, port):
+def get_certificate(hostname, port, shared_store=None):
+    return get_certificate_chain(hostname, port, shared_store)[0]
+
+
+def get_certificate_chain(hostname, port, shared_store=None,
+                          addresses=None, server_hostname=None):
+    if shared_store is not None:
+        chain = shared_store.get(hostname, port)
+        if chain is not None:
+            LOG.debug('Shared cache hit for {}:{}'.format(hostname, port))
+            return chain
+
     LOG.info('Getting {} on port {}'.format(hostname, port))
 
     try:
-        x509 = download_certificate_for(hostname, port)
+        chain = download_certificate_chain_for(
+            hostname, port, addresses, server_hostname)
+    except (socket.error, OpenSSL.SSL.Error) as e:
+        LOG.info('Failed to get {}:{}: {!r}'.format(hostname, port, e))
+        raise
     except Exception as e:
         LOG.exception(e)
         raise
 
-    return x509
+    if shared_store is not None:
+        shared_store.put(hostname, port, chain)
 
+    return chain
 
-def download_certificate_for(hostname, port):
-    def some_callback(connection, cert, error_number, error_depth, ok):
-        LOG.debug('connection: {}, cert: {}, error_number: {}, '
-                  'error_depth: {} ok: {}'.format(
-                      connection, cert, error_number, error_depth, ok))
 
-    ssl_context = OpenSSL.SSL.Context(OpenSSL.SSL.TLSv1_METHOD)
-    ssl_context.set_verify(OpenSSL.SSL.VERIFY_NONE, callback=some_callback)
+def download_certificate_for(hostname, port, addresses=None):
+    return download_certificate_chain_for(hostname, port, addresses)[0]
 
-    s = socket.socket()
-    s.settimeout(2)
 
-    connection = OpenSSL.SSL.Connection(ssl_context, s)
-    connection.set_tlsext_host_name(hostname.encode('ascii'))  # for SNI
-    connection.connect((hostname, port))
+def download_certificate_chain_for(hostname, port, addresses=None,
+                                   server_hostname=None, timeout=TIMEOUT):
+    """
+    If given, `addresses` is a list of (family, sockaddr) pairs as returned
+    by a Tornado resolver; each is tried in turn instead of looking up
+    `hostname` in this thread. `server_hostname` is the name sent for SNI,
+    by default `hostname`. Connecting and the handshake may each take up to
+    `timeout` seconds, after which socket.timeout is raised.
 
-    connection.setblocking(1)
+    Times the same phases as fetch_certificate, except that a lookup done
+    here, without `addresses`, is counted as part of connecting.
+    """
+    with metrics.timed('connect'):
+        s = _connect(
+            addresses or [(socket.AF_INET, (hostname, port))], timeout)
 
-    connection.do_handshake()
-    cert = connection.get_peer_certificate()  # Returns OpenSSL.crypto.X509
-
-    return cert
+    try:
+        start = time.time()
+        connection = OpenSSL.SSL.Connection(get_ssl_context(), s)
+        connection.set_tlsext_host_name(  # for SNI
+            (server_hostname or hostname).encode('ascii'))
+        connection.set_connect_state()
+
+        with metrics.timed('tls_handshake'):
+            _do_handshake(connection, s, timeout)
+        handshake = describe_handshake(connection, time.time() - start)
+
+        # List of OpenSSL.crypto.X509, starting with the server's own
+        chain = connection.get_peer_cert_chain()
+        return CertificateChain(
+            chain or [connection.get_peer_certificate()], handshake)
+    finally:
+        s.close()
+
+
+def _connect(addresses, timeout=TIMEOUT):
+    error = None
+    for family, sockaddr in addresses:
+        s = socket.socket(family)
+        s.settimeout(timeout)
+        try:
+            s.connect(sockaddr)
+        except socket.error as e:
+            s.close()
+            error = e
+        else:
+            return s
+
+    raise error
+
+
+def _do_handshake(connection, s, timeout):
+    """
+    OpenSSL reads and writes the socket's file descriptor itself, which
+    `settimeout` left non-blocking: wait for it with select() instead, up to
+    `timeout` seconds in all.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return connection.do_handshake()
+        except OpenSSL.SSL.WantReadError:
+            readers, writers = [s], []
+        except OpenSSL.SSL.WantWriteError:
+            readers, writers = [], [s]
+
+        remaining = deadline - time.time()
+        if remaining <= 0 or \
+                not any(select.select(readers, writers, [], remaining)[:2]):
+            raise socket.timeout('TLS handshake timed out')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,67 @@
+from __future__ import unicode_literals
+
+import logging
+
+from collections import OrderedDict, namedtuple
+
+import OpenSSL
+
+
+LOG = logging.getLogger(__name__)
+
+# (negotiated protocol eg 'TLSv1.3', cipher name, handshake time in seconds)
+Handshake = namedtuple('Handshake', 'protocol cipher seconds')
+
+_CONTEXTS = {}
+
+
+class CertificateChain(list):
+    """
+    The certificates a server sent, its own first, plus the `Handshake`
+    they were received in. `handshake` is None for chains that were loaded
+    from a store rather than fetched.
+    """
+
+    def __init__(self, certificates, handshake=None):
+        super(CertificateChain, self).__init__(certificates)
+        self.handshake = handshake
+
+
+def get_ssl_context(method=OpenSSL.SSL.SSLv23_METHOD):
+    """
+    Return the shared client Context for `method`, creating it on first use.
+
+    A Context is safe to share between connections and threads once
+    configured, so this is done once rather than per lookup. The default
+    method negotiates the highest version both sides support, up to
+    TLS 1.3 where OpenSSL has it.
+    """
+    try:
+        return _CONTEXTS[method]
+    except KeyError:
+        ssl_context = OpenSSL.SSL.Context(method)
+        ssl_context.set_verify(
+            OpenSSL.SSL.VERIFY_NONE, callback=_verify_callback)
+        return _CONTEXTS.setdefault(method, ssl_context)
+
+
+def describe_handshake(connection, seconds):
+    return Handshake(
+        connection.get_protocol_version_name(),
+        connection.get_cipher_name(),
+        seconds)
+
+
+def format_handshake(handshake):
+    return OrderedDict([
+        ('tls_version', handshake.protocol),
+        ('cipher', handshake.cipher),
+        ('handshake_ms', int(round(handshake.seconds * 1000))),
+    ])
+
+
+def _verify_callback(connection, cert, error_number, error_depth, ok):
+    LOG.debug('connection: {}, cert: {}, error_number: {}, '
+              'error_depth: {} ok: {}'.format(
+                  connection, cert, error_number, error_depth, ok))
+    return ok
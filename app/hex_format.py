@@ -0,0 +1,51 @@
+from __future__ import unicode_literals
+
+import binascii
+
+
+def format_hex_octets(data, octets_per_line=None):
+    """
+    Return bytes-like `data` as lowercase colon-separated hex, eg
+    'de:ad:be:ef', optionally wrapped every `octets_per_line` octets.
+    """
+    return colon_separate_hex(binascii.hexlify(data), octets_per_line)
+
+
+def colon_separate_hex(hex_digits, octets_per_line=None):
+    """
+    Insert colons between each pair of ASCII `hex_digits` (bytes), and a
+    newline after every `octets_per_line` octets' trailing colon.
+
+    The output is assembled with a handful of strided slice assignments into
+    one preallocated buffer rather than building a string per octet.
+    """
+    count = len(hex_digits) // 2
+    if count == 0:
+        return ''
+
+    per_line = min(octets_per_line or count, count)
+    lines = -(-count // per_line)
+    stride = 3 * per_line + 1  # 'hh:' per octet, plus a newline
+
+    # Pad to a whole number of lines so every column slice has `lines` items
+    hex_digits = hex_digits + b'0' * (2 * (lines * per_line - count))
+    high, low = hex_digits[0::2], hex_digits[1::2]
+
+    out = bytearray(b':' * (lines * stride))
+    out[stride - 1::stride] = b'\n' * lines
+
+    if lines <= per_line:
+        for line in range(lines):
+            start, end = line * stride, line * stride + 3 * per_line
+            octets = slice(line * per_line, (line + 1) * per_line)
+            out[start:end:3] = high[octets]
+            out[start + 1:end:3] = low[octets]
+    else:
+        for column in range(per_line):
+            out[3 * column::stride] = high[column::per_line]
+            out[3 * column + 1::stride] = low[column::per_line]
+
+    last_line, last_column = divmod(count - 1, per_line)
+    end = last_line * stride + 3 * last_column + 2
+
+    return out[:end].decode('ascii')
@@ -1,28 +1,107 @@
 #!/usr/bin/env python
 
+import argparse
+import datetime
+import errno
 import json
 import logging
+import os
+import re
+import signal
+import socket
+import sys
 import time
 
 from collections import OrderedDict
 from os.path import dirname, join as pjoin
 
+import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
 import tornado.web
 
 from concurrent.futures import ThreadPoolExecutor
 from tornado import gen
 from tornado.concurrent import run_on_executor
+from tornado.iostream import StreamClosedError
+from tornado.locks import Semaphore
 from tornado.web import HTTPError
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 import OpenSSL
 
-from get_certificate import get_certificate
-from format_response import format_response
-
-HOSTNAME_REGEX = '[a-zA-Z0-9.\-_]+'  # ish...
+import metrics
+
+from admission import (
+    DEFAULT_MAX_CONCURRENT, DEFAULT_MAX_PER_CLIENT, DEFAULT_MAX_QUEUED,
+    AdmissionController)
+from certificate_cache import (
+    CertificateCache, DEFAULT_MAX_ENTRIES, DEFAULT_STALE_TTL, DEFAULT_TTL)
+from circuit_breaker import (
+    DEFAULT_BACKOFF, DEFAULT_MAX_BACKOFF, CircuitBreaker)
+from expiry_index import ExpiryIndex, format_timestamp
+from get_certificate import get_certificate_chain
+from parse_certificate import SECONDS_PER_DAY, days_until
+from refresh_ahead import (
+    DEFAULT_MAX_CONCURRENT as DEFAULT_REFRESH_MAX_CONCURRENT,
+    DEFAULT_WINDOW as DEFAULT_REFRESH_WINDOW, RefreshAheadScheduler)
+from handshake import format_handshake
+from resolver import (
+    DEFAULT_NEGATIVE_TTL as DEFAULT_DNS_NEGATIVE_TTL,
+    DEFAULT_TTL as DEFAULT_DNS_TTL, CachingResolver)
+from serialize import (
+    JSON_FORMATS, certificate_body, encode_json)
+from shared_certificate_store import SharedCertificateStore
+from starttls import select_protocol
+from targets import HOSTNAME_REGEX, parse_target
+from ttl_cache import TtlCache
+from fetch_certificate import NETWORK_ERRORS, fetch_certificate_chain
+from format_response import JSON_FIELD_NAMES, format_chain, format_response
+
+TEMPLATE_DIR = pjoin(dirname(__file__), 'templates')
+TEMPLATE_NAMES = ['dump.html']
+
+CHAIN_FIELDS = ('chain', 'chain.pem')
+
+# Representations including `expiry_days_remaining`
+DATE_DEPENDENT_VARIANTS = ('html', 'expiry-days-remaining')
+
+# Details of the connection rather than the certificate, so these aren't
+# cached by clients
+HANDSHAKE_FIELD_NAMES = ('tls_version', 'cipher', 'handshake_ms')
+
+DOWNLOADS = {  # field name -> (content type, filename pattern)
+    'certificate.txt': ('text/plain', 'certificate_{}.txt'),
+    'certificate.pem': ('text/plain', 'certificate_{}.pem'),
+    'certificate.der': ('application/octet-stream', 'certificate_{}.der'),
+}
+
+DEFAULT_EXPIRING_WITHIN = '30d'
+DURATION_UNITS = {
+    '': 1, 's': 1, 'm': 60, 'h': 60 * 60, 'd': SECONDS_PER_DAY,
+    'w': 7 * SECONDS_PER_DAY}
+
+BULK_MAX_TARGETS = 10000
+BULK_MAX_CONCURRENCY = 50
+BULK_TIMEOUT = 5  # seconds, per target
+
+FANOUT_MAX_TARGETS = 64
+FANOUT_FIELD_NAMES = (
+    'sha256_fingerprint', 'subject_common_name', 'subject_alt_names',
+    'expiry_datetime')
+
+MAX_WORKER_RESTARTS = 100
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+SHUTDOWN_GRACE_PERIOD = 5  # seconds; longer than a certificate fetch
+DRAIN_POLL_INTERVAL = 0.1  # seconds
+
+# How long clients and proxies may reuse a response without revalidating
+DEFAULT_CACHE_CONTROL_MAX_AGE = 60  # seconds
+
+FETCH_MODE_ASYNC = 'async'
+FETCH_MODE_BLOCKING = 'blocking'
 
 
 def load_example_x509():
@@ -33,39 +112,241 @@ def load_example_x509():
             OpenSSL.crypto.FILETYPE_PEM, f.read())
 
 
-class RenderToTemplateMixin(object):
-    ENV = Environment(loader=FileSystemLoader(
-        [pjoin(dirname(__file__), 'templates')]))
+def make_template_environment(auto_reload=False, bytecode_cache_dir=None):
+    """
+    With `auto_reload` off, templates are never re-checked against the files
+    on disk. `bytecode_cache_dir`, if given, keeps compiled templates between
+    restarts and lets forked workers share them.
+    """
+    bytecode_cache = None
+    if bytecode_cache_dir is not None:
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+
+    return Environment(
+        loader=FileSystemLoader([TEMPLATE_DIR]),
+        auto_reload=auto_reload,
+        bytecode_cache=bytecode_cache)
+
+
+def load_templates(env):
+    """
+    Compile every template up front and return {template name: Template}.
+    """
+    return dict((name, env.get_template(name)) for name in TEMPLATE_NAMES)
 
+
+class RenderToTemplateMixin(object):
     def render_to_template(self, template_name, args_dict):
-        template = self.ENV.get_template(template_name)
+        if self.settings.get('debug'):  # pick up edits to the templates
+            template = self.settings['template_environment'].get_template(
+                template_name)
+        else:
+            template = self.settings['templates'][template_name]
+
         return template.render(args_dict)
 
 
+class InFlightRequestsMixin(object):
+    """
+    Counts requests in progress in `metrics.REQUESTS_IN_FLIGHT`, so that a
+    worker shutting down can wait for them to finish.
+    """
+
+    def prepare(self):
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        self._in_flight = True
+        return super(InFlightRequestsMixin, self).prepare()
+
+    def on_finish(self):
+        # Requests rejected before prepare() were never counted
+        if getattr(self, '_in_flight', False):
+            metrics.REQUESTS_IN_FLIGHT.dec()
+            self._in_flight = False
+        super(InFlightRequestsMixin, self).on_finish()
+
+
 class JsonErrorHandlerMixin(object):
     def write_error(self, status_code, exc_info, **kwargs):
         exception_type, exception, traceback = exc_info
 
-        if exception_type is HTTPError:
+        if isinstance(exception, HTTPError):
             reason = exception.reason
         else:
             reason = repr(exception)
 
+        retry_after = getattr(exception, 'retry_after', None)
+        if retry_after is not None:
+            self.set_header('Retry-After', retry_after)
+
         self.set_status(status_code)
         self.set_header('content-type', 'application/json')
-        self.write(json.dumps(OrderedDict(
+        self.write(encode_json(OrderedDict(
             [
                 ('error', reason),
                 ('http_status', status_code),
             ]),
-            indent=4))
+            pretty=self.pretty_json()))
 
+    def pretty_json(self):
+        return self.get_query_argument('format', 'pretty') != 'compact'
 
-class DumpCertHandler(JsonErrorHandlerMixin, tornado.web.RequestHandler,
-                      RenderToTemplateMixin):
+
+class CertificateFetcherMixin(object):
+    """
+    Look up certificate chains through the application's caches, fetching
+    with the configured `fetch_mode` on a miss.
+    """
 
     executor = ThreadPoolExecutor(max_workers=2)
 
+    use_shared_store = True
+
+    @gen.coroutine
+    def _get_certificate_chain(self, hostname, port, server_hostname=None,
+                               addresses=None, starttls=None):
+        """
+        `server_hostname` is the name sent for SNI, by default `hostname`.
+        `addresses`, if given, are connected to instead of resolving
+        `hostname` when the chain isn't cached. `starttls` is the protocol
+        to upgrade the connection with, by default the port's own (see
+        `starttls.select_protocol`).
+
+        Counts against the requesting client's share whether or not the
+        download is shared with other callers.
+        """
+        admission = self.settings['admission_controller']
+        with admission.admit(self._client_key()):
+            chain = yield self._get_cached_certificate_chain(
+                hostname, port, server_hostname, addresses, starttls)
+        raise gen.Return(chain)
+
+    def _get_cached_certificate_chain(self, hostname, port,
+                                      server_hostname=None, addresses=None,
+                                      starttls=None):
+        """
+        As `_get_certificate_chain`, for handlers that have already admitted
+        the request.
+        """
+        cache = self.settings['certificate_cache']
+        server_hostname = server_hostname or hostname
+        starttls = select_protocol(port, starttls)
+
+        return cache.get_or_fetch(
+            (hostname, port, server_hostname, starttls),
+            lambda: self._download_unless_failing(
+                hostname, port, server_hostname, addresses, starttls))
+
+    @gen.coroutine
+    def _download_unless_failing(self, hostname, port, server_hostname=None,
+                                 addresses=None, starttls=None):
+        # A name or protocol the host rejects mustn't fail the others fast
+        target = (hostname, port, server_hostname or hostname, starttls)
+        breaker = self.settings['circuit_breaker']
+        breaker.check(target)
+
+        admission = self.settings['admission_controller']
+        with (yield admission.acquire()):
+            try:
+                chain = yield self._download_certificate_chain(
+                    hostname, port, server_hostname, addresses, starttls)
+            except NETWORK_ERRORS as e:
+                raise breaker.record_failure(target, e)
+
+        breaker.record_success(target)
+        if _is_default_lookup(hostname, port, server_hostname, starttls):
+            self.settings['expiry_index'].record(
+                hostname, port,
+                format_response(hostname, port, chain[0])['cert'])
+        raise gen.Return(chain)
+
+    def _client_key(self):
+        # With xheaders on, this is nginx's X-Real-IP
+        return self.request.remote_ip
+
+    def _download_certificate_chain(self, hostname, port,
+                                    server_hostname=None, addresses=None,
+                                    starttls=None):
+        fetch_mode = self.settings.get('fetch_mode', FETCH_MODE_ASYNC)
+        resolver = self.settings['resolver']
+
+        # The shared store holds one chain per (hostname, port), for the
+        # default name and protocol, from whichever address it resolved to
+        if self.use_shared_store and addresses is None and \
+                _is_default_lookup(hostname, port, server_hostname, starttls):
+            shared_store = self.settings.get('shared_certificate_store')
+        else:
+            shared_store = None
+
+        # The blocking fetch only speaks TLS from the first byte
+        if fetch_mode == FETCH_MODE_BLOCKING and starttls is None:
+            return self._resolve_then_download_certificate_chain(
+                hostname, port, shared_store, resolver, server_hostname,
+                addresses)
+
+        return fetch_certificate_chain(
+            hostname, port, resolver=resolver, shared_store=shared_store,
+            server_hostname=server_hostname, addresses=addresses,
+            starttls=starttls)
+
+    @gen.coroutine
+    def _resolve_then_download_certificate_chain(self, hostname, port,
+                                                 shared_store, resolver,
+                                                 server_hostname=None,
+                                                 addresses=None):
+        # Resolve on the IOLoop, through the cache, so the executor's few
+        # threads only ever wait on the remote host itself.
+        if addresses is None:
+            with metrics.timed('dns'):
+                addresses = yield resolver.resolve(hostname, port)
+
+        metrics.EXECUTOR_QUEUE_DEPTH.inc()
+        chain = yield self._blocking_download_certificate_chain(
+            hostname, port, shared_store, addresses, server_hostname)
+        raise gen.Return(chain)
+
+    @run_on_executor
+    def _blocking_download_certificate_chain(self, hostname, port,
+                                             shared_store, addresses,
+                                             server_hostname=None):
+        metrics.EXECUTOR_QUEUE_DEPTH.dec()  # no longer waiting for a thread
+        return get_certificate_chain(
+            hostname, port, shared_store=shared_store, addresses=addresses,
+            server_hostname=server_hostname)
+
+
+class BackgroundFetcher(CertificateFetcherMixin):
+    """
+    Fetches certificate chains outside of any request, for the refresh-ahead
+    scheduler. Shares the app's breaker, download slots and resolver.
+
+    Always makes a new handshake: the shared store's copy of a chain is no
+    fresher than the cache entry being refreshed, and lacks its handshake
+    details.
+    """
+
+    use_shared_store = False
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def fetch(self, key):
+        hostname, port, server_hostname, starttls = key
+        return self._download_unless_failing(
+            hostname, port, server_hostname, starttls=starttls)
+
+
+class DumpCertHandler(JsonErrorHandlerMixin, CertificateFetcherMixin,
+                      InFlightRequestsMixin, tornado.web.RequestHandler,
+                      RenderToTemplateMixin):
+
+    def prepare(self):
+        self.timings = metrics.RequestTimings()
+        return super(DumpCertHandler, self).prepare()
+
+    def on_finish(self):
+        self.timings.observe()
+        super(DumpCertHandler, self).on_finish()
+
     @gen.coroutine
     @tornado.web.removeslash
     def get(self, hostname, port=None, field=None):
@@ -77,12 +358,44 @@ class DumpCertHandler(JsonErrorHandlerMixin, tornado.web.RequestHandler,
 
         port = int(port) if port is not None else 443
 
-        x509 = yield self._blocking_download_certificate(hostname, port)
-        response_data = format_response(hostname, port, x509)
+        if self.get_query_argument('format', 'pretty') not in JSON_FORMATS:
+            raise HTTPError(
+                status_code=400,
+                reason='`format` must be one of: {}.'.format(
+                    ', '.join(JSON_FORMATS)))
+
+        starttls = self.get_query_argument('starttls', None)
+        try:
+            select_protocol(port, starttls)
+        except ValueError as e:
+            raise HTTPError(status_code=400, reason=str(e))
+
+        with self.timings.phase('fetch'):
+            chain = yield self._get_certificate_chain(
+                hostname, port, starttls=starttls)
+
+        if field in CHAIN_FIELDS:
+            with self.timings.phase('format_response'):
+                self._render_chain(field, format_chain(hostname, port, chain))
+            return
+
+        if field is not None and \
+                field.replace('-', '_') in HANDSHAKE_FIELD_NAMES:
+            self._render_handshake_field(field.replace('-', '_'), chain)
+            return
+
+        self._set_caching_headers(hostname, port, chain[0], field)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        with self.timings.phase('format_response'):
+            response_data = format_response(hostname, port, chain[0])
 
         if field is not None:
-            self._render_field(field, response_data['cert'],
-                               response_data['request']['hostname'])
+            with self.timings.phase('format_response'):
+                self._render_field(field, response_data['cert'],
+                                   response_data['request']['hostname'])
         else:
             self._render(response_data)
 
@@ -94,6 +407,47 @@ class DumpCertHandler(JsonErrorHandlerMixin, tornado.web.RequestHandler,
 
         return uri
 
+    def _set_caching_headers(self, hostname, port, x509, field):
+        """
+        Every representation of a certificate is fixed by its fingerprint,
+        so this is enough to answer `If-None-Match` without formatting it.
+        Those showing the days until expiry also change with the UTC date.
+        """
+        if field is not None:
+            variant = field
+        elif client_accepts_html(self.request.headers.get('Accept')):
+            variant = 'html'
+        elif self.pretty_json():
+            variant = 'json'
+        else:
+            variant = 'json-compact'
+
+        if variant.replace('_', '-') in DATE_DEPENDENT_VARIANTS:
+            variant = '{}-{}'.format(
+                variant, int(time.time() // SECONDS_PER_DAY))
+
+        if field is None:
+            self.set_header('Vary', 'Accept')
+
+        self.set_header('Etag', '"{}-{}"'.format(
+            self._get_fingerprint(hostname, port, x509), variant))
+        self.set_header('Cache-Control', 'public, max-age={}'.format(
+            self.settings.get('cache_control_max_age',
+                              DEFAULT_CACHE_CONTROL_MAX_AGE)))
+
+    def _get_fingerprint(self, hostname, port, x509):
+        memo = self.settings['fingerprint_memo']
+        memoized = memo.get((hostname, port))
+
+        # Only trust the memo while the host is serving the same object
+        if memoized is not None and memoized[0] is x509:
+            return memoized[1]
+
+        fingerprint = x509.digest('sha256').decode('ascii')
+        fingerprint = fingerprint.replace(':', '').lower()
+        memo.put((hostname, port), (x509, fingerprint))
+        return fingerprint
+
     def _render(self, response_data):
         response_data['uri'] = '{}://{}{}'.format(
             self.request.protocol,
@@ -101,48 +455,59 @@ class DumpCertHandler(JsonErrorHandlerMixin, tornado.web.RequestHandler,
             self.request.uri)
 
         if client_accepts_html(self.request.headers.get('Accept')):
+            with self.timings.phase('render'):
+                html = self.render_to_template('dump.html', response_data)
 
-            self.write(self.render_to_template('dump.html', response_data))
+            self.write(html)
 
         else:
             self.set_header('Content-Type', 'application/json')
-            json_string = response_data['json_version']
-            self.write(json_string)
+            with self.timings.phase('format_response'):
+                body = certificate_body(
+                    response_data['cert'], 'json', self.pretty_json())
+            self.write(body)
 
     def _render_field(self, field_name, cert, hostname):
-        special_renderers = {
-            'certificate.txt': (
-                self._render_as_download, cert['certificate.txt'],
-                'text/plain', 'certificate_{}.txt'.format(hostname)),
-
-            'certificate.pem': (
-                self._render_as_download, cert['certificate.pem'],
-                'text/plain', 'certificate_{}.pem'.format(hostname)),
-
-            'certificate.der': (
-                self._render_as_download, cert['certificate.der'],
-                'application/octet-stream',
-                'certificate_{}.der'.format(hostname))
-        }
-
         field_name = field_name.replace('-', '_')
 
-        if field_name in special_renderers:
+        if field_name in DOWNLOADS:
             logging.info(
                 'Using special renderer for `{}`'.format(field_name))
-            renderer_and_args = special_renderers[field_name]
+            content_type, filename = DOWNLOADS[field_name]
+            self._render_as_download(
+                certificate_body(cert, field_name), content_type,
+                filename.format(hostname))
 
         elif cert.get(field_name) is not None:  # Default: just send text
             logging.info(
                 'Rendering `{}` with default (text)'.format(field_name))
-            renderer_and_args = (self._render_as_text, cert[field_name])
+            self._render_as_text(certificate_body(cert, field_name))
 
         else:
             raise HTTPError(
                 status_code=404,
                 reason='No such property: `{}`.'.format(field_name))
 
-        renderer_and_args[0](*renderer_and_args[1:])
+    def _render_handshake_field(self, field_name, chain):
+        handshake = getattr(chain, 'handshake', None)
+        if handshake is None:  # eg loaded from the shared store
+            raise HTTPError(
+                status_code=404,
+                reason='No handshake details for this certificate.')
+
+        value = format_handshake(handshake)[field_name]
+        self._render_as_text('{}'.format(value))
+
+    def _render_chain(self, field_name, chain_data):
+        if field_name == 'chain.pem':
+            self._render_as_download(
+                chain_data['chain.pem'], 'text/plain',
+                'certificate_chain_{}.pem'.format(
+                    chain_data['request']['hostname']))
+        else:
+            self.set_header('Content-Type', 'application/json')
+            self.write(encode_json(
+                chain_data['json_data'], pretty=self.pretty_json()))
 
     def _render_as_text(self, string):
         self.set_header('Content-Type', 'text/plain')
@@ -155,10 +520,6 @@ class DumpCertHandler(JsonErrorHandlerMixin, tornado.web.RequestHandler,
             'attachment;filename="{}"'.format(filename))
         self.write(obj)
 
-    @run_on_executor
-    def _blocking_download_certificate(self, hostname, port):
-        return get_certificate(hostname, port)
-
 
 class TestDumpCertHandler(DumpCertHandler):
     def get(self):
@@ -167,7 +528,361 @@ class TestDumpCertHandler(DumpCertHandler):
         self._render(format_response('example.com', 443, x509))
 
 
-class TestSleepHandler(tornado.web.RequestHandler):
+class CacheStatsHandler(InFlightRequestsMixin, tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(
+            self.settings['certificate_cache'].stats(), indent=4))
+
+
+class ExpiringHandler(JsonErrorHandlerMixin, InFlightRequestsMixin,
+                      tornado.web.RequestHandler):
+    """
+    Certificates seen by this service that expire within `within`, eg
+    `?within=30d` (units: s, m, h, d or w), soonest first. Expired ones are
+    included. Answered from the expiry index, without fetching anything.
+
+    The index only survives a restart, and is only shared between workers,
+    if SSLDUMP_EXPIRY_INDEX names a file for it.
+    """
+
+    @gen.coroutine
+    def get(self):
+        within = self.get_query_argument('within', DEFAULT_EXPIRING_WITHIN)
+        try:
+            seconds = parse_duration(within)
+        except ValueError as e:
+            raise HTTPError(status_code=400, reason=str(e))
+
+        expiry_index = self.settings['expiry_index']
+        yield expiry_index.sync_if_due()
+
+        now = time.time()
+        entries = expiry_index.expiring_within(seconds, now)
+
+        self.set_header('Content-Type', 'application/json')
+        self.write(encode_json(OrderedDict([
+            ('within', within),
+            ('count', len(entries)),
+            ('certificates', [OrderedDict([
+                ('hostname', entry.hostname),
+                ('port', entry.port),
+                ('expiry_datetime', format_timestamp(entry.expiry_timestamp)),
+                ('expiry_days_remaining',
+                 days_until(entry.expiry_timestamp, now)),
+                ('sha256_fingerprint', entry.sha256_fingerprint),
+                ('last_seen', format_timestamp(entry.last_seen)),
+            ]) for entry in entries]),
+        ]), pretty=self.pretty_json()))
+
+
+class BulkLookupHandler(JsonErrorHandlerMixin, CertificateFetcherMixin,
+                        InFlightRequestsMixin, tornado.web.RequestHandler):
+    """
+    POST a JSON list of `hostname[:port]` targets, or an object:
+
+        {"targets": [...], "concurrency": 20, "timeout": 5}
+
+    Targets are looked up concurrently and one JSON object per target is
+    streamed back, newline-delimited, in the order they complete. The whole
+    request counts once against the client's share.
+    """
+
+    @gen.coroutine
+    def post(self):
+        targets, concurrency, timeout = self._parse_request()
+
+        with self.settings['admission_controller'].admit(self._client_key()):
+            yield self._stream_lookups(targets, concurrency, timeout)
+
+    @gen.coroutine
+    def _stream_lookups(self, targets, concurrency, timeout):
+        self.set_header('Content-Type', 'application/x-ndjson')
+        # Pass each line on as it's flushed, rather than buffering in nginx
+        self.set_header('X-Accel-Buffering', 'no')
+
+        semaphore = Semaphore(concurrency)
+        lookups = gen.WaitIterator(*[
+            self._lookup(target, semaphore, timeout) for target in targets])
+
+        while not lookups.done():
+            result = yield lookups.next()
+            self.write(encode_json(result, pretty=False) + b'\n')
+
+            try:
+                yield self.flush()
+            except StreamClosedError:
+                logging.info('Bulk lookup client went away')
+                return
+
+    def _parse_request(self):
+        try:
+            body = json.loads(self.request.body.decode('utf-8'))
+        except ValueError:
+            raise HTTPError(status_code=400, reason='Body is not valid JSON.')
+
+        if isinstance(body, list):
+            body = {'targets': body}
+        elif not isinstance(body, dict):
+            raise HTTPError(
+                status_code=400,
+                reason='Body must be a list of targets or an object.')
+
+        targets = body.get('targets')
+        if not isinstance(targets, list) or not targets:
+            raise HTTPError(
+                status_code=400, reason='Expected a list of `targets`.')
+
+        max_targets = self.settings.get(
+            'bulk_max_targets', BULK_MAX_TARGETS)
+        if len(targets) > max_targets:
+            raise HTTPError(
+                status_code=400,
+                reason='At most {} targets per request.'.format(max_targets))
+
+        max_concurrency = self.settings.get(
+            'bulk_max_concurrency', BULK_MAX_CONCURRENCY)
+        timeout = self.settings.get('bulk_timeout', BULK_TIMEOUT)
+
+        try:
+            concurrency = min(
+                int(body.get('concurrency', max_concurrency)),
+                max_concurrency)
+            requested_timeout = float(body.get('timeout', timeout))
+        except (TypeError, ValueError, OverflowError):
+            raise HTTPError(
+                status_code=400,
+                reason='`concurrency` and `timeout` must be numbers.')
+
+        # Also false for NaN
+        if not 0 < requested_timeout < float('inf'):
+            raise HTTPError(
+                status_code=400,
+                reason='`timeout` must be a positive number of seconds.')
+
+        return targets, max(concurrency, 1), min(requested_timeout, timeout)
+
+    @gen.coroutine
+    def _lookup(self, target, semaphore, timeout):
+        result = OrderedDict([('target', target)])
+
+        try:
+            hostname, port = parse_target(target)
+        except ValueError as e:
+            result['error'] = str(e)
+            raise gen.Return(result)
+
+        result['hostname'], result['port'] = hostname, port
+
+        with (yield semaphore.acquire()):
+            try:
+                chain = yield gen.with_timeout(
+                    datetime.timedelta(seconds=timeout),
+                    self._get_cached_certificate_chain(hostname, port))
+            except gen.TimeoutError:
+                result['error'] = 'Timed out after {}s'.format(timeout)
+            except HTTPError as e:
+                result['error'] = e.reason
+            except Exception as e:
+                result['error'] = repr(e)
+            else:
+                cert = format_response(hostname, port, chain[0])['cert']
+                for field_name in JSON_FIELD_NAMES:
+                    result[field_name] = cert[field_name]
+
+                handshake = getattr(chain, 'handshake', None)
+                if handshake is not None:
+                    result.update(format_handshake(handshake))
+
+        raise gen.Return(result)
+
+
+class FanOutHandler(JsonErrorHandlerMixin, CertificateFetcherMixin,
+                    InFlightRequestsMixin, tornado.web.RequestHandler):
+    """
+    Compare the certificates one host serves on several ports and/or to
+    several SNI names, eg for a shared-IP virtual host:
+
+        /_fanout?hostname=example.com&ports=443,8443,993&names=a.com,b.com
+
+    `ports` defaults to 443, or a port given with `hostname`, and `names`
+    to `hostname`; every combination is fetched. The host is resolved once
+    and every handshake runs at once against the same address, bypassing
+    the caches, which don't record the address a chain came from. Each
+    result has `differs` set if its certificate is not the one served most
+    often. The whole request counts once against the client's share.
+    """
+
+    @gen.coroutine
+    def get(self):
+        hostname, ports, server_names = self._parse_request()
+
+        with self.settings['admission_controller'].admit(self._client_key()):
+            yield self._fan_out(hostname, ports, server_names)
+
+    @gen.coroutine
+    def _fan_out(self, hostname, ports, server_names):
+        try:
+            addrinfo = yield self.settings['resolver'].resolve(
+                hostname, ports[0])
+        except socket.error as e:
+            raise HTTPError(
+                status_code=503,
+                reason='Failed to resolve `{}`: {}'.format(hostname, e))
+
+        family, sockaddr = addrinfo[0]  # compare like with like: one server
+
+        results = yield [
+            self._lookup(hostname, port, server_name,
+                         [(family, (sockaddr[0], port) + sockaddr[2:])])
+            for port in ports for server_name in server_names]
+
+        fingerprints = [result['sha256_fingerprint'] for result in results
+                        if 'sha256_fingerprint' in result]
+        most_served = max(fingerprints, key=fingerprints.count) \
+            if fingerprints else None
+        for result in results:
+            if 'sha256_fingerprint' in result:
+                result['differs'] = result['sha256_fingerprint'] != most_served
+
+        self.set_header('Content-Type', 'application/json')
+        self.write(encode_json(OrderedDict([
+            ('request', OrderedDict([
+                ('hostname', hostname),
+                ('address', sockaddr[0]),
+                ('ports', ports),
+                ('names', server_names),
+            ])),
+            ('distinct_certificates', len(set(fingerprints))),
+            ('results', results),
+        ]), pretty=self.pretty_json()))
+
+    def _parse_request(self):
+        try:
+            hostname, port = parse_target(self.get_query_argument('hostname'))
+            ports = _unique([
+                parse_target('{}:{}'.format(hostname, port))[1]
+                for port in self._get_list_argument('ports', str(port))])
+            server_names = _unique([
+                parse_target(name)[0]
+                for name in self._get_list_argument('names', hostname)])
+        except ValueError as e:
+            raise HTTPError(status_code=400, reason=str(e))
+
+        max_targets = self.settings.get(
+            'fanout_max_targets', FANOUT_MAX_TARGETS)
+        if len(ports) * len(server_names) > max_targets:
+            raise HTTPError(
+                status_code=400,
+                reason='At most {} port and name combinations.'.format(
+                    max_targets))
+
+        return hostname, ports, server_names
+
+    def _get_list_argument(self, name, default):
+        value = self.get_query_argument(name, default)
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    @gen.coroutine
+    def _lookup(self, hostname, port, server_name, addresses):
+        result = OrderedDict([('port', port), ('name', server_name)])
+        timeout = self.settings.get('bulk_timeout', BULK_TIMEOUT)
+
+        try:
+            chain = yield gen.with_timeout(
+                datetime.timedelta(seconds=timeout),
+                self._download_unless_failing(
+                    hostname, port, server_name, addresses,
+                    select_protocol(port)))
+        except gen.TimeoutError:
+            result['error'] = 'Timed out after {}s'.format(timeout)
+        except HTTPError as e:
+            result['error'] = e.reason
+        except Exception as e:
+            result['error'] = repr(e)
+        else:
+            cert = format_response(hostname, port, chain[0])['cert']
+            for field_name in FANOUT_FIELD_NAMES:
+                result[field_name] = cert[field_name]
+
+            handshake = getattr(chain, 'handshake', None)
+            if handshake is not None:
+                result.update(format_handshake(handshake))
+
+        raise gen.Return(result)
+
+
+class MetricsHandler(InFlightRequestsMixin, tornado.web.RequestHandler):
+    """
+    Per-process metrics in the Prometheus text exposition format.
+    """
+
+    def get(self):
+        lines = metrics.REGISTRY.expose()
+
+        cache_stats = self.settings['certificate_cache'].stats()
+        for name in ('entries', 'in_flight'):
+            lines.extend(metrics.format_sample(
+                'ssldump_certificate_cache_{}'.format(name),
+                'Certificate cache {}.'.format(name.replace('_', ' ')),
+                'gauge', cache_stats[name]))
+
+        for name in ('hits', 'misses', 'coalesced', 'stale_hits',
+                     'evictions', 'expirations'):
+            lines.extend(metrics.format_sample(
+                'ssldump_certificate_cache_{}_total'.format(name),
+                'Certificate cache {}.'.format(name.replace('_', ' ')),
+                'counter', cache_stats[name]))
+
+        refresh_stats = self.settings['refresh_ahead'].stats()
+        lines.extend(metrics.format_sample(
+            'ssldump_refresh_ahead_in_flight',
+            'Background refreshes of hot certificates running.',
+            'gauge', refresh_stats['refreshing']))
+        for name in ('refreshes', 'failures', 'deferred'):
+            lines.extend(metrics.format_sample(
+                'ssldump_refresh_ahead_{}_total'.format(name),
+                'Refresh-ahead {}.'.format(name),
+                'counter', refresh_stats[name]))
+
+        breaker_stats = self.settings['circuit_breaker'].stats()
+        lines.extend(metrics.format_sample(
+            'ssldump_open_circuits',
+            'Targets currently failing fast after a recent failure.',
+            'gauge', breaker_stats['open']))
+        for name in ('trips', 'fast_failures'):
+            lines.extend(metrics.format_sample(
+                'ssldump_circuit_{}_total'.format(name),
+                'Circuit breaker {}.'.format(name.replace('_', ' ')),
+                'counter', breaker_stats[name]))
+
+        admission_stats = self.settings['admission_controller'].stats()
+        for name in ('running', 'queued'):
+            lines.extend(metrics.format_sample(
+                'ssldump_downloads_{}'.format(name),
+                'Certificate downloads {}.'.format(name),
+                'gauge', admission_stats[name]))
+        lines.extend(metrics.format_sample(
+            'ssldump_rejected_busy_total',
+            'Requests rejected with 503 because the server was full.',
+            'counter', admission_stats['rejected_busy']))
+        lines.extend(metrics.format_sample(
+            'ssldump_rejected_client_total',
+            'Requests rejected with 429 for exceeding the per-client limit.',
+            'counter', admission_stats['rejected_client']))
+
+        resolver_stats = self.settings['resolver'].stats()
+        for name in ('hits', 'misses', 'coalesced', 'negative_hits'):
+            lines.extend(metrics.format_sample(
+                'ssldump_dns_cache_{}_total'.format(name),
+                'DNS cache {}.'.format(name.replace('_', ' ')),
+                'counter', resolver_stats[name]))
+
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write('\n'.join(lines) + '\n')
+
+
+class TestSleepHandler(InFlightRequestsMixin, tornado.web.RequestHandler):
     # See https://gist.github.com/methane/2185380
 
     executor = ThreadPoolExecutor(max_workers=2)
@@ -185,6 +900,36 @@ class TestSleepHandler(tornado.web.RequestHandler):
         return 'Slept {} seconds'.format(seconds)
 
 
+def parse_duration(duration):
+    """
+    Return the number of seconds in eg '30d', '12h' or '90' (seconds).
+    """
+    match = DURATION_REGEX.match(duration)
+    if match is None:
+        raise ValueError('Invalid duration: `{}`, expected eg `30d`.'.format(
+            duration))
+
+    return int(match.group('number')) * DURATION_UNITS[match.group('unit')]
+
+
+def _is_default_lookup(hostname, port, server_hostname, starttls):
+    """
+    Whether this is the lookup that the shared store and expiry index, keyed
+    on (hostname, port) alone, stand for: the default SNI name and the
+    port's own protocol.
+    """
+    return (server_hostname in (None, hostname) and
+            starttls == select_protocol(port))
+
+
+def _unique(items):
+    unique = []
+    for item in items:
+        if item not in unique:
+            unique.append(item)
+    return unique
+
+
 def client_accepts_html(accept_header):
     logging.warning('Accept header: `{}`'.format(accept_header))
     return accept_header is not None and 'text/html' in accept_header.lower()
@@ -193,10 +938,71 @@ HOSTNAME_CAPTURE = r'(?P<hostname>' + HOSTNAME_REGEX + ')'
 PORT_CAPTURE = r'(?P<port>\d{1,5})'
 FIELD_CAPTURE = r'(?P<field>[a-z0-9-.]+)'
 
+DURATION_REGEX = re.compile(r'^(?P<number>\d{1,9})(?P<unit>[smhdw]?)$')
+
 
 def make_app(**kwargs):
-    return tornado.web.Application(
+    kwargs.setdefault('template_environment', make_template_environment(
+        auto_reload=kwargs.get('debug', False),
+        bytecode_cache_dir=kwargs.pop('template_cache_dir', None)))
+    kwargs.setdefault(
+        'templates', load_templates(kwargs['template_environment']))
+
+    kwargs.setdefault('certificate_cache', CertificateCache(
+        ttl=kwargs.pop('cache_ttl', DEFAULT_TTL),
+        max_entries=kwargs.pop('cache_max_entries', DEFAULT_MAX_ENTRIES),
+        stale_ttl=kwargs.pop('cache_stale_ttl', DEFAULT_STALE_TTL),
+        track_accesses=True))
+
+    kwargs.setdefault('fingerprint_memo', TtlCache(
+        ttl=kwargs['certificate_cache'].ttl,
+        max_entries=kwargs['certificate_cache'].max_entries))
+
+    kwargs.setdefault('circuit_breaker', CircuitBreaker(
+        backoff=kwargs.pop('failure_backoff', DEFAULT_BACKOFF),
+        max_backoff=kwargs.pop('failure_max_backoff', DEFAULT_MAX_BACKOFF)))
+
+    kwargs.setdefault('admission_controller', AdmissionController(
+        max_concurrent=kwargs.pop('max_concurrent', DEFAULT_MAX_CONCURRENT),
+        max_queued=kwargs.pop('max_queued', DEFAULT_MAX_QUEUED),
+        max_per_client=kwargs.pop('max_per_client', DEFAULT_MAX_PER_CLIENT)))
+
+    kwargs.setdefault('resolver', CachingResolver(
+        ttl=kwargs.pop('dns_ttl', DEFAULT_DNS_TTL),
+        negative_ttl=kwargs.pop('dns_negative_ttl', DEFAULT_DNS_NEGATIVE_TTL)))
+
+    kwargs.setdefault('expiry_index', ExpiryIndex(
+        kwargs.pop('expiry_index_filename', None)))
+
+    shared_cache_filename = kwargs.pop('shared_cache_filename', None)
+    shared_cache_ttl = kwargs.pop('shared_cache_ttl', DEFAULT_TTL)
+    if shared_cache_filename is not None:
+        kwargs.setdefault('shared_certificate_store', SharedCertificateStore(
+            shared_cache_filename, ttl=shared_cache_ttl))
+
+    refresh_window = kwargs.pop('refresh_window', DEFAULT_REFRESH_WINDOW)
+    refresh_max_concurrent = kwargs.pop(
+        'refresh_max_concurrent', DEFAULT_REFRESH_MAX_CONCURRENT)
+
+    app = tornado.web.Application(
         [
+            # Underscore routes must come first: `_test` and `_cache` also
+            # match HOSTNAME_REGEX.
+            (r"/_test/example.com",
+             TestDumpCertHandler),
+
+            (r"/_test/sleep/(?P<seconds>\d{1,3})/?", TestSleepHandler),
+
+            (r"/_cache/stats", CacheStatsHandler),
+
+            (r"/_bulk", BulkLookupHandler),
+
+            (r"/_expiring", ExpiringHandler),
+
+            (r"/_fanout", FanOutHandler),
+
+            (r"/_metrics", MetricsHandler),
+
             (r"/" + HOSTNAME_CAPTURE + "/?",
              DumpCertHandler),
 
@@ -209,25 +1015,220 @@ def make_app(**kwargs):
             (r"/" + HOSTNAME_CAPTURE + ":" + PORT_CAPTURE + '/' +
              FIELD_CAPTURE + "/?",
              DumpCertHandler),
-
-            (r"/_test/example.com",
-             TestDumpCertHandler),
-
-            (r"/_test/sleep/(?P<seconds>\d{1,3})/?", TestSleepHandler),
         ],
         **kwargs)
 
+    # Not started here: see run_server()
+    app.settings.setdefault('refresh_ahead', RefreshAheadScheduler(
+        app.settings['certificate_cache'],
+        BackgroundFetcher(app.settings).fetch,
+        window=refresh_window,
+        max_concurrent=refresh_max_concurrent))
+
+    return app
+
+
+def run_server(port, processes=1, max_restarts=MAX_WORKER_RESTARTS,
+               **settings):
+    """
+    Serve the app on `port`. With `processes` other than 1, pre-fork that
+    many workers (0 means one per CPU) sharing the listening socket; see
+    `fork_workers`.
+    """
+    sockets = tornado.netutil.bind_sockets(port)
+
+    if processes != 1:
+        fork_workers(processes, max_restarts=max_restarts)
+
+    # Created after forking, so each worker has its own caches, executor
+    # threads and SQLite connections.
+    app = make_app(**settings)
+    server = tornado.httpserver.HTTPServer(app, xheaders=True)
+    server.add_sockets(sockets)
+
+    app.settings['refresh_ahead'].start()
+
+    io_loop = tornado.ioloop.IOLoop.current()
+    shutdown = make_shutdown_handler(server, io_loop)
+    for signum in SHUTDOWN_SIGNALS:
+        signal.signal(
+            signum, lambda signum, frame: io_loop.add_callback_from_signal(
+                shutdown))
+
+    io_loop.start()
+
+
+def fork_workers(processes, max_restarts=MAX_WORKER_RESTARTS):
+    """
+    Fork `processes` workers (0 means one per CPU) and return in each of
+    them. The parent stays behind to supervise: a worker that dies is
+    restarted, up to `max_restarts` times in total, and SIGTERM or SIGINT
+    is passed on to every worker. The parent exits once they all have.
+
+    This replaces tornado.process.fork_processes(), whose parent can't
+    pass signals on as it doesn't expose its workers' pids.
+    """
+    if processes <= 0:
+        processes = tornado.process.cpu_count()
+
+    parent_pid = os.getpid()
+    workers = {}  # pid -> worker number
+    stopping = []
+
+    def start_worker(number):
+        pid = os.fork()
+        if pid == 0:
+            # Until run_server() installs a graceful handler, die at once
+            for signum in SHUTDOWN_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            return True
+
+        workers[pid] = number
+        return False
+
+    def stop_workers(signum, frame):
+        if os.getpid() != parent_pid:
+            return
+
+        logging.info('Passing signal {} on to {} workers'.format(
+            signum, len(workers)))
+        stopping.append(signum)
+        for pid in list(workers):
+            try:
+                os.kill(pid, signum)
+            except OSError:  # already exited
+                pass
+
+    for signum in SHUTDOWN_SIGNALS:
+        signal.signal(signum, stop_workers)
+
+    for number in range(processes):
+        if start_worker(number):
+            return number
+
+    restarts = 0
+    while workers:
+        try:
+            pid, status = os.wait()
+        except OSError as e:
+            if e.errno == errno.EINTR:  # Python 2, on a signal
+                continue
+            raise
+
+        number = workers.pop(pid, None)
+        if number is None or stopping:
+            continue
+
+        if os.WIFSIGNALED(status):
+            logging.warning('Worker {} (pid {}) killed by signal {}, '
+                            'restarting'.format(
+                                number, pid, os.WTERMSIG(status)))
+        elif os.WEXITSTATUS(status) != 0:
+            logging.warning('Worker {} (pid {}) exited with status {}, '
+                            'restarting'.format(
+                                number, pid, os.WEXITSTATUS(status)))
+        else:
+            logging.info('Worker {} (pid {}) exited normally'.format(
+                number, pid))
+            continue
+
+        restarts += 1
+        if restarts > max_restarts:
+            raise RuntimeError('Too many worker restarts, giving up')
+
+        if start_worker(number):
+            return number
+
+    sys.exit(0)
+
+
+def make_shutdown_handler(server, io_loop,
+                          grace_period=SHUTDOWN_GRACE_PERIOD,
+                          in_flight=metrics.REQUESTS_IN_FLIGHT):
+    """
+    Return a function that stops accepting connections, then stops the
+    IOLoop as soon as the `in_flight` requests have finished, or after
+    `grace_period` seconds if some still haven't.
+    """
+    state = {'deadline': None}
+
+    def shutdown():
+        if state['deadline'] is not None:  # signalled again
+            return
+
+        logging.info('Shutting down once {} in-flight requests finish, '
+                     'within {} seconds (pid {})'.format(
+                         in_flight.value, grace_period, os.getpid()))
+        server.stop()
+        state['deadline'] = io_loop.time() + grace_period
+        stop_when_drained()
+
+    def stop_when_drained():
+        if in_flight.value <= 0 or io_loop.time() >= state['deadline']:
+            io_loop.stop()
+        else:
+            io_loop.call_later(DRAIN_POLL_INTERVAL, stop_when_drained)
+
+    return shutdown
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the ssldump web app.')
+    parser.add_argument(
+        '--port', type=int, default=int(os.environ.get('SSLDUMP_PORT', 8001)))
+    parser.add_argument(
+        '--processes', type=int,
+        default=int(os.environ.get('SSLDUMP_PROCESSES', 1)),
+        help='worker processes to pre-fork; 0 means one per CPU')
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    import os
+    args = parse_args()
+
     if os.environ.get('SSLDUMP_ENVIRONMENT', 'production') == 'development':
         print('DEBUG mode.')
         logging.basicConfig(level=logging.DEBUG)
         debug = True
+        processes = 1  # autoreload can't manage forked workers
     else:
         logging.basicConfig(level=logging.INFO)
         debug = False
-
-    app = make_app(debug=debug)
-    app.listen(8001)
-    tornado.ioloop.IOLoop.current().start()
+        processes = args.processes
+
+    run_server(
+        args.port,
+        processes=processes,
+        debug=debug,
+        fetch_mode=os.environ.get('SSLDUMP_FETCH_MODE', FETCH_MODE_ASYNC),
+        cache_ttl=int(os.environ.get('SSLDUMP_CACHE_TTL', DEFAULT_TTL)),
+        cache_max_entries=int(os.environ.get(
+            'SSLDUMP_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+        cache_stale_ttl=int(os.environ.get(
+            'SSLDUMP_CACHE_STALE_TTL', DEFAULT_STALE_TTL)),
+        refresh_window=int(os.environ.get(
+            'SSLDUMP_REFRESH_WINDOW', DEFAULT_REFRESH_WINDOW)),
+        refresh_max_concurrent=int(os.environ.get(
+            'SSLDUMP_REFRESH_MAX_CONCURRENT',
+            DEFAULT_REFRESH_MAX_CONCURRENT)),
+        shared_cache_filename=os.environ.get('SSLDUMP_SHARED_CACHE'),
+        shared_cache_ttl=int(os.environ.get(
+            'SSLDUMP_SHARED_CACHE_TTL', DEFAULT_TTL)),
+        template_cache_dir=os.environ.get('SSLDUMP_TEMPLATE_CACHE'),
+        # Unset, the expiry index is per worker and lost on restart
+        expiry_index_filename=os.environ.get('SSLDUMP_EXPIRY_INDEX'),
+        cache_control_max_age=int(os.environ.get(
+            'SSLDUMP_CACHE_CONTROL_MAX_AGE', DEFAULT_CACHE_CONTROL_MAX_AGE)),
+        failure_backoff=int(os.environ.get(
+            'SSLDUMP_FAILURE_BACKOFF', DEFAULT_BACKOFF)),
+        failure_max_backoff=int(os.environ.get(
+            'SSLDUMP_FAILURE_MAX_BACKOFF', DEFAULT_MAX_BACKOFF)),
+        max_concurrent=int(os.environ.get(
+            'SSLDUMP_MAX_CONCURRENT', DEFAULT_MAX_CONCURRENT)),
+        max_queued=int(os.environ.get(
+            'SSLDUMP_MAX_QUEUED', DEFAULT_MAX_QUEUED)),
+        max_per_client=int(os.environ.get(
+            'SSLDUMP_MAX_PER_CLIENT', DEFAULT_MAX_PER_CLIENT)),
+        dns_ttl=int(os.environ.get('SSLDUMP_DNS_TTL', DEFAULT_DNS_TTL)),
+        dns_negative_ttl=int(os.environ.get(
+            'SSLDUMP_DNS_NEGATIVE_TTL', DEFAULT_DNS_NEGATIVE_TTL)))
@@ -0,0 +1,163 @@
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# Upper bounds in seconds, spanning sub-millisecond formatting up to the
+# slowest handshakes.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """
+    A Prometheus-style histogram with one label, eg
+    `ssldump_phase_seconds{phase="dns"}`. Safe to observe from executor
+    threads as well as the IOLoop.
+    """
+
+    def __init__(self, name, documentation, label_name,
+                 buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        self._series = OrderedDict()  # label value -> [counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            try:
+                series = self._series[label_value]
+            except KeyError:
+                series = self._series[label_value] = [
+                    [0] * len(self.buckets), 0.0, 0]
+
+            counts = series[0]
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[i] += 1
+
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+
+        for label_value, (counts, total, count) in self._series.items():
+            label = '{}="{}"'.format(self.label_name, label_value)
+
+            for upper_bound, bucket_count in zip(self.buckets, counts):
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    self.name, label, upper_bound, bucket_count))
+
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(
+                self.name, label, count))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, label, total))
+            lines.append('{}_count{{{}}} {}'.format(self.name, label, count))
+
+        return lines
+
+
+class Gauge(object):
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self):
+        with self._lock:
+            self.value += 1
+
+    def dec(self):
+        with self._lock:
+            self.value -= 1
+
+    def expose(self):
+        return format_sample(self.name, self.documentation, 'gauge',
+                             self.value)
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return lines
+
+
+class RequestTimings(object):
+    """
+    Accumulates time per phase over one request, so a phase entered more
+    than once is still recorded as a single observation by `observe()`.
+    """
+
+    def __init__(self):
+        self.durations = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.durations[name] = (
+                self.durations.get(name, 0.0) + time.time() - start)
+
+    def observe(self, histogram=None):
+        histogram = histogram or PHASE_SECONDS
+        for name, duration in self.durations.items():
+            histogram.observe(name, duration)
+
+
+@contextmanager
+def timed(phase, histogram=None):
+    start = time.time()
+    try:
+        yield
+    finally:
+        (histogram or PHASE_SECONDS).observe(phase, time.time() - start)
+
+
+def format_sample(name, documentation, metric_type, value):
+    return [
+        '# HELP {} {}'.format(name, documentation),
+        '# TYPE {} {}'.format(name, metric_type),
+        '{} {}'.format(name, value),
+    ]
+
+
+REGISTRY = Registry()
+
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    'ssldump_phase_seconds',
+    'Time spent in each phase of a certificate lookup.',
+    'phase'))
+
+HANDSHAKES_IN_FLIGHT = REGISTRY.register(Gauge(
+    'ssldump_handshakes_in_flight',
+    'TLS handshakes currently in progress on the IOLoop.'))
+
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'ssldump_requests_in_flight',
+    'HTTP requests currently being handled.'))
+
+EXECUTOR_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'ssldump_executor_queue_depth',
+    'Blocking fetches waiting for an executor thread.'))
@@ -2,18 +2,25 @@ from __future__ import unicode_literals
 
 import datetime
 import logging
-import re
 import socket
+import time
 
 from collections import OrderedDict
 
 import utcdatetime
 import OpenSSL
 
-from iso8601 import parse_date as parse_datetime
+from hex_format import colon_separate_hex
 
 LOG = logging.getLogger(__name__)
 
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Decoded ASN.1 times keyed by their raw bytes. Few distinct certificates
+# are seen compared with the number of times their dates are read.
+ASN1_TIME_MEMO_SIZE = 4096
+_ASN1_TIME_MEMO = {}
+
 COMPONENT_NAMES = {
     'CN': 'common_name',
     'C': 'country',
@@ -56,7 +63,7 @@ def int_to_hex(integer):
     if len(octets) % 2 != 0:  # odd number, prepend 0
         octets = '0{}'.format(octets)
 
-    return ':'.join(re.findall('..', octets))
+    return colon_separate_hex(octets.encode('ascii'))
 
 
 def decode_certificate(x509):
@@ -101,7 +108,7 @@ def download_certificate_for(hostname, port):
 
 def parse_date_field(date_field):
     """
-    Return a utcdatetime from `datetime_field`, which is of one of the
+    Return a utcdatetime from `date_field`, which is of one of the
     following formats:
 
     YYYYMMDDhhmmssZ
@@ -110,18 +117,110 @@ def parse_date_field(date_field):
 
     See http://pyopenssl.sourceforge.net/pyOpenSSL.html/openssl-x509.html
     """
-    match = re.match(
-        '(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})'
-        '(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})'
-        '(?P<timezone>[+-]\d{4}|Z)', date_field.decode('utf-8'))
-
-    isodate = '{}-{}-{}T{}:{}:{}{}'.format(
-        match.group('year'),
-        match.group('month'),
-        match.group('day'),
-        match.group('hour'),
-        match.group('minute'),
-        match.group('second'),
-        match.group('timezone'))
-
-    return utcdatetime.utcdatetime.from_datetime(parse_datetime(isodate))
+    return decode_asn1_time(date_field)[0]
+
+
+def decode_asn1_time(value):
+    """
+    Return (utcdatetime, POSIX timestamp) for the bytes of an ASN.1
+    GeneralizedTime (YYYYMMDDhhmmss) or UTCTime (YYMMDDhhmmss), followed by
+    'Z' or an offset, '+hhmm' or '-hhmm'. Raises ValueError for anything
+    else.
+
+    The digits are decoded in a single pass, without building an
+    intermediate string, and results are memoised by `value`.
+    """
+    try:
+        return _ASN1_TIME_MEMO[value]
+    except KeyError:
+        pass
+
+    result = _decode_asn1_time(value)
+
+    if len(_ASN1_TIME_MEMO) >= ASN1_TIME_MEMO_SIZE:
+        _ASN1_TIME_MEMO.clear()
+    _ASN1_TIME_MEMO[value] = result
+
+    return result
+
+
+def days_until(timestamp, now=None):
+    """
+    Return the number of UTC calendar days from `now` (default: the current
+    time) until POSIX `timestamp`; negative if it has passed.
+    """
+    if now is None:
+        now = time.time()
+
+    return int(timestamp // SECONDS_PER_DAY - now // SECONDS_PER_DAY)
+
+
+def _decode_asn1_time(value):
+    digits = bytearray(value)  # indexes as ints on Python 2 as well
+
+    if len(digits) in (13, 17):  # UTCTime
+        year = _decode_digits(digits, 0, 2)
+        year += 1900 if year >= 50 else 2000  # RFC 5280 4.1.2.5.1
+        start = 2
+    elif len(digits) in (15, 19):  # GeneralizedTime
+        year = _decode_digits(digits, 0, 4)
+        start = 4
+    else:
+        raise ValueError('Invalid ASN.1 time: {!r}'.format(value))
+
+    month = _decode_digits(digits, start, start + 2)
+    day = _decode_digits(digits, start + 2, start + 4)
+    hour = _decode_digits(digits, start + 4, start + 6)
+    minute = _decode_digits(digits, start + 6, start + 8)
+    second = _decode_digits(digits, start + 8, start + 10)
+
+    zone = start + 10
+    if digits[zone] == ord('Z') and len(digits) == zone + 1:
+        offset = 0
+    elif digits[zone] in (ord('+'), ord('-')) and len(digits) == zone + 5:
+        offset = 60 * (60 * _decode_digits(digits, zone + 1, zone + 3) +
+                       _decode_digits(digits, zone + 3, zone + 5))
+        if digits[zone] == ord('-'):
+            offset = -offset
+    else:
+        raise ValueError('Invalid ASN.1 time zone: {!r}'.format(value))
+
+    try:  # validates the day of the month etc
+        local = utcdatetime.utcdatetime(
+            year, month, day, hour, minute, second)
+    except ValueError:
+        raise ValueError('Invalid ASN.1 time: {!r}'.format(value))
+
+    timestamp = (_days_from_civil(year, month, day) * SECONDS_PER_DAY +
+                 (hour * 60 + minute) * 60 + second - offset)
+
+    if offset:
+        return local - datetime.timedelta(seconds=offset), timestamp
+
+    return local, timestamp
+
+
+def _decode_digits(digits, start, end):
+    number = 0
+    for index in range(start, end):
+        digit = digits[index] - 48  # ord('0')
+        if not 0 <= digit <= 9:
+            raise ValueError('Invalid digit in ASN.1 time: {!r}'.format(
+                bytes(digits)))
+        number = number * 10 + digit
+
+    return number
+
+
+def _days_from_civil(year, month, day):
+    """
+    Days since 1970-01-01 of a proleptic Gregorian date.
+    See http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+    """
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = (year_of_era * 365 + year_of_era // 4 - year_of_era // 100 +
+                  day_of_year)
+    return era * 146097 + day_of_era - 719468
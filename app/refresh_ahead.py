@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+
+import logging
+import time
+
+from collections import OrderedDict
+from functools import partial
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5  # seconds between scans
+DEFAULT_WINDOW = 30  # seconds before expiry that hot entries are refreshed
+DEFAULT_MIN_ACCESSES = 3
+DEFAULT_MAX_CONCURRENT = 5
+
+
+class RefreshAheadScheduler(object):
+    """
+    Re-fetch the hot entries of a CertificateCache in the background shortly
+    before they expire, so that popular lookups are always served from cache.
+
+    Every `interval` seconds, lookups per key are collected from the cache
+    (which must be created with `track_accesses`) into a decaying count:
+    each scan halves the previous count then adds the new lookups. Entries
+    with a count of at least `min_accesses` that expire within `window`
+    seconds are refreshed by calling `fetch(key)`, hottest first, with no
+    more than `max_concurrent` refreshes running at once.
+    """
+
+    def __init__(self, cache, fetch, interval=DEFAULT_INTERVAL,
+                 window=DEFAULT_WINDOW, min_accesses=DEFAULT_MIN_ACCESSES,
+                 max_concurrent=DEFAULT_MAX_CONCURRENT, clock=time.time):
+        self.cache = cache
+        self.fetch = fetch
+        self.interval = interval
+        self.window = window
+        self.min_accesses = min_accesses
+        self.max_concurrent = max_concurrent
+        self._clock = clock
+
+        self._frequencies = {}  # key -> decaying count of lookups
+        self._refreshing = set()
+        self._periodic_callback = None
+
+        self.refreshes = 0
+        self.failures = 0
+        self.deferred = 0
+
+    def start(self):
+        if self.interval <= 0 or self.max_concurrent <= 0:
+            return
+
+        self._periodic_callback = PeriodicCallback(
+            self.scan, self.interval * 1000)
+        self._periodic_callback.start()
+
+    def stop(self):
+        if self._periodic_callback is not None:
+            self._periodic_callback.stop()
+            self._periodic_callback = None
+
+    def scan(self):
+        """
+        Update access frequencies and start refreshing the hot entries that
+        are about to expire.
+        """
+        self._update_frequencies(self.cache.take_accesses())
+
+        for key in self._due_for_refresh():
+            if len(self._refreshing) >= self.max_concurrent:
+                self.deferred += 1  # may still make it on the next scan
+                continue
+
+            LOG.debug('Refreshing {} ahead of expiry'.format(key))
+            self._refreshing.add(key)
+            self.refreshes += 1
+            IOLoop.current().add_future(
+                self.cache.refresh(key, partial(self.fetch, key)),
+                partial(self._on_refreshed, key))
+
+    def stats(self):
+        return OrderedDict([
+            ('tracked', len(self._frequencies)),
+            ('refreshing', len(self._refreshing)),
+            ('refreshes', self.refreshes),
+            ('failures', self.failures),
+            ('deferred', self.deferred),
+        ])
+
+    def _update_frequencies(self, accesses):
+        frequencies = {}
+
+        for key, frequency in self._frequencies.items():
+            frequency /= 2.0
+            if frequency >= 0.5:
+                frequencies[key] = frequency
+
+        for key, count in accesses.items():
+            frequencies[key] = frequencies.get(key, 0) + count
+
+        self._frequencies = frequencies
+
+    def _due_for_refresh(self):
+        """
+        Return the hot keys expiring within `window`, hottest first.
+        """
+        due = []
+        refresh_before = self._clock() + self.window
+
+        for key, frequency in self._frequencies.items():
+            if frequency < self.min_accesses or key in self._refreshing:
+                continue
+
+            expires_at = self.cache.expires_at(key)
+            if expires_at is not None and expires_at <= refresh_before:
+                due.append((frequency, key))
+
+        due.sort(key=lambda item: item[0], reverse=True)
+        return [key for _, key in due]
+
+    def _on_refreshed(self, key, future):
+        self._refreshing.discard(key)
+
+        if future.exception() is not None:
+            self.failures += 1
+            LOG.info('Failed to refresh {}: {!r}'.format(
+                key, future.exception()))
@@ -0,0 +1,112 @@
+from __future__ import unicode_literals
+
+import logging
+import socket
+import time
+
+from collections import OrderedDict
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.netutil import Resolver, ThreadedResolver
+
+from ttl_cache import TtlCache
+
+
+LOG = logging.getLogger(__name__)
+
+# getaddrinfo() doesn't report record TTLs, so answers are kept for a fixed,
+# short time instead.
+DEFAULT_TTL = 60  # seconds
+DEFAULT_NEGATIVE_TTL = 10  # seconds
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class CachingResolver(Resolver):
+    """
+    Non-blocking resolver that remembers answers for `ttl` seconds and
+    failed lookups ("no such host") for `negative_ttl` seconds, each in an
+    LRU of at most `max_entries` names.
+
+    Concurrent lookups of the same name share one query. Lookups that miss
+    are passed to `resolver`, by default a `ThreadedResolver`, so the IOLoop
+    is never blocked on getaddrinfo().
+    """
+
+    def initialize(self, resolver=None, ttl=DEFAULT_TTL,
+                   negative_ttl=DEFAULT_NEGATIVE_TTL,
+                   max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.resolver = resolver or ThreadedResolver()
+        self._answers = TtlCache(ttl, max_entries, clock=clock)
+        self._failures = TtlCache(negative_ttl, max_entries, clock=clock)
+        self.negative_hits = 0
+
+    def close(self):
+        self.resolver.close()
+
+    @gen.coroutine
+    def resolve(self, host, port, family=socket.AF_UNSPEC):
+        key = (host, port, family)
+
+        error_args = self._failures.get(key)
+        if error_args is not None:
+            self.negative_hits += 1
+            raise socket.gaierror(*error_args)
+
+        try:
+            addrinfo = yield self._answers.get_or_fetch(
+                key, lambda: self.resolver.resolve(host, port, family))
+
+        except socket.gaierror as e:
+            LOG.debug('Failed to resolve {}: {!r}'.format(host, e))
+            self._failures.put(key, e.args)
+            raise
+
+        raise gen.Return(addrinfo)
+
+    def stats(self):
+        answers = self._answers.stats()
+        return OrderedDict([
+            ('entries', answers['entries']),
+            ('negative_entries', len(self._failures)),
+            ('hits', answers['hits']),
+            ('misses', answers['misses']),
+            ('coalesced', answers['coalesced']),
+            ('negative_hits', self.negative_hits),
+        ])
+
+
+class StubResolver(Resolver):
+    """
+    Resolver that answers from a dict of hostname -> list of IP addresses
+    and fails with "no such host" for anything else, eg for pointing
+    hostnames at local test servers.
+    """
+
+    def initialize(self, hosts):
+        self.hosts = hosts
+        self.lookups = 0
+
+    def close(self):
+        pass
+
+    def resolve(self, host, port, family=socket.AF_UNSPEC):
+        self.lookups += 1
+        future = Future()
+
+        try:
+            addresses = self.hosts[host]
+        except KeyError:
+            future.set_exception(socket.gaierror(
+                socket.EAI_NONAME, 'Name or service not known'))
+            return future
+
+        future.set_result([
+            (_address_family(address), (address, port))
+            for address in addresses
+            if family in (socket.AF_UNSPEC, _address_family(address))])
+        return future
+
+
+def _address_family(address):
+    return socket.AF_INET6 if ':' in address else socket.AF_INET
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+"""
+Audit the certificates of many hosts from the command line.
+
+Reads `hostname[:port]` targets, one per line, from a file or stdin and
+writes one CSV or JSON-lines row per target with its serial number, expiry
+and fingerprints. Targets are split into chunks across a pool of worker
+processes, each of which runs many handshakes at once on its own IOLoop.
+
+Rows are flushed as each chunk finishes. Re-running with the same --output
+skips targets already in the report, so an interrupted scan resumes where
+it stopped. With --retry-failed, targets whose only rows are errors are
+scanned again, and a new row appended for each.
+
+Usage:
+
+    scan.py [--output report.csv] [--processes N] [--concurrency N]
+            [--timeout SECONDS] [--format csv|jsonl] [--retry-failed]
+            [hosts.txt | -]
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import csv
+import datetime
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+from collections import OrderedDict
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.locks import Semaphore
+
+from fetch_certificate import fetch_certificate
+from format_response import format_response
+from targets import parse_target
+
+
+LOG = logging.getLogger(__name__)
+
+REPORT_FIELDS = [
+    'target',
+    'hostname',
+    'port',
+    'serial_number',
+    'expiry_datetime',
+    'sha1_fingerprint',
+    'sha256_fingerprint',
+    'error',
+]
+
+CERTIFICATE_FIELDS = [
+    'serial_number',
+    'expiry_datetime',
+    'sha1_fingerprint',
+    'sha256_fingerprint',
+]
+
+DEFAULT_CONCURRENCY = 100  # handshakes in flight per process
+DEFAULT_TIMEOUT = 5  # seconds
+CHUNK_SIZE = 200
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    # Failures are recorded in the report; don't log a traceback for each.
+    logging.getLogger('fetch_certificate').setLevel(logging.CRITICAL)
+
+    with _open_input(args.input) as f:
+        targets = list(read_targets(f))
+
+    done = read_completed_targets(
+        args.output, args.format, retry_failed=args.retry_failed)
+    remaining = [target for target in targets if target not in done]
+
+    LOG.warning('{} targets, {} already done, {} to scan'.format(
+        len(targets), len(targets) - len(remaining), len(remaining)))
+
+    with _open_output(args.output) as output:
+        writer = make_writer(
+            output, args.format, write_header=_is_empty(args.output))
+
+        for rows in scan(remaining, args.processes, args.concurrency,
+                         args.timeout):
+            for row in rows:
+                writer(row)
+            output.flush()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Audit the TLS certificates of a list of hosts.')
+    parser.add_argument(
+        'input', nargs='?', default='-',
+        help='file of hostname[:port] targets, one per line (default stdin)')
+    parser.add_argument(
+        '--output', '-o', default='-',
+        help='report file; appended to and used to resume (default stdout)')
+    parser.add_argument(
+        '--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument(
+        '--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument(
+        '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+        help='handshakes in flight per process')
+    parser.add_argument(
+        '--timeout', type=float, default=DEFAULT_TIMEOUT,
+        help='seconds allowed per target')
+    parser.add_argument(
+        '--retry-failed', action='store_true',
+        help='when resuming, scan again targets that previously failed')
+    return parser.parse_args(argv)
+
+
+def read_targets(lines):
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            yield line
+
+
+def read_completed_targets(filename, report_format, retry_failed=False):
+    """
+    Return the targets already in the report `filename`, leaving out those
+    with no successful row if `retry_failed`.
+    """
+    if filename == '-' or not os.path.exists(filename):
+        return set()
+
+    with io.open(filename, newline='') as f:
+        if report_format == 'jsonl':
+            rows = (json.loads(line) for line in f if line.endswith('\n'))
+        else:
+            rows = csv.DictReader(f)
+
+        return set(row['target'] for row in rows
+                   if not (retry_failed and row['error']))
+
+
+def make_writer(output, report_format, write_header=True):
+    if report_format == 'jsonl':
+        return lambda row: output.write(json.dumps(row) + '\n')
+
+    writer = csv.DictWriter(output, REPORT_FIELDS, lineterminator='\n')
+    if write_header:
+        writer.writeheader()
+
+    return writer.writerow
+
+
+def scan(targets, processes, concurrency, timeout):
+    """
+    Yield a list of report rows per chunk of `targets`, as chunks finish.
+    """
+    chunks = [(targets[i:i + CHUNK_SIZE], concurrency, timeout)
+              for i in range(0, len(targets), CHUNK_SIZE)]
+
+    if processes <= 1:
+        for chunk in chunks:
+            yield scan_chunk(chunk)
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for rows in pool.imap_unordered(scan_chunk, chunks):
+            yield rows
+    finally:
+        pool.terminate()
+
+
+def scan_chunk(args):
+    targets, concurrency, timeout = args
+    return IOLoop.current().run_sync(
+        lambda: _scan_targets(targets, concurrency, timeout))
+
+
+@gen.coroutine
+def _scan_targets(targets, concurrency, timeout):
+    semaphore = Semaphore(concurrency)
+    rows = yield [_scan_target(target, semaphore, timeout)
+                  for target in targets]
+    raise gen.Return(rows)
+
+
+@gen.coroutine
+def _scan_target(target, semaphore, timeout):
+    row = OrderedDict((field, None) for field in REPORT_FIELDS)
+    row['target'] = target
+
+    try:
+        row['hostname'], row['port'] = parse_target(target)
+
+        with (yield semaphore.acquire()):
+            x509 = yield fetch_certificate(
+                row['hostname'], row['port'],
+                timeout=datetime.timedelta(seconds=timeout))
+
+    except Exception as e:
+        row['error'] = repr(e)
+
+    else:
+        cert = format_response(row['hostname'], row['port'], x509)['cert']
+        for field in CERTIFICATE_FIELDS:
+            row[field] = cert[field]
+
+    raise gen.Return(row)
+
+
+def _is_empty(filename):
+    return (filename == '-' or not os.path.exists(filename) or
+            os.path.getsize(filename) == 0)
+
+
+def _open_input(filename):
+    if filename == '-':
+        return io.open(sys.stdin.fileno(), closefd=False)
+    return io.open(filename)
+
+
+def _open_output(filename):
+    if filename == '-':
+        return io.open(sys.stdout.fileno(), 'w', closefd=False)
+    return io.open(filename, 'a', newline='')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+from __future__ import unicode_literals
+
+import json
+
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library is used instead
+    orjson = None
+
+from format_response import JSON_FIELD_NAMES, TIME_DEPENDENT_FIELDS
+from ttl_cache import TtlCache
+
+
+JSON_FORMATS = ('pretty', 'compact')
+
+# Encoded bodies keyed by (SHA256 fingerprint, representation, format).
+# Bodies for a fingerprint never change; the TTL only bounds memory.
+ENCODED_BODIES = TtlCache(ttl=24 * 60 * 60, max_entries=5000)
+
+
+def encode_json(obj, pretty=True):
+    """
+    Return `obj` as UTF-8 JSON bytes: indented like `json.dumps(indent=4)`,
+    or with no whitespace at all if not `pretty`.
+    """
+    if not pretty and orjson is not None:
+        return orjson.dumps(obj)
+
+    if pretty:
+        string = json.dumps(obj, indent=4)
+    else:
+        string = json.dumps(obj, separators=(',', ':'))
+
+    return string.encode('utf-8')
+
+
+def certificate_body(cert, representation, pretty=True):
+    """
+    Return the encoded response body for one representation of a
+    CertificateRecord: 'json', or any of its field names, eg
+    'certificate.pem'. Bodies are encoded once per certificate and cached,
+    except for fields that change with the date.
+    """
+    if representation in TIME_DEPENDENT_FIELDS:
+        return _encode(cert, representation, pretty)
+
+    key = (cert.sha256_fingerprint, representation, pretty)
+
+    body = ENCODED_BODIES.get(key)
+    if body is None:
+        body = _encode(cert, representation, pretty)
+        ENCODED_BODIES.put(key, body)
+
+    return body
+
+
+def _encode(cert, representation, pretty):
+    if representation == 'json':
+        return encode_json(
+            OrderedDict([(k, cert[k]) for k in JSON_FIELD_NAMES]), pretty)
+
+    value = cert[representation]
+    if isinstance(value, bytes):
+        return value
+    elif isinstance(value, tuple):  # eg subject_alt_names, one per line
+        value = '\n'.join(value)
+
+    return '{}'.format(value).encode('utf-8')
@@ -0,0 +1,145 @@
+from __future__ import unicode_literals
+
+import binascii
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import OpenSSL
+from OpenSSL.crypto import FILETYPE_ASN1
+
+from concurrent.futures import ThreadPoolExecutor
+from tornado.concurrent import run_on_executor
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300  # seconds
+
+PURGE_EVERY_N_WRITES = 100
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS certificates (
+    hostname TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    der BLOB NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (hostname, port)
+)
+'''
+
+
+class SharedCertificateStore(object):
+    """
+    Certificate cache shared by every worker process on a host, stored as
+    DER bytes plus fetch time in an SQLite file. Each row holds the whole
+    chain the server sent, as concatenated DER certificates.
+
+    It sits behind the in-process `CertificateCache`: a worker that misses
+    its own cache looks here before doing a handshake, so popular hosts are
+    fetched once per host rather than once per worker, and a restarted
+    worker starts warm.
+
+    get() and put() block, for up to 5 seconds if another worker holds the
+    lock; on the IOLoop use get_async() and put_async(), which run them on
+    a thread.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=2)
+
+    def __init__(self, filename, ttl=DEFAULT_TTL, clock=time.time):
+        self.filename = filename
+        self.ttl = ttl
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+
+        self._connection().execute(SCHEMA)
+
+    def get(self, hostname, port):
+        row = self._connection().execute(
+            'SELECT der FROM certificates '
+            'WHERE hostname = ? AND port = ? AND fetched_at > ?',
+            (hostname, port, self._clock() - self.ttl)).fetchone()
+
+        if row is None:
+            return None
+
+        return [OpenSSL.crypto.load_certificate(FILETYPE_ASN1, der)
+                for der in split_concatenated_der(bytes(row[0]))]
+
+    def put(self, hostname, port, chain):
+        der = b''.join(
+            OpenSSL.crypto.dump_certificate(FILETYPE_ASN1, x509)
+            for x509 in chain)
+        connection = self._connection()
+
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO certificates '
+                '(hostname, port, der, fetched_at) VALUES (?, ?, ?, ?)',
+                (hostname, port, sqlite3.Binary(der), self._clock()))
+
+        self._writes += 1
+        if self._writes % PURGE_EVERY_N_WRITES == 0:
+            self.purge_expired()
+
+    @run_on_executor
+    def get_async(self, hostname, port):
+        return self.get(hostname, port)
+
+    @run_on_executor
+    def put_async(self, hostname, port, chain):
+        return self.put(hostname, port, chain)
+
+    def purge_expired(self):
+        connection = self._connection()
+        with connection:
+            deleted = connection.execute(
+                'DELETE FROM certificates WHERE fetched_at <= ?',
+                (self._clock() - self.ttl,)).rowcount
+
+        LOG.debug('Purged {} expired certificates from {}'.format(
+            deleted, self.filename))
+
+    def _connection(self):
+        # SQLite connections must not cross a fork() or be shared between
+        # the executor threads, so keep one per (process, thread).
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            self._local.connection = self._connect()
+            self._local.pid = pid
+
+        return self._local.connection
+
+    def _connect(self):
+        connection = sqlite3.connect(self.filename, timeout=5)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+
+def split_concatenated_der(data):
+    """
+    Split back-to-back DER encoded values using the length in each header.
+    """
+    values = []
+    offset = 0
+    while offset < len(data):
+        length_octet = bytearray(data[offset + 1:offset + 2])[0]
+
+        if length_octet < 0x80:  # short form
+            header_length, content_length = 2, length_octet
+        else:  # long form: low bits give the number of length octets
+            count = length_octet & 0x7f
+            header_length = 2 + count
+            content_length = int(binascii.hexlify(
+                data[offset + 2:offset + header_length]), 16)
+
+        end = offset + header_length + content_length
+        values.append(data[offset:end])
+        offset = end
+
+    return values
@@ -0,0 +1,193 @@
+from __future__ import unicode_literals
+
+import logging
+import re
+import socket
+import struct
+
+from tornado import gen
+from tornado.iostream import StreamClosedError, UnsatisfiableReadError
+
+
+LOG = logging.getLogger(__name__)
+
+MAX_RESPONSE_BYTES = 64 * 1024  # servers' plaintext replies are short
+
+CLIENT_NAME = 'ssldump'
+
+# Port -> protocol used when none is asked for. Ports not listed here, eg
+# 443, 465 and 993, speak TLS from the first byte.
+DEFAULT_PROTOCOLS = {
+    25: 'smtp',
+    587: 'smtp',
+    110: 'pop3',
+    143: 'imap',
+    5222: 'xmpp',
+    5432: 'postgres',
+}
+
+NO_STARTTLS = 'none'
+
+# The final line of an SMTP reply, eg `250 STARTTLS\r\n`, after any number
+# of `250-...` continuation lines.
+SMTP_LAST_LINE = re.compile(br'^(\d{3}) [^\n]*\n', re.MULTILINE)
+
+XMPP_STREAM_HEADER = (
+    "<?xml version='1.0'?>"
+    "<stream:stream xmlns='jabber:client' "
+    "xmlns:stream='http://etherx.jabber.org/streams' "
+    "to='{}' version='1.0'>")
+XMPP_STARTTLS = b"<starttls xmlns='urn:ietf:params:xml:ns:xmpp-tls'/>"
+XMPP_FEATURES_END = re.compile(br'</stream:features>|<stream:features/>')
+XMPP_STARTTLS_REPLY = re.compile(br'<(proceed|failure)\b[^>]*>')
+
+POSTGRES_SSL_REQUEST = struct.pack('!ii', 8, 80877103)
+
+
+class StartTlsError(socket.error):
+    """
+    The server refused to switch to TLS, or didn't follow the protocol.
+    """
+
+
+def select_protocol(port, protocol=None):
+    """
+    Return the STARTTLS protocol to speak to `port`: `protocol` if given,
+    otherwise the port's default. None means handshake straight away.
+    Raises ValueError for an unknown protocol.
+    """
+    if protocol is None:
+        return DEFAULT_PROTOCOLS.get(port)
+
+    if protocol == NO_STARTTLS:
+        return None
+
+    if protocol not in DRIVERS:
+        raise ValueError('Unknown STARTTLS protocol: `{}`, expected one of: '
+                         '{}.'.format(protocol, ', '.join(PROTOCOLS)))
+
+    return protocol
+
+
+@gen.coroutine
+def negotiate(protocol, stream, server_hostname):
+    """
+    Run the plaintext dialogue that asks the server on `stream` (a Tornado
+    IOStream) to switch to TLS. Once this returns, the next bytes on the
+    stream are the TLS handshake.
+
+    Each driver sends as soon as the protocol allows and reads replies
+    whole, so the upgrade costs as few round trips as it can.
+    """
+    LOG.debug('Negotiating {} STARTTLS with {}'.format(
+        protocol, server_hostname))
+    try:
+        yield DRIVERS[protocol](stream, server_hostname)
+    except (StreamClosedError, UnsatisfiableReadError) as e:
+        # Tornado closes the stream on a reply over `max_bytes`
+        if not isinstance(e, UnsatisfiableReadError) and not isinstance(
+                getattr(e, 'real_error', None), UnsatisfiableReadError):
+            raise
+
+        raise StartTlsError('{} reply longer than {} bytes'.format(
+            protocol, MAX_RESPONSE_BYTES))
+
+
+@gen.coroutine
+def smtp(stream, server_hostname):
+    # RFC 3207. The greeting must be awaited: many servers drop clients
+    # that talk first.
+    yield _expect_smtp_reply(stream, b'220')
+
+    stream.write('EHLO {}\r\n'.format(CLIENT_NAME).encode('ascii'))
+    reply = yield _expect_smtp_reply(stream, b'250')
+    if b'STARTTLS' not in reply.upper():
+        raise StartTlsError('SMTP server does not offer STARTTLS')
+
+    stream.write(b'STARTTLS\r\n')
+    yield _expect_smtp_reply(stream, b'220')
+
+
+@gen.coroutine
+def imap(stream, server_hostname):
+    # RFC 3501. STARTTLS is sent without asking for CAPABILITY first: a
+    # server without it says so in the tagged reply, a round trip sooner.
+    greeting = yield _read_line(stream)
+    if not greeting.startswith(b'* OK'):
+        raise StartTlsError('Unexpected IMAP greeting: {!r}'.format(greeting))
+
+    stream.write(b'a STARTTLS\r\n')
+    while True:
+        line = yield _read_line(stream)
+        if line.startswith(b'a '):  # the tagged reply; others are untagged
+            break
+
+    if not line.startswith(b'a OK'):
+        raise StartTlsError('IMAP STARTTLS refused: {!r}'.format(line))
+
+
+@gen.coroutine
+def pop3(stream, server_hostname):
+    # RFC 2595, likewise without asking for CAPA first
+    greeting = yield _read_line(stream)
+    if not greeting.startswith(b'+OK'):
+        raise StartTlsError('Unexpected POP3 greeting: {!r}'.format(greeting))
+
+    stream.write(b'STLS\r\n')
+    reply = yield _read_line(stream)
+    if not reply.startswith(b'+OK'):
+        raise StartTlsError('POP3 STLS refused: {!r}'.format(reply))
+
+
+@gen.coroutine
+def xmpp(stream, server_hostname):
+    # RFC 6120 5.4. The stream header needs no reply, so the STARTTLS
+    # request follows as soon as the server's features have arrived.
+    stream.write(XMPP_STREAM_HEADER.format(server_hostname).encode('utf-8'))
+
+    features = yield stream.read_until_regex(
+        XMPP_FEATURES_END, max_bytes=MAX_RESPONSE_BYTES)
+    if b'urn:ietf:params:xml:ns:xmpp-tls' not in features:
+        raise StartTlsError('XMPP server does not offer STARTTLS')
+
+    stream.write(XMPP_STARTTLS)
+    reply = yield stream.read_until_regex(
+        XMPP_STARTTLS_REPLY, max_bytes=MAX_RESPONSE_BYTES)
+    if XMPP_STARTTLS_REPLY.search(reply).group(1) != b'proceed':
+        raise StartTlsError('XMPP STARTTLS refused')
+
+
+@gen.coroutine
+def postgres(stream, server_hostname):
+    # https://www.postgresql.org/docs/current/protocol-flow.html#id-1.10.5.7.12
+    stream.write(POSTGRES_SSL_REQUEST)
+    reply = yield stream.read_bytes(1)
+    if reply != b'S':
+        raise StartTlsError('Postgres server does not accept SSL')
+
+
+@gen.coroutine
+def _expect_smtp_reply(stream, code):
+    reply = yield stream.read_until_regex(
+        SMTP_LAST_LINE, max_bytes=MAX_RESPONSE_BYTES)
+
+    if SMTP_LAST_LINE.search(reply).group(1) != code:
+        raise StartTlsError('Unexpected SMTP reply, wanted {}: {!r}'.format(
+            code.decode('ascii'), reply))
+
+    raise gen.Return(reply)
+
+
+def _read_line(stream):
+    return stream.read_until(b'\n', max_bytes=MAX_RESPONSE_BYTES)
+
+
+DRIVERS = {  # protocol -> coroutine taking (stream, server_hostname)
+    'smtp': smtp,
+    'imap': imap,
+    'pop3': pop3,
+    'xmpp': xmpp,
+    'postgres': postgres,
+}
+
+PROTOCOLS = sorted(DRIVERS)
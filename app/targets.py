@@ -0,0 +1,31 @@
+from __future__ import unicode_literals
+
+import re
+
+try:
+    string_types = basestring
+except NameError:  # Python 3
+    string_types = str
+
+HOSTNAME_REGEX = r'[a-zA-Z0-9.\-_]+'  # ish...
+
+TARGET_REGEX = re.compile(
+    r'^(?P<hostname>' + HOSTNAME_REGEX + r')(?::(?P<port>\d{1,5}))?$')
+
+
+def parse_target(target):
+    """
+    Return (hostname, port) from a `hostname[:port]` string.
+    """
+    if not isinstance(target, string_types):
+        raise ValueError('Target must be a string: `{!r}`'.format(target))
+
+    match = TARGET_REGEX.match(target.lower())
+    if match is None:
+        raise ValueError('Invalid target: `{}`'.format(target))
+
+    port = int(match.group('port') or 443)
+    if not 0 < port < 65536:
+        raise ValueError('Invalid port: `{}`'.format(target))
+
+    return match.group('hostname'), port
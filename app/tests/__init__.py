@@ -1,10 +1,139 @@
+import socket
+import ssl
+import threading
+
+from contextlib import contextmanager
 from os.path import dirname, join as pjoin
 
 import OpenSSL
 
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_sockets
+from tornado.tcpserver import TCPServer
+
+
+SAMPLE_DATA_DIR = pjoin(dirname(__file__), 'sample_data')
+
+LOCALHOST_SSL_OPTIONS = {
+    'certfile': pjoin(SAMPLE_DATA_DIR, 'localhost.pem'),
+    'keyfile': pjoin(SAMPLE_DATA_DIR, 'localhost.key'),
+}
+
+
+def highest_common_tls_version():
+    """
+    The version a handshake with LocalTlsServer should negotiate: the
+    highest supported by both pyOpenSSL's OpenSSL (the client) and the ssl
+    module's (the server). TLS 1.3 needs OpenSSL 1.1.1.
+    """
+    client = OpenSSL.SSL.OPENSSL_VERSION_NUMBER >= 0x10101000
+    server = getattr(ssl, 'HAS_TLSv1_3', False)
+    return 'TLSv1.3' if client and server else 'TLSv1.2'
+
+
+class FakeClock(object):
+    """
+    A clock for caches and the like to read instead of time.time(), which
+    stands still until `now` is moved on.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def resolved_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def failed_future(exception):
+    future = Future()
+    future.set_exception(exception)
+    return future
+
 
 def load_example_x509():
-    filename = pjoin(dirname(__file__), 'sample_data', 'example.com.pem')
+    return _load_x509(pjoin(SAMPLE_DATA_DIR, 'example.com.pem'))
+
+
+def load_localhost_x509():
+    return _load_x509(LOCALHOST_SSL_OPTIONS['certfile'])
+
+
+def _load_x509(filename):
     with open(filename, 'rb') as f:
         return OpenSSL.crypto.load_certificate(
             OpenSSL.crypto.FILETYPE_PEM, f.read())
+
+
+class LocalTlsServer(TCPServer):
+    """
+    Stand-in for a remote host: completes a TLS handshake using the
+    localhost certificate in `sample_data` and then waits for the client to
+    hang up.
+    """
+    def __init__(self, ssl_options=None, **kwargs):
+        super(LocalTlsServer, self).__init__(
+            ssl_options=ssl_options or LOCALHOST_SSL_OPTIONS, **kwargs)
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        try:
+            yield stream.read_until_close()
+        except StreamClosedError:
+            pass
+
+
+@contextmanager
+def local_tls_server_in_thread():
+    """
+    Run a LocalTlsServer on its own IOLoop in a background thread, for code
+    under test that blocks the calling thread. Yields the port.
+    """
+    [sock] = bind_sockets(0, '127.0.0.1', family=socket.AF_INET)
+    started = threading.Event()
+    loops = []
+
+    def run():
+        io_loop = IOLoop.current()
+        loops.append(io_loop)
+        LocalTlsServer().add_sockets([sock])
+        io_loop.add_callback(started.set)
+        io_loop.start()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    started.wait()
+
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        loops[0].add_callback(loops[0].stop)
+        thread.join()
+
+
+def start_server(server):
+    """
+    Listen with a TCPServer on a free localhost port. Returns
+    (server, port).
+    """
+    [sock] = bind_sockets(0, '127.0.0.1', family=socket.AF_INET)
+    server.add_sockets([sock])
+    return server, sock.getsockname()[1]
+
+
+def unused_port():
+    """
+    A localhost port nothing is listening on, at least for now.
+    """
+    [sock] = bind_sockets(0, '127.0.0.1', family=socket.AF_INET)
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
@@ -0,0 +1,102 @@
+import json
+
+import mock
+
+from nose.tools import assert_equal, assert_in
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase
+
+from .. import load_example_x509
+
+import main
+
+
+@gen.coroutine
+def fake_fetch_certificate_chain(hostname, port, **kwargs):
+    if hostname == 'down.example.com':
+        raise IOError('Connection refused')
+
+    if hostname == 'slow.example.com':
+        yield gen.sleep(1)
+
+    raise gen.Return([load_example_x509()])
+
+
+class TestBulkLookup(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app()
+
+    def _post(self, body):
+        with mock.patch('main.fetch_certificate_chain',
+                        side_effect=fake_fetch_certificate_chain):
+            return self.fetch('/_bulk', method='POST', body=json.dumps(body))
+
+    def _results(self, response):
+        lines = response.body.decode('utf-8').splitlines()
+        return dict((r['target'], r) for r in map(json.loads, lines))
+
+    def test_streams_one_line_per_target(self):
+        response = self._post(
+            ['example.com', 'example.com:8443', 'down.example.com'])
+
+        assert_equal(200, response.code)
+        assert_equal('application/x-ndjson', response.headers['content-type'])
+        assert_equal('no', response.headers['X-Accel-Buffering'])
+
+        results = self._results(response)
+        assert_equal(3, len(results))
+        assert_equal(8443, results['example.com:8443']['port'])
+        assert_equal(
+            '0e:64:c5:fb:c2:36:ad:e1:4b:17:2a:eb:41:c7:8c:b0',
+            results['example.com']['serial_number'])
+        assert_in('Connection refused', results['down.example.com']['error'])
+
+    def test_slow_target_times_out_without_delaying_others(self):
+        response = self._post({
+            'targets': ['slow.example.com', 'example.com'],
+            'timeout': 0.1,
+        })
+
+        lines = response.body.decode('utf-8').splitlines()
+        assert_equal('example.com', json.loads(lines[0])['target'])
+        assert_in('Timed out', json.loads(lines[1])['error'])
+
+    def test_invalid_target_is_reported_per_line(self):
+        results = self._results(self._post(['bad host!', 'example.com']))
+
+        assert_in('Invalid target', results['bad host!']['error'])
+        assert_in('serial_number', results['example.com'])
+
+    def test_invalid_body_is_a_json_400(self):
+        for body in [{'targets': 'example.com'}, 'example.com', 5]:
+            response = self._post(body)
+
+            assert_equal(400, response.code)
+            assert_equal(400, json.loads(response.body.decode('utf-8'))[
+                'http_status'])
+
+    def test_timeout_must_be_finite_and_positive(self):
+        for timeout in ['nan', 'inf', 0, -1]:
+            response = self._post(
+                {'targets': ['example.com'], 'timeout': timeout})
+
+            assert_equal(400, response.code)
+
+
+class TestBulkLookupPerClientLimit(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app(max_per_client=1)
+
+    def test_request_counts_once_against_the_client(self):
+        with mock.patch('main.fetch_certificate_chain',
+                        side_effect=fake_fetch_certificate_chain):
+            first = self.http_client.fetch(
+                self.get_url('/_bulk'), method='POST',
+                body=json.dumps(['slow.example.com', 'example.com']))
+            second = self.fetch('/_bulk', method='POST',
+                                body=json.dumps(['example.com']))
+            first = self.io_loop.run_sync(lambda: first)
+
+        assert_equal(200, first.code)
+        assert_equal(2, len(first.body.decode('utf-8').splitlines()))
+        assert_equal(429, second.code)
@@ -2,14 +2,21 @@ import json
 
 import mock
 
-from nose.tools import assert_equal, assert_in
+from nose.tools import assert_equal, assert_in, assert_not_equal
 
+from tornado import gen
+from tornado.concurrent import Future
 from tornado.testing import AsyncHTTPTestCase
 from contextlib import contextmanager
 
-from .. import load_example_x509
+from .. import (
+    failed_future, load_example_x509, load_localhost_x509, resolved_future)
 
 import main
+import metrics
+
+from handshake import CertificateChain, Handshake
+from resolver import StubResolver
 
 
 EXPECTED_JSON = {
@@ -30,8 +37,11 @@ def assert_valid_json(string):
 def setup_fake_response():
     x509 = load_example_x509()
 
-    with mock.patch('main.get_certificate') as mocked_get_cert:
-        mocked_get_cert.return_value = x509
+    with mock.patch('main.get_certificate_chain') as mocked_get_chain, \
+            mock.patch('main.fetch_certificate_chain') as mocked_fetch_chain:
+        mocked_get_chain.return_value = [x509]
+        mocked_fetch_chain.side_effect = lambda *args, **kwargs: (
+            resolved_future([x509]))
         yield
 
 
@@ -101,6 +111,417 @@ class TestDumpCert(AsyncHTTPTestCase):
         assert_equal(1526, len(response.body))
 
 
+class TestDumpCertChain(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app()
+
+    def _fetch_with_chain(self, path):
+        chain = [load_localhost_x509(), load_example_x509()]
+
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future(chain))
+            return self.fetch(path)
+
+    def test_get_chain_as_json(self):
+        response = self._fetch_with_chain('/example.com/chain')
+
+        assert_equal(200, response.code)
+        assert_equal('application/json', response.headers['content-type'])
+        data = json.loads(response.body.decode('utf-8'))
+        assert_equal(
+            ['localhost', 'www.example.org'],
+            [cert['subject_common_name'] for cert in data['chain']])
+
+    def test_get_chain_as_pem(self):
+        response = self._fetch_with_chain('/example.com/chain.pem')
+
+        assert_equal(200, response.code)
+        assert_equal(
+            'attachment;filename="certificate_chain_example.com.pem"',
+            response.headers['content-disposition'])
+        assert_equal(
+            2, response.body.count(b'-----BEGIN CERTIFICATE-----'))
+
+
+class TestDumpCertCaching(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app()
+
+    def test_repeat_requests_fetch_once(self):
+        with setup_fake_response(), \
+                mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future([load_example_x509()]))
+
+            self.fetch('/example.com')
+            self.fetch('/example.com/serial-number')
+
+        assert_equal(1, mocked_fetch.call_count)
+
+    def test_cache_stats(self):
+        with setup_fake_response():
+            self.fetch('/example.com')
+            self.fetch('/example.com')
+
+        response = self.fetch('/_cache/stats')
+
+        assert_equal(200, response.code)
+        stats = json.loads(response.body.decode('utf-8'))
+        assert_equal((1, 1, 1), (
+            stats['entries'], stats['hits'], stats['misses']))
+
+
+class TestDumpCertConditionalGet(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app(cache_control_max_age=120)
+
+    def test_etag_is_sha256_fingerprint_and_variant(self):
+        fingerprint = load_example_x509().digest('sha256').decode('ascii')
+
+        with setup_fake_response():
+            response = self.fetch('/example.com')
+
+        assert_equal(
+            '"{}-json"'.format(fingerprint.replace(':', '').lower()),
+            response.headers['Etag'])
+        assert_equal('public, max-age=120', response.headers['Cache-Control'])
+        assert_equal('Accept', response.headers['Vary'])
+
+    def test_html_and_json_have_different_etags(self):
+        with setup_fake_response():
+            json_response = self.fetch('/example.com')
+            html_response = self.fetch(
+                '/example.com', headers={'Accept': 'text/html'})
+
+        assert_not_equal(
+            json_response.headers['Etag'], html_response.headers['Etag'])
+
+    def test_days_remaining_etag_changes_with_the_date(self):
+        with setup_fake_response(), \
+                mock.patch('main.time.time') as mocked_time:
+            mocked_time.return_value = 1500000000
+            today = self.fetch('/example.com/expiry-days-remaining')
+
+            mocked_time.return_value += 24 * 60 * 60
+            tomorrow = self.fetch(
+                '/example.com/expiry-days-remaining',
+                headers={'If-None-Match': today.headers['Etag']})
+
+        assert_equal(200, tomorrow.code)
+        assert_not_equal(today.headers['Etag'], tomorrow.headers['Etag'])
+
+    def test_if_none_match_returns_304_without_formatting(self):
+        with setup_fake_response():
+            etag = self.fetch('/example.com/serial-number').headers['Etag']
+
+            with mock.patch('main.format_response') as mocked_format:
+                response = self.fetch(
+                    '/example.com/serial-number',
+                    headers={'If-None-Match': etag})
+
+        assert_equal(304, response.code)
+        assert_equal(b'', response.body)
+        assert_equal(0, mocked_format.call_count)
+
+    def test_stale_etag_gets_full_response(self):
+        with setup_fake_response():
+            response = self.fetch(
+                '/example.com', headers={'If-None-Match': '"stale-json"'})
+
+        assert_equal(200, response.code)
+        assert_valid_json(response.body.decode('utf-8'))
+
+
+class TestDumpCertHandshakeFields(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app()
+
+    def _fetch(self, path, chain):
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future(chain))
+            return self.fetch(path)
+
+    def test_tls_version_and_cipher(self):
+        chain = CertificateChain(
+            [load_example_x509()],
+            Handshake('TLSv1.3', 'TLS_AES_256_GCM_SHA384', 0.0123))
+
+        assert_equal(b'TLSv1.3', self._fetch(
+            '/example.com/tls-version', chain).body)
+        assert_equal(b'TLS_AES_256_GCM_SHA384', self._fetch(
+            '/example.com/cipher', chain).body)
+        assert_equal(b'12', self._fetch(
+            '/example.com/handshake-ms', chain).body)
+
+    def test_chain_json_includes_handshake(self):
+        chain = CertificateChain(
+            [load_example_x509()],
+            Handshake('TLSv1.2', 'ECDHE-RSA-AES128-GCM-SHA256', 0.05))
+
+        response = self._fetch('/example.com/chain', chain)
+
+        assert_equal(
+            {'tls_version': 'TLSv1.2',
+             'cipher': 'ECDHE-RSA-AES128-GCM-SHA256',
+             'handshake_ms': 50},
+            json.loads(response.body.decode('utf-8'))['handshake'])
+
+    def test_404_without_handshake_details(self):
+        response = self._fetch(
+            '/example.com/tls-version', [load_example_x509()])
+
+        assert_equal(404, response.code)
+
+
+class TestDumpCertJsonFormat(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app()
+
+    def test_compact_format_has_no_whitespace(self):
+        with setup_fake_response():
+            response = self.fetch('/example.com?format=compact')
+
+        assert_equal(200, response.code)
+        assert_equal(
+            b'{"serial_number":"0e:64:c5:fb:c2:36:ad:e1:4b:17:2a:eb:41:c7:'
+            b'8c:b0","expiry_datetime":"2018-11-28T12:00:00Z"}',
+            response.body)
+
+    def test_pretty_is_the_default(self):
+        with setup_fake_response():
+            default = self.fetch('/example.com')
+            pretty = self.fetch('/example.com?format=pretty')
+
+        assert_equal(default.body, pretty.body)
+        assert_in(b'\n    "serial_number"', default.body)
+
+    def test_compact_and_pretty_have_different_etags(self):
+        with setup_fake_response():
+            compact = self.fetch('/example.com?format=compact')
+            pretty = self.fetch('/example.com')
+
+        assert_not_equal(compact.headers['Etag'], pretty.headers['Etag'])
+
+    def test_unknown_format_is_400(self):
+        response = self.fetch('/example.com?format=yaml')
+
+        assert_equal(400, response.code)
+        assert_valid_json(response.body.decode('utf-8'))
+
+
+class TestDumpCertFailingHost(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app(failure_backoff=30)
+
+    def test_failing_host_gets_503_then_fails_fast(self):
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                failed_future(IOError('Connection refused')))
+
+            first = self.fetch('/down.example.com')
+            second = self.fetch('/down.example.com')
+
+        assert_equal(1, mocked_fetch.call_count)
+
+        for response in (first, second):
+            assert_equal(503, response.code)
+            assert_equal('30', response.headers['Retry-After'])
+            body = json.loads(response.body.decode('utf-8'))
+            assert_in('Connection refused', body['error'])
+            assert_equal(503, body['http_status'])
+
+    def test_failure_with_another_protocol_does_not_open_default(self):
+        def fake_fetch(hostname, port, starttls=None, **kwargs):
+            if starttls == 'pop3':
+                return failed_future(IOError('Connection refused'))
+            return resolved_future([load_example_x509()])
+
+        with mock.patch('main.fetch_certificate_chain',
+                        side_effect=fake_fetch) as mocked_fetch:
+            failed = self.fetch('/example.com:8443?starttls=pop3')
+            default = self.fetch('/example.com:8443')
+
+        assert_equal(503, failed.code)
+        assert_equal(200, default.code)
+        assert_equal(2, mocked_fetch.call_count)
+
+
+class TestDumpCertRefreshAhead(AsyncHTTPTestCase):
+    def get_app(self):
+        # Every entry is within the refresh window as soon as it's cached
+        return main.make_app(cache_ttl=60, refresh_window=120)
+
+    def test_hot_host_is_fetched_again_in_the_background(self):
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future([load_example_x509()]))
+
+            for _ in range(3):
+                assert_equal(200, self.fetch('/example.com').code)
+            assert_equal(1, mocked_fetch.call_count)
+
+            self._app.settings['refresh_ahead'].scan()
+            self.io_loop.run_sync(lambda: gen.sleep(0))
+
+        assert_equal(2, mocked_fetch.call_count)
+        mocked_fetch.assert_called_with(
+            'example.com', 443, resolver=mock.ANY, shared_store=None,
+            server_hostname='example.com', addresses=None, starttls=None)
+
+    def test_refresh_bypasses_the_shared_store(self):
+        shared_store = self._app.settings['shared_certificate_store'] = \
+            mock.Mock()
+
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future([load_example_x509()]))
+
+            for _ in range(3):
+                self.fetch('/example.com')
+            self._app.settings['refresh_ahead'].scan()
+            self.io_loop.run_sync(lambda: gen.sleep(0))
+
+        assert_equal(
+            [shared_store, None],
+            [call[1]['shared_store'] for call in mocked_fetch.call_args_list])
+
+
+class TestDumpCertAdmissionControl(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app(max_concurrent=1, max_queued=0)
+
+    def test_rejects_download_when_server_is_full(self):
+        blocked = Future()
+
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: blocked
+
+            self.http_client.fetch(self.get_url('/slow.example.com'))
+            response = self.fetch('/example.com')
+
+            blocked.set_result([load_example_x509()])
+
+        assert_equal(503, response.code)
+        assert_equal('1', response.headers['Retry-After'])
+        assert_equal(1, mocked_fetch.call_count)
+
+
+class TestDumpCertPerClientLimit(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app(max_per_client=1)
+
+    def get_httpserver_options(self):
+        return {'xheaders': True}
+
+    def _fetch_as(self, client, path):
+        return self.http_client.fetch(
+            self.get_url(path), headers={'X-Real-IP': client},
+            raise_error=False)
+
+    def test_callers_sharing_a_download_are_limited_separately(self):
+        blocked = Future()
+
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: blocked
+
+            first = self._fetch_as('10.0.0.1', '/example.com')
+            second = self._fetch_as('10.0.0.2', '/example.com')
+            over_limit = self.io_loop.run_sync(
+                lambda: self._fetch_as('10.0.0.1', '/example.com'))
+
+            blocked.set_result([load_example_x509()])
+            responses = self.io_loop.run_sync(lambda: gen.multi(
+                [first, second]))
+
+        assert_equal(429, over_limit.code)
+        assert_in('10.0.0.1', json.loads(
+            over_limit.body.decode('utf-8'))['error'])
+        assert_equal([200, 200], [response.code for response in responses])
+        assert_equal(1, mocked_fetch.call_count)
+
+
+class TestDumpCertBlockingFetchMode(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app(
+            fetch_mode=main.FETCH_MODE_BLOCKING,
+            resolver=StubResolver({'example.com': ['127.0.0.1']}))
+
+    def test_uses_blocking_get_certificate(self):
+        with setup_fake_response(), \
+                mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            response = self.fetch('/example.com/serial-number')
+
+        assert_equal(200, response.code)
+        assert_equal(0, mocked_fetch.call_count)
+
+    def test_executor_queue_depth_returns_to_zero(self):
+        with setup_fake_response():
+            self.fetch('/example.com/serial-number')
+
+        assert_equal(0, metrics.EXECUTOR_QUEUE_DEPTH.value)
+
+
+class TestDumpCertStartTls(AsyncHTTPTestCase):
+    def get_app(self):
+        # STARTTLS goes through the non-blocking fetch even in this mode
+        self.shared_store = mock.Mock()
+        return main.make_app(
+            fetch_mode=main.FETCH_MODE_BLOCKING,
+            resolver=StubResolver({'example.com': ['127.0.0.1']}),
+            shared_certificate_store=self.shared_store)
+
+    def _fetch_with_mock(self, path):
+        with setup_fake_response(), \
+                mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future([load_example_x509()]))
+            response = self.fetch(path)
+
+        return response, mocked_fetch
+
+    def test_uses_port_default_protocol(self):
+        response, mocked_fetch = self._fetch_with_mock('/example.com:25')
+
+        assert_equal(200, response.code)
+        assert_equal('smtp', mocked_fetch.call_args[1]['starttls'])
+
+    def test_query_argument_selects_protocol(self):
+        response, mocked_fetch = self._fetch_with_mock(
+            '/example.com:2525?starttls=smtp')
+
+        assert_equal(200, response.code)
+        assert_equal('smtp', mocked_fetch.call_args[1]['starttls'])
+
+    def test_none_disables_port_default(self):
+        response, mocked_fetch = self._fetch_with_mock(
+            '/example.com:25?starttls=none')
+
+        assert_equal(200, response.code)
+        assert_equal(0, mocked_fetch.call_count)  # the blocking fetch
+
+    def test_uses_shared_store_for_port_default_protocol(self):
+        response, mocked_fetch = self._fetch_with_mock('/example.com:25')
+
+        assert_equal(
+            self.shared_store, mocked_fetch.call_args[1]['shared_store'])
+
+    def test_other_protocol_bypasses_shared_store(self):
+        response, mocked_fetch = self._fetch_with_mock(
+            '/example.com:443?starttls=smtp')
+
+        assert_equal(200, response.code)
+        assert_equal(None, mocked_fetch.call_args[1]['shared_store'])
+
+    def test_unknown_protocol_returns_400(self):
+        response, mocked_fetch = self._fetch_with_mock(
+            '/example.com:25?starttls=gopher')
+
+        assert_equal(400, response.code)
+        assert_equal(0, mocked_fetch.call_count)
+
+
 class TestDumpCertContentTypeNegotiation(AsyncHTTPTestCase):
     def get_app(self):
         return main.make_app()
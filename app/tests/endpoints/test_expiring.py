@@ -0,0 +1,74 @@
+import json
+import time
+
+import mock
+
+from nose.tools import assert_equal
+from tornado.testing import AsyncHTTPTestCase
+
+from expiry_index import ExpiryIndex
+
+from .. import load_example_x509, resolved_future
+
+import main
+
+DAY = 24 * 60 * 60
+
+
+class TestExpiring(AsyncHTTPTestCase):
+    def get_app(self):
+        self.index = ExpiryIndex()
+        return main.make_app(expiry_index=self.index)
+
+    def _get(self, path):
+        response = self.fetch(path)
+        return response.code, json.loads(response.body.decode('utf-8'))
+
+    def test_lists_certificates_expiring_within(self):
+        now = time.time()
+        self.index.record('soon.example.com', 443, {
+            'expiry_timestamp': now + 10 * DAY + 60,
+            'sha256_fingerprint': 'aa:bb'})
+        self.index.record('later.example.com', 443, {
+            'expiry_timestamp': now + 60 * DAY,
+            'sha256_fingerprint': 'cc:dd'})
+
+        code, body = self._get('/_expiring?within=30d')
+
+        assert_equal(200, code)
+        assert_equal(1, body['count'])
+        [cert] = body['certificates']
+        assert_equal(('soon.example.com', 443, 'aa:bb'), (
+            cert['hostname'], cert['port'], cert['sha256_fingerprint']))
+        assert_equal(True, cert['expiry_days_remaining'] in (10, 11))
+
+        assert_equal(2, self._get('/_expiring?within=9w')[1]['count'])
+
+    def test_fetched_certificates_are_indexed(self):
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch, \
+                mock.patch('main.time.time', return_value=1500000000):
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future([load_example_x509()]))
+            self.fetch('/example.com')
+
+            code, body = self._get('/_expiring?within=510d')
+
+        [cert] = body['certificates']
+        assert_equal('example.com', cert['hostname'])
+        assert_equal('2018-11-28T12:00:00Z', cert['expiry_datetime'])
+        assert_equal(502, cert['expiry_days_remaining'])
+
+    def test_certificates_fetched_with_another_protocol_are_not_indexed(self):
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future([load_example_x509()]))
+            self.fetch('/example.com:25?starttls=none')
+            self.fetch('/example.com:443?starttls=smtp')
+
+        assert_equal(0, self._get('/_expiring?within=99999d')[1]['count'])
+
+    def test_invalid_within_is_400(self):
+        code, body = self._get('/_expiring?within=soon')
+
+        assert_equal(400, code)
+        assert_equal(400, body['http_status'])
@@ -0,0 +1,142 @@
+import json
+
+import mock
+
+from nose.tools import assert_equal, assert_in
+from tornado.testing import AsyncHTTPTestCase
+
+from resolver import StubResolver
+
+from .. import (
+    LocalTlsServer, failed_future, load_example_x509, load_localhost_x509,
+    resolved_future, start_server)
+
+import main
+
+
+class TestFanOut(AsyncHTTPTestCase):
+    def get_app(self):
+        self.resolver = StubResolver({'fanout.test': ['127.0.0.1']})
+        return main.make_app(resolver=self.resolver)
+
+    def setUp(self):
+        super(TestFanOut, self).setUp()
+        self.servers = [start_server(LocalTlsServer()) for _ in range(2)]
+
+    def tearDown(self):
+        for server, _ in self.servers:
+            server.stop()
+        super(TestFanOut, self).tearDown()
+
+    def _get(self, path):
+        response = self.fetch(path)
+        return response.code, json.loads(response.body.decode('utf-8'))
+
+    def test_fetches_every_port_and_name_after_one_lookup(self):
+        ports = ','.join(str(port) for _, port in self.servers)
+
+        code, body = self._get(
+            '/_fanout?hostname=fanout.test&ports={}'
+            '&names=a.fanout.test,b.fanout.test'.format(ports))
+
+        assert_equal(200, code)
+        assert_equal(1, self.resolver.lookups)
+        assert_equal('127.0.0.1', body['request']['address'])
+        assert_equal(4, len(body['results']))
+        assert_equal(1, body['distinct_certificates'])
+
+        for result in body['results']:
+            assert_equal('localhost', result['subject_common_name'])
+            assert_equal(False, result['differs'])
+        assert_equal(['a.fanout.test', 'b.fanout.test'] * 2,
+                     [result['name'] for result in body['results']])
+
+    def test_sends_each_name_for_sni(self):
+        _, port = self.servers[0]
+
+        with mock.patch('main.fetch_certificate_chain') as mocked_fetch:
+            mocked_fetch.side_effect = lambda *args, **kwargs: (
+                resolved_future([load_localhost_x509()]))
+            self._get('/_fanout?hostname=fanout.test:{}&names=a.test,b.test'
+                      .format(port))
+
+        assert_equal(
+            ['a.test', 'b.test'],
+            sorted(call[1]['server_hostname']
+                   for call in mocked_fetch.call_args_list))
+        for call in mocked_fetch.call_args_list:
+            assert_equal([(mock.ANY, ('127.0.0.1', port))],
+                         call[1]['addresses'])
+
+    def test_flags_ports_serving_a_different_certificate(self):
+        def fake_fetch(hostname, port, **kwargs):
+            if port == 8443:
+                return resolved_future([load_example_x509()])
+            return resolved_future([load_localhost_x509()])
+
+        with mock.patch('main.fetch_certificate_chain',
+                        side_effect=fake_fetch):
+            code, body = self._get(
+                '/_fanout?hostname=fanout.test&ports=443,8443,993')
+
+        assert_equal(2, body['distinct_certificates'])
+        assert_equal(
+            [(443, False), (8443, True), (993, False)],
+            [(r['port'], r['differs']) for r in body['results']])
+
+    def test_does_not_answer_from_a_chain_cached_for_another_address(self):
+        _, port = self.servers[0]
+        self._app.settings['certificate_cache'].put(
+            ('fanout.test', port, 'fanout.test', None),
+            [load_example_x509()])
+
+        code, body = self._get('/_fanout?hostname=fanout.test:{}'.format(port))
+
+        [result] = body['results']
+        assert_equal('localhost', result['subject_common_name'])
+
+    def test_name_rejected_in_handshake_does_not_fail_the_others(self):
+        _, port = self.servers[0]
+
+        def fake_fetch(hostname, port, server_hostname=None, **kwargs):
+            if server_hostname == 'bad.test':
+                return failed_future(IOError('Handshake failed'))
+            return resolved_future([load_localhost_x509()])
+
+        with mock.patch('main.fetch_certificate_chain',
+                        side_effect=fake_fetch):
+            code, body = self._get(
+                '/_fanout?hostname=fanout.test:{}&names=bad.test,good.test'
+                .format(port))
+            code, body = self._get(
+                '/_fanout?hostname=fanout.test:{}&names=good.test'
+                .format(port))
+            default = self.fetch('/fanout.test:{}'.format(port))
+
+        assert_equal(200, code)
+        [result] = body['results']
+        assert_equal('localhost', result['subject_common_name'])
+        assert_equal(200, default.code)
+
+    def test_failed_handshake_is_reported_per_target(self):
+        _, port = self.servers[0]
+        unused_port = 1
+
+        code, body = self._get('/_fanout?hostname=fanout.test&ports={},{}'
+                               .format(port, unused_port))
+
+        assert_equal(200, code)
+        ok, failed = body['results']
+        assert_equal(False, ok['differs'])
+        assert_in('error', failed)
+
+    def test_unknown_host_is_503(self):
+        code, body = self._get('/_fanout?hostname=nowhere.test')
+
+        assert_equal(503, code)
+        assert_in('nowhere.test', body['error'])
+
+    def test_invalid_port_is_400(self):
+        code, _ = self._get('/_fanout?hostname=fanout.test&ports=443,99999')
+
+        assert_equal(400, code)
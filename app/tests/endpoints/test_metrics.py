@@ -0,0 +1,30 @@
+from nose.tools import assert_equal, assert_in
+from tornado.testing import AsyncHTTPTestCase
+
+import main
+
+
+class TestMetricsEndpoint(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app()
+
+    def test_exposes_phase_timings_after_a_lookup(self):
+        self.fetch('/_test/example.com', headers={'Accept': 'text/html'})
+
+        response = self.fetch('/_metrics')
+        body = response.body.decode('utf-8')
+
+        assert_equal(200, response.code)
+        assert_equal('text/plain; version=0.0.4',
+                     response.headers['Content-Type'])
+        for phase in ('format_response', 'render'):
+            assert_in('ssldump_phase_seconds_count{{phase="{}"}}'.format(
+                phase), body)
+
+    def test_exposes_cache_and_executor_metrics(self):
+        body = self.fetch('/_metrics').body.decode('utf-8')
+
+        assert_in('ssldump_certificate_cache_hits_total 0', body)
+        assert_in('ssldump_executor_queue_depth 0', body)
+        assert_in('ssldump_handshakes_in_flight 0', body)
+        assert_in('ssldump_refresh_ahead_refreshes_total 0', body)
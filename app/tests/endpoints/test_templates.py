@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+
+import mock
+
+from nose.tools import assert_equal, assert_in
+from tornado.testing import AsyncHTTPTestCase
+
+import main
+
+
+HTML_HEADERS = {'Accept': 'text/html'}
+
+
+class TestPrecompiledTemplates(AsyncHTTPTestCase):
+    def get_app(self):
+        return main.make_app()
+
+    def test_renders_test_page_as_html(self):
+        response = self.fetch('/_test/example.com', headers=HTML_HEADERS)
+
+        assert_equal(200, response.code)
+        assert_in(
+            '<h1>SSL/TLS certificate for example.com</h1>',
+            response.body.decode('utf-8'))
+
+    def test_render_does_not_use_the_loader(self):
+        with mock.patch('jinja2.FileSystemLoader.get_source') as get_source:
+            response = self.fetch('/_test/example.com', headers=HTML_HEADERS)
+
+        assert_equal(200, response.code)
+        assert_equal(0, get_source.call_count)
+
+
+def test_bytecode_cache_is_written_at_startup():
+    directory = tempfile.mkdtemp()
+    try:
+        main.make_app(template_cache_dir=directory)
+        assert_equal(1, len(os.listdir(directory)))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_debug_mode_auto_reloads_templates():
+    app = main.make_app(debug=True, autoreload=False)
+    assert_equal(True, app.settings['template_environment'].auto_reload)
+
+
+def test_templates_are_not_reloaded_outside_debug_mode():
+    app = main.make_app()
+    assert_equal(False, app.settings['template_environment'].auto_reload)
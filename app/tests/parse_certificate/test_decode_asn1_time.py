@@ -0,0 +1,128 @@
+import calendar
+import datetime
+import random
+import re
+
+from nose.tools import assert_equal, assert_is, assert_raises
+
+import mock
+import utcdatetime
+
+from iso8601 import parse_date as parse_datetime
+
+import parse_certificate
+
+from parse_certificate import decode_asn1_time, days_until, parse_date_field
+
+
+EXAMPLES = 2000
+
+EARLIEST = datetime.datetime(1000, 1, 2)
+SPAN = datetime.datetime(9999, 12, 30) - EARLIEST
+
+
+def test_matches_previous_implementation_for_random_times():
+    for date_field, _ in _random_times(random.Random(1)):
+        assert_equal(_previous_parse_date_field(date_field),
+                     parse_date_field(date_field), date_field)
+
+
+def test_timestamp_matches_calendar_timegm():
+    for date_field, _ in _random_times(random.Random(2)):
+        utc, timestamp = decode_asn1_time(date_field)
+
+        assert_equal(calendar.timegm(utc.astimezone(
+            utcdatetime.UTC).timetuple()), timestamp, date_field)
+
+
+def test_utc_time_matches_generalized_time():
+    for date_field, dt in _random_times(random.Random(3)):
+        if not 1950 <= dt.year < 2050:
+            continue
+
+        utc_time = date_field[2:]  # two digit year
+        assert_equal(decode_asn1_time(date_field),
+                     decode_asn1_time(utc_time), utc_time)
+
+
+def test_utc_time_years_are_1950_to_2049():
+    assert_equal(1950, parse_date_field(b'500101000000Z').date().year)
+    assert_equal(2049, parse_date_field(b'491231235959Z').date().year)
+
+
+def test_invalid_times_raise_value_error():
+    for date_field in [b'', b'2016102923595Z', b'20161029235959',
+                       b'20161329235959Z', b'20160230235959Z',
+                       b'2016102923595aZ', b'20161029235959+01',
+                       b'20161029235959X', b'20161029235959Zjunk']:
+        with assert_raises(ValueError):
+            decode_asn1_time(date_field)
+
+
+def test_results_are_memoised():
+    date_field = b'20161029235959Z'
+    first = decode_asn1_time(date_field)
+
+    with mock.patch('parse_certificate._decode_asn1_time') as decode:
+        assert_is(first, decode_asn1_time(date_field))
+
+    assert_equal(0, decode.call_count)
+
+
+def test_memo_is_bounded():
+    with mock.patch('parse_certificate.ASN1_TIME_MEMO_SIZE', 10):
+        for date_field, _ in _random_times(random.Random(4), count=50):
+            decode_asn1_time(date_field)
+
+        assert_equal(True, len(parse_certificate._ASN1_TIME_MEMO) <= 10)
+
+
+def test_days_until_counts_utc_calendar_days():
+    _, expiry = decode_asn1_time(b'20161029000001Z')
+
+    for now, expected in [('20161028235959Z', 1),
+                          ('20161029000000Z', 0),
+                          ('20161029235959Z', 0),
+                          ('20161030000000Z', -1),
+                          ('20150101000000Z', 667)]:
+        _, timestamp = decode_asn1_time(now.encode('ascii'))
+        assert_equal(expected, days_until(expiry, now=timestamp), now)
+
+
+def _random_times(rng, count=EXAMPLES):
+    """
+    Yield `count` of (GeneralizedTime bytes, local datetime) in years 1000
+    to 9999, with a mix of 'Z' and +/-hhmm offsets.
+    """
+    for _ in range(count):
+        dt = EARLIEST + datetime.timedelta(
+            seconds=rng.randrange(int(SPAN.total_seconds())))
+        if rng.random() < 0.5:
+            zone = 'Z'
+        else:
+            zone = '{}{:02d}{:02d}'.format(
+                rng.choice('+-'), rng.randrange(15), rng.randrange(60))
+
+        yield dt.strftime('%Y%m%d%H%M%S').encode('ascii') + \
+            zone.encode('ascii'), dt
+
+
+def _previous_parse_date_field(date_field):
+    """
+    parse_date_field() as it was before the direct decoder, for reference.
+    """
+    match = re.match(
+        r'(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})'
+        r'(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})'
+        r'(?P<timezone>[+-]\d{4}|Z)', date_field.decode('utf-8'))
+
+    isodate = '{}-{}-{}T{}:{}:{}{}'.format(
+        match.group('year'),
+        match.group('month'),
+        match.group('day'),
+        match.group('hour'),
+        match.group('minute'),
+        match.group('second'),
+        match.group('timezone'))
+
+    return utcdatetime.utcdatetime.from_datetime(parse_datetime(isodate))
@@ -0,0 +1,71 @@
+from nose.tools import assert_equal, assert_raises
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from admission import AdmissionController, RejectedError
+
+
+class TestAdmissionController(AsyncTestCase):
+    @gen_test
+    def test_waits_for_a_slot_when_all_are_busy(self):
+        admission = AdmissionController(max_concurrent=1, max_queued=1)
+        first = yield admission.acquire()
+
+        second = admission.acquire()
+        yield gen.moment
+        assert_equal((1, 1), (admission.running, admission.queued))
+        assert_equal(False, second.done())
+
+        with first:
+            pass
+        with (yield second):
+            assert_equal((1, 0), (admission.running, admission.queued))
+
+        assert_equal(0, admission.running)
+
+    @gen_test
+    def test_rejects_with_503_when_queue_is_full(self):
+        admission = AdmissionController(max_concurrent=1, max_queued=0)
+        yield admission.acquire()
+
+        with assert_raises(RejectedError) as context:
+            yield admission.acquire()
+
+        assert_equal(503, context.exception.status_code)
+        assert_equal(1, context.exception.retry_after)
+        assert_equal(1, admission.stats()['rejected_busy'])
+
+    def test_rejects_with_429_over_per_client_limit(self):
+        admission = AdmissionController(max_per_client=2)
+        admission.admit('10.0.0.1')
+        admission.admit('10.0.0.1')
+
+        with assert_raises(RejectedError) as context:
+            admission.admit('10.0.0.1')
+
+        assert_equal(429, context.exception.status_code)
+        assert_equal(1, admission.stats()['rejected_client'])
+        admission.admit('10.0.0.2')  # other clients unaffected
+
+    def test_per_client_count_is_released(self):
+        admission = AdmissionController(max_per_client=1)
+
+        for _ in range(3):
+            with admission.admit('10.0.0.1'):
+                pass
+
+    def test_no_client_is_not_limited_per_client(self):
+        admission = AdmissionController(max_per_client=1)
+
+        for _ in range(3):
+            admission.admit(None)
+
+    @gen_test
+    def test_per_client_limit_does_not_use_download_slots(self):
+        admission = AdmissionController(max_concurrent=1, max_per_client=1)
+
+        with admission.admit('10.0.0.1'):
+            with (yield admission.acquire()):
+                assert_equal(1, admission.running)
+
+        assert_equal(0, admission.running)
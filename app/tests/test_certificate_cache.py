@@ -0,0 +1,33 @@
+from nose.tools import assert_equal, assert_is_none
+from tornado.testing import AsyncTestCase, gen_test
+
+from certificate_cache import CertificateCache, DEFAULT_TTL
+
+from . import resolved_future
+
+
+def test_get_returns_none_for_unknown_key():
+    cache = CertificateCache()
+
+    assert_is_none(cache.get(('example.com', 443, 'example.com', None)))
+    assert_equal(DEFAULT_TTL, cache.ttl)
+
+
+class TestGetOrFetch(AsyncTestCase):
+    @gen_test
+    def test_accesses_are_counted_per_key(self):
+        cache = CertificateCache(track_accesses=True)
+
+        for key in ['a', 'a', 'b']:
+            yield cache.get_or_fetch(key, lambda: resolved_future('x509'))
+
+        assert_equal({'a': 2, 'b': 1}, cache.take_accesses())
+        assert_equal({}, cache.take_accesses())
+
+    @gen_test
+    def test_accesses_are_not_counted_by_default(self):
+        cache = CertificateCache()
+
+        yield cache.get_or_fetch('a', lambda: resolved_future('x509'))
+
+        assert_equal({}, cache.take_accesses())
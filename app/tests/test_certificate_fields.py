@@ -0,0 +1,66 @@
+from nose.tools import assert_equal, assert_in
+
+from OpenSSL.crypto import FILETYPE_ASN1, dump_certificate
+
+from certificate_fields import extract_fields
+from parse_certificate import (
+    parse_expiry, parse_serial_number, parse_subject_components)
+
+from . import load_example_x509, load_localhost_x509
+
+
+EXAMPLE_X509 = load_example_x509()
+FIELDS = extract_fields(dump_certificate(FILETYPE_ASN1, EXAMPLE_X509))
+
+
+def test_agrees_with_pyopenssl_parsers():
+    assert_equal(parse_serial_number(EXAMPLE_X509), FIELDS['serial_number'])
+    assert_equal(str(parse_expiry(EXAMPLE_X509)), FIELDS['expiry_datetime'])
+
+    for key, value in parse_subject_components(EXAMPLE_X509).items():
+        assert_equal(value, FIELDS['subject'][key])
+
+
+def test_missing_subject_components_are_none():
+    assert_equal(None, FIELDS['subject']['street'])
+
+
+def test_not_before_datetime():
+    assert_equal('2015-11-03T00:00:00Z', FIELDS['not_before_datetime'])
+
+
+def test_issuer():
+    assert_equal('DigiCert SHA2 High Assurance Server CA',
+                 FIELDS['issuer']['common_name'])
+    assert_equal('DigiCert Inc', FIELDS['issuer']['organization'])
+
+
+def test_subject_alt_names():
+    assert_equal(8, len(FIELDS['subject_alt_names']))
+    assert_equal('www.example.org', FIELDS['subject_alt_names'][0])
+    assert_in('example.com', FIELDS['subject_alt_names'])
+
+
+def test_public_key():
+    assert_equal(('RSA', 2048),
+                 (FIELDS['public_key_type'], FIELDS['public_key_bits']))
+
+
+def test_extensions_are_named():
+    assert_in('subjectAltName', FIELDS['extensions'])
+    assert_in('basicConstraints', FIELDS['extensions'])
+
+
+def test_fingerprints_match_pyopenssl():
+    for digest_name in ('sha1', 'sha256'):
+        assert_equal(
+            EXAMPLE_X509.digest(digest_name).decode('ascii').lower(),
+            FIELDS['{}_fingerprint'.format(digest_name)])
+
+
+def test_ip_address_alt_names_are_included():
+    fields = extract_fields(
+        dump_certificate(FILETYPE_ASN1, load_localhost_x509()))
+
+    assert_equal('localhost', fields['subject']['common_name'])
+    assert_equal(('localhost', '127.0.0.1'), fields['subject_alt_names'])
@@ -0,0 +1,63 @@
+import unittest
+
+from nose.tools import assert_equal, assert_in, assert_raises
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+from . import FakeClock
+
+
+KEY = ('down.example.com', 443)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            backoff=10, max_backoff=60, clock=self.clock)
+
+    def test_unknown_target_is_allowed(self):
+        self.breaker.check(KEY)
+
+    def test_fails_fast_with_original_error_after_failure(self):
+        error = self.breaker.record_failure(KEY, IOError('Connection refused'))
+        assert_equal(10, error.retry_after)
+
+        self.clock.now += 4
+        with assert_raises(CircuitOpenError) as context:
+            self.breaker.check(KEY)
+
+        assert_equal(503, context.exception.status_code)
+        assert_equal(6, context.exception.retry_after)
+        assert_in('Connection refused', context.exception.reason)
+        assert_equal(1, self.breaker.stats()['fast_failures'])
+
+    def test_retries_once_backoff_has_passed(self):
+        self.breaker.record_failure(KEY, IOError())
+        self.clock.now += 10
+
+        self.breaker.check(KEY)
+
+    def test_backoff_doubles_up_to_maximum(self):
+        backoffs = []
+        for _ in range(5):
+            backoffs.append(
+                self.breaker.record_failure(KEY, IOError()).retry_after)
+            self.clock.now += backoffs[-1]
+
+        assert_equal([10, 20, 40, 60, 60], backoffs)
+
+    def test_success_closes_the_circuit(self):
+        self.breaker.record_failure(KEY, IOError())
+        self.breaker.record_success(KEY)
+
+        self.breaker.check(KEY)
+        error = self.breaker.record_failure(KEY, IOError())
+        assert_equal(10, error.retry_after)
+
+    def test_old_failures_are_forgotten(self):
+        self.breaker.record_failure(KEY, IOError())
+        self.clock.now += 10 + 61
+
+        error = self.breaker.record_failure(KEY, IOError())
+        assert_equal(10, error.retry_after)
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import assert_equal, assert_is_none
+from tornado.ioloop import IOLoop
+
+from expiry_index import (
+    PURGE_EVERY_N_WRITES, ExpiryIndex, format_timestamp)
+
+from . import FakeClock
+
+DAY = 24 * 60 * 60
+
+
+def _cert(expiry_timestamp, fingerprint='aa:bb'):
+    return {'expiry_timestamp': expiry_timestamp,
+            'sha256_fingerprint': fingerprint}
+
+
+def _targets(entries):
+    return [(entry.hostname, entry.port) for entry in entries]
+
+
+class TestExpiryIndex(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.index = ExpiryIndex(clock=self.clock)
+
+    def test_returns_entries_expiring_within_soonest_first(self):
+        now = self.clock.now
+        self.index.record('later.com', 443, _cert(now + 20 * DAY))
+        self.index.record('never.com', 443, _cert(now + 90 * DAY))
+        self.index.record('soon.com', 443, _cert(now + 2 * DAY))
+        self.index.record('expired.com', 443, _cert(now - DAY))
+
+        assert_equal(
+            [('expired.com', 443), ('soon.com', 443), ('later.com', 443)],
+            _targets(self.index.expiring_within(30 * DAY)))
+
+    def test_new_certificate_replaces_previous_entry(self):
+        now = self.clock.now
+        self.index.record('renewed.com', 443, _cert(now + DAY, 'old'))
+        self.clock.now += 60
+        self.index.record('renewed.com', 443, _cert(now + 90 * DAY, 'new'))
+
+        assert_equal([], self.index.expiring_within(30 * DAY))
+        [entry] = self.index.expiring_within(100 * DAY)
+        assert_equal(('new', now + 60), (
+            entry.sha256_fingerprint, entry.last_seen))
+        assert_equal(1, len(self.index))
+
+    def test_ports_are_indexed_separately(self):
+        expiry = self.clock.now + DAY
+        self.index.record('example.com', 443, _cert(expiry))
+        self.index.record('example.com', 8443, _cert(expiry))
+        self.index.record('example.com', 443, _cert(expiry))
+
+        assert_equal([('example.com', 8443), ('example.com', 443)],
+                     _targets(self.index.expiring_within(DAY)))
+
+    def test_memory_only_index_writes_nothing(self):
+        assert_is_none(self.index.record('a.com', 443, _cert(0)))
+
+    def test_least_recently_seen_are_evicted_beyond_max_entries(self):
+        index = ExpiryIndex(max_entries=2, clock=self.clock)
+        expiry = self.clock.now + DAY
+        for hostname in ('a.com', 'b.com', 'a.com', 'c.com'):
+            self.clock.now += 1
+            index.record(hostname, 443, _cert(expiry))
+
+        assert_equal([('a.com', 443), ('c.com', 443)],
+                     sorted(_targets(index.expiring_within(DAY))))
+
+    def test_targets_not_seen_for_max_age_are_evicted(self):
+        index = ExpiryIndex(max_age=DAY, clock=self.clock)
+        expiry = self.clock.now + 90 * DAY
+        index.record('old.com', 443, _cert(expiry))
+
+        self.clock.now += DAY + 1
+        index.record('new.com', 443, _cert(expiry))
+
+        assert_equal([('new.com', 443)],
+                     _targets(index.expiring_within(90 * DAY)))
+
+
+class TestPersistentExpiryIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'expiry.sqlite')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_entries_survive_a_restart(self):
+        index = ExpiryIndex(self.filename, clock=self.clock)
+        _record_and_wait(
+            index, 'example.com', 443, _cert(self.clock.now + DAY))
+
+        restarted = ExpiryIndex(self.filename, clock=self.clock)
+
+        assert_equal([('example.com', 443)],
+                     _targets(restarted.expiring_within(DAY)))
+
+    def test_picks_up_other_workers_writes(self):
+        index = ExpiryIndex(self.filename, clock=self.clock)
+        other_worker = ExpiryIndex(self.filename, clock=self.clock)
+
+        self.clock.now += 1
+        _record_and_wait(
+            other_worker, 'example.com', 443, _cert(self.clock.now + DAY))
+        IOLoop.current().run_sync(index.sync_if_due)
+        assert_equal([], index.expiring_within(DAY))
+
+        self.clock.now += 5
+        IOLoop.current().run_sync(index.sync_if_due)
+        assert_equal([('example.com', 443)],
+                     _targets(index.expiring_within(DAY)))
+
+    def test_file_is_purged_of_targets_beyond_max_entries(self):
+        index = ExpiryIndex(self.filename, max_entries=2, clock=self.clock)
+        for i in range(PURGE_EVERY_N_WRITES):
+            self.clock.now += 1
+            _record_and_wait(
+                index, '{}.com'.format(i), 443, _cert(self.clock.now + DAY))
+
+        restarted = ExpiryIndex(self.filename, clock=self.clock)
+        assert_equal(2, len(restarted))
+
+
+def _record_and_wait(index, hostname, port, cert):
+    # Writes to the file happen on a thread
+    IOLoop.current().run_sync(lambda: index.record(hostname, port, cert))
+
+
+def test_format_timestamp():
+    assert_equal('2018-11-28T12:00:00Z', format_timestamp(1543406400.5))
@@ -0,0 +1,81 @@
+import datetime
+import socket
+
+from nose.tools import assert_equal, assert_raises, assert_true
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.tcpserver import TCPServer
+from tornado.testing import AsyncTestCase, gen_test
+
+from fetch_certificate import fetch_certificate, fetch_certificate_chain
+
+from . import (
+    LocalTlsServer, highest_common_tls_version, load_localhost_x509,
+    start_server, unused_port)
+
+
+class TestFetchCertificate(AsyncTestCase):
+    def setUp(self):
+        super(TestFetchCertificate, self).setUp()
+        self.server, self.port = start_server(LocalTlsServer())
+
+    def tearDown(self):
+        self.server.stop()
+        super(TestFetchCertificate, self).tearDown()
+
+    @gen_test
+    def test_returns_peer_certificate(self):
+        x509 = yield fetch_certificate('localhost', self.port)
+
+        assert_equal(
+            load_localhost_x509().get_serial_number(),
+            x509.get_serial_number())
+
+    @gen_test
+    def test_returns_chain_starting_with_peer_certificate(self):
+        chain = yield fetch_certificate_chain('localhost', self.port)
+
+        assert_equal(
+            load_localhost_x509().get_serial_number(),
+            chain[0].get_serial_number())
+
+    @gen_test
+    def test_records_negotiated_protocol_and_cipher(self):
+        chain = yield fetch_certificate_chain('localhost', self.port)
+
+        assert_equal(highest_common_tls_version(), chain.handshake.protocol)
+        assert_true(chain.handshake.cipher)
+        assert_true(chain.handshake.seconds > 0)
+
+    @gen_test
+    def test_handshakes_run_concurrently(self):
+        x509s = yield [
+            fetch_certificate('localhost', self.port) for _ in range(20)]
+
+        assert_equal(20, len(x509s))
+
+
+class TestFetchCertificateFailures(AsyncTestCase):
+    @gen_test
+    def test_connection_refused_raises(self):
+        port = unused_port()
+
+        with assert_raises((socket.error, StreamClosedError)):
+            yield fetch_certificate('localhost', port)
+
+    @gen_test
+    def test_silent_server_times_out(self):
+        server, port = start_server(_SilentServer())
+
+        try:
+            with assert_raises(gen.TimeoutError):
+                yield fetch_certificate(
+                    'localhost', port,
+                    timeout=datetime.timedelta(seconds=0.2))
+        finally:
+            server.stop()
+
+
+class _SilentServer(TCPServer):
+    def handle_stream(self, stream, address):
+        self.stream = stream  # keep the connection open, never reply
@@ -1,8 +1,14 @@
 import json
+import pickle
 
-from nose.tools import assert_in, assert_equal
+import mock
+import OpenSSL
 
-from format_response import format_response
+from nose.tools import (
+    assert_in, assert_equal, assert_false, assert_is, assert_raises)
+from OpenSSL.crypto import FILETYPE_PEM
+
+from format_response import format_chain, format_response
 
 from . import load_example_x509
 
@@ -23,7 +29,10 @@ def test_has_cert_section():
     assert_equal(
         set([
             'serial_number',
+            'not_before_datetime',
             'expiry_datetime',
+            'expiry_timestamp',
+            'expiry_days_remaining',
             'certificate.der',
             'certificate.der.txt',
             'certificate.txt',
@@ -37,6 +46,12 @@ def test_has_cert_section():
             'subject_organization',
             'subject_organizational_unit',
             'subject_street',
+            'subject_alt_names',
+            'issuer_common_name',
+            'issuer_organization',
+            'public_key_type',
+            'public_key_bits',
+            'extensions',
             'sha1_fingerprint',
             'sha256_fingerprint',
 
@@ -48,6 +63,15 @@ def test_certificate_expiry_datetime():
     assert_equal('2018-11-28T12:00:00Z', RESULT['cert']['expiry_datetime'])
 
 
+def test_expiry_days_remaining_is_computed_on_access():
+    with mock.patch('parse_certificate.time.time') as mocked_time:
+        mocked_time.return_value = 1543406400 - 10 * 24 * 60 * 60
+        assert_equal(10, RESULT['cert']['expiry_days_remaining'])
+
+        mocked_time.return_value += 11 * 24 * 60 * 60
+        assert_equal(-1, RESULT['cert']['expiry_days_remaining'])
+
+
 def test_sha1_fingerprint():
     assert_equal(
         '25:09:fb:22:f7:67:1a:ea:2d:0a:28:ae:80:51:6f:39:0d:e0:ca:21',
@@ -69,3 +93,63 @@ def test_has_json_version_section():
             'expiry_datetime',
         ]),
         set(json.loads(RESULT['json_version']).keys()))
+
+
+def test_fields_are_computed_on_first_access():
+    with mock.patch('format_response.get_certificate_text_as_utf8') as text:
+        result = format_response('dummy.com', 443, TEST_X509)
+        result['cert']['serial_number']
+        result['json_version']
+
+    assert_equal(0, text.call_count)
+
+
+def test_certificate_is_decoded_once_per_fingerprint():
+    first = format_response('a.com', 443, TEST_X509)
+    second = format_response('b.com', 443, load_example_x509())
+
+    assert_is(first['cert'], second['cert'])
+
+
+def test_certificate_record_is_immutable():
+    with assert_raises(AttributeError):
+        RESULT['cert'].serial_number = '00'
+
+    with assert_raises(AttributeError):
+        RESULT['cert'].extra = 'field'
+
+
+def test_certificate_record_stores_only_der_and_scalars():
+    record = RESULT['cert']
+
+    assert_false(hasattr(record, '__dict__'))
+    assert_equal(
+        OpenSSL.crypto.dump_certificate(FILETYPE_PEM, TEST_X509).decode(
+            'ascii'),
+        record['certificate.pem'])
+
+
+def test_certificate_record_pickles_and_hashes_by_der():
+    record = RESULT['cert']
+    copy = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+
+    assert_equal(record, copy)
+    assert_equal(hash(record), hash(copy))
+    assert_equal(record['expiry_datetime'], copy['expiry_datetime'])
+
+
+def test_format_chain_reuses_decoded_certificates():
+    first = format_chain('a.com', 443, [TEST_X509])
+    second = format_chain('b.com', 443, [load_example_x509()])
+
+    assert_is(first['chain'][0], second['chain'][0])
+
+
+def test_format_chain_json_version():
+    chain = json.loads(
+        format_chain('dummy.com', 443, [TEST_X509])['json_version'])
+
+    assert_equal({'hostname': 'dummy.com', 'port': 443}, chain['request'])
+    assert_equal(
+        '0e:64:c5:fb:c2:36:ad:e1:4b:17:2a:eb:41:c7:8c:b0',
+        chain['chain'][0]['serial_number'])
@@ -0,0 +1,57 @@
+import socket
+import time
+
+import mock
+from nose.tools import (
+    assert_equal, assert_in, assert_is, assert_raises, assert_true)
+
+import metrics
+from get_certificate import download_certificate_chain_for
+from handshake import get_ssl_context
+
+from . import (
+    highest_common_tls_version, load_localhost_x509,
+    local_tls_server_in_thread)
+
+
+def test_blocking_download_negotiates_modern_tls():
+    with local_tls_server_in_thread() as port:
+        chain = download_certificate_chain_for('localhost', port)
+
+    assert_equal(
+        load_localhost_x509().get_serial_number(),
+        chain[0].get_serial_number())
+    assert_equal(highest_common_tls_version(), chain.handshake.protocol)
+
+
+def test_blocking_download_times_connect_and_handshake():
+    histogram = metrics.Histogram('h', 'Doc.', 'phase')
+
+    with mock.patch.object(metrics, 'PHASE_SECONDS', histogram):
+        with local_tls_server_in_thread() as port:
+            download_certificate_chain_for('localhost', port)
+
+    lines = histogram.expose()
+    assert_in('h_count{phase="connect"} 1', lines)
+    assert_in('h_count{phase="tls_handshake"} 1', lines)
+
+
+def test_blocking_download_times_out_against_a_silent_server():
+    # Connections are accepted into the backlog and never answered
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    start = time.time()
+
+    try:
+        with assert_raises(socket.timeout):
+            download_certificate_chain_for(
+                'localhost', listener.getsockname()[1], timeout=0.2)
+    finally:
+        listener.close()
+
+    assert_true(time.time() - start < 2)
+
+
+def test_ssl_context_is_shared():
+    assert_is(get_ssl_context(), get_ssl_context())
@@ -0,0 +1,54 @@
+import os
+import re
+
+from nose.tools import assert_equal
+
+from hex_format import colon_separate_hex, format_hex_octets
+from parse_certificate import int_to_hex
+
+
+def _reference_format(data, octets_per_line=None):
+    # The per-octet implementation hex_format replaced.
+    long_line = ':'.join('{0:02x}'.format(octet) for octet in bytearray(data))
+    if octets_per_line is None:
+        return long_line
+
+    n = 3 * octets_per_line
+    return '\n'.join(
+        [long_line[i:i + n] for i in range(0, len(long_line), n)])
+
+
+def test_matches_reference_for_all_lengths_around_line_boundaries():
+    for length in range(0, 80):
+        data = os.urandom(length)
+        for octets_per_line in (None, 1, 2, 18, 40):
+            assert_equal(
+                _reference_format(data, octets_per_line),
+                format_hex_octets(data, octets_per_line))
+
+
+def test_matches_reference_for_large_input():
+    data = os.urandom(64 * 1024 + 7)
+    assert_equal(_reference_format(data, 18), format_hex_octets(data, 18))
+
+
+def test_accepts_memoryview():
+    assert_equal('de:ad:be:ef', format_hex_octets(
+        memoryview(b'\xde\xad\xbe\xef')))
+
+
+def test_colon_separate_hex():
+    assert_equal('0e:64:c5', colon_separate_hex(b'0e64c5'))
+
+
+def test_int_to_hex_pads_odd_length():
+    assert_equal('01:00', int_to_hex(256))
+
+
+def test_int_to_hex_matches_reference():
+    for integer in (0, 1, 255, 2 ** 64 - 1, 2 ** 159 + 12345):
+        octets = format(integer, 'x')
+        if len(octets) % 2 != 0:
+            octets = '0' + octets
+        assert_equal(
+            ':'.join(re.findall('..', octets)), int_to_hex(integer))
@@ -0,0 +1,62 @@
+import io
+import socket
+import sys
+
+from nose.tools import assert_equal, assert_in, assert_raises
+from tornado.ioloop import IOLoop
+
+from benchmarks import load_test
+from benchmarks.tls_fleet import fleet_in_process, make_members
+
+
+def _args(**kwargs):
+    args = load_test.parse_args([])
+    for name, value in kwargs.items():
+        setattr(args, name, value)
+    return args
+
+
+def test_drives_app_against_fleet_and_reports():
+    with fleet_in_process(make_members(healthy=2, failing=1)) as ports:
+        urls = ['/localhost:{}'.format(port) for port in ports]
+
+        with load_test._running_app(_args(processes=2)) as app_port:
+            results, elapsed = IOLoop.current().run_sync(
+                lambda: load_test.drive(app_port, urls, {}, 30, 0.5))
+
+    assert_equal(15, len(results))
+    assert_in(200, [code for _, code in results])
+
+    output = _capture_stdout(
+        lambda: load_test._report('json', results, elapsed, 0.1))
+    assert_in('json', output)
+    assert_in('x200', output)
+
+    # Every pre-forked worker has stopped listening
+    with assert_raises(socket.error):
+        socket.create_connection(('127.0.0.1', app_port), timeout=1)
+
+
+def test_requests_that_time_out_are_counted_as_599s():
+    # Connections are accepted into the backlog and never answered
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(5)
+
+    try:
+        results, _ = IOLoop.current().run_sync(lambda: load_test.drive(
+            listener.getsockname()[1], ['/'], {}, 10, 0.2,
+            request_timeout=0.1))
+    finally:
+        listener.close()
+
+    assert_equal([599, 599], [code for _, code in results])
+
+
+def _capture_stdout(function):
+    stdout, sys.stdout = sys.stdout, io.StringIO()
+    try:
+        function()
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
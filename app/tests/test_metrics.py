@@ -0,0 +1,39 @@
+from nose.tools import assert_equal, assert_in
+
+import metrics
+
+
+def test_histogram_counts_observations_into_cumulative_buckets():
+    histogram = metrics.Histogram('h', 'Doc.', 'phase', buckets=(0.1, 1.0))
+    histogram.observe('dns', 0.05)
+    histogram.observe('dns', 0.5)
+
+    lines = histogram.expose()
+
+    assert_in('h_bucket{phase="dns",le="0.1"} 1', lines)
+    assert_in('h_bucket{phase="dns",le="1.0"} 2', lines)
+    assert_in('h_bucket{phase="dns",le="+Inf"} 2', lines)
+    assert_in('h_sum{phase="dns"} 0.55', lines)
+    assert_in('h_count{phase="dns"} 2', lines)
+
+
+def test_request_timings_accumulate_repeated_phases():
+    histogram = metrics.Histogram('h', 'Doc.', 'phase')
+    timings = metrics.RequestTimings()
+
+    with timings.phase('format_response'):
+        pass
+    with timings.phase('format_response'):
+        pass
+    timings.observe(histogram)
+
+    assert_in('h_count{phase="format_response"} 1', histogram.expose())
+
+
+def test_gauge_exposes_current_value():
+    gauge = metrics.Gauge('g', 'Doc.')
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    assert_equal(['# HELP g Doc.', '# TYPE g gauge', 'g 1'], gauge.expose())
@@ -0,0 +1,107 @@
+from nose.tools import assert_equal
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from certificate_cache import CertificateCache
+from refresh_ahead import RefreshAheadScheduler
+
+from . import FakeClock, resolved_future
+
+
+class TestRefreshAheadScheduler(AsyncTestCase):
+    def setUp(self):
+        super(TestRefreshAheadScheduler, self).setUp()
+        self.clock = FakeClock()
+        self.cache = CertificateCache(
+            ttl=60, track_accesses=True, clock=self.clock)
+        self.fetches = []
+
+    def _scheduler(self, **kwargs):
+        return RefreshAheadScheduler(
+            self.cache, self._fetch, window=10, min_accesses=3,
+            clock=self.clock, **kwargs)
+
+    def _fetch(self, key):
+        future = Future()
+        self.fetches.append((key, future))
+        return future
+
+    @gen.coroutine
+    def _look_up(self, key, times):
+        for _ in range(times):
+            yield self.cache.get_or_fetch(key, lambda: resolved_future('old'))
+
+    @gen_test
+    def test_hot_entry_is_refreshed_before_it_expires(self):
+        scheduler = self._scheduler()
+        yield self._look_up('hot', 5)
+        self.clock.now += 55
+
+        scheduler.scan()
+        assert_equal(['hot'], [key for key, _ in self.fetches])
+
+        self.fetches[0][1].set_result('new')
+        yield gen.moment
+        yield gen.moment
+        assert_equal('new', self.cache.get('hot'))
+        assert_equal(self.clock.now + 60, self.cache.expires_at('hot'))
+        assert_equal(0, scheduler.stats()['refreshing'])
+
+    @gen_test
+    def test_entries_not_about_to_expire_are_left_alone(self):
+        scheduler = self._scheduler()
+        yield self._look_up('hot', 5)
+        self.clock.now += 30
+
+        scheduler.scan()
+        assert_equal([], self.fetches)
+
+    @gen_test
+    def test_cold_entry_is_left_to_expire(self):
+        scheduler = self._scheduler()
+        yield self._look_up('cold', 2)
+        self.clock.now += 55
+
+        scheduler.scan()
+        assert_equal([], self.fetches)
+
+    @gen_test
+    def test_access_counts_decay_between_scans(self):
+        scheduler = self._scheduler()
+        yield self._look_up('once-hot', 4)
+        scheduler.scan()
+        scheduler.scan()
+        self.clock.now += 55
+
+        scheduler.scan()  # the 4 accesses are halved at each later scan
+        assert_equal([], self.fetches)
+
+    @gen_test
+    def test_refreshes_are_limited_to_max_concurrent(self):
+        scheduler = self._scheduler(max_concurrent=2)
+        yield self._look_up('a', 5)
+        yield self._look_up('b', 4)
+        yield self._look_up('c', 3)
+        self.clock.now += 55
+
+        scheduler.scan()
+        assert_equal(['a', 'b'], [key for key, _ in self.fetches])
+        assert_equal(1, scheduler.deferred)
+
+        scheduler.scan()  # still busy: nothing new starts
+        assert_equal(2, len(self.fetches))
+
+    @gen_test
+    def test_failed_refresh_keeps_the_cached_entry(self):
+        scheduler = self._scheduler()
+        yield self._look_up('hot', 5)
+        self.clock.now += 55
+
+        scheduler.scan()
+        self.fetches[0][1].set_exception(ValueError('handshake failed'))
+        yield gen.moment
+        yield gen.moment
+
+        assert_equal('old', self.cache.get('hot'))
+        assert_equal(1, scheduler.failures)
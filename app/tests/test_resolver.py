@@ -0,0 +1,130 @@
+import socket
+
+from nose.tools import assert_equal, assert_raises
+from tornado.testing import AsyncTestCase, gen_test
+
+from fetch_certificate import fetch_certificate
+from get_certificate import _connect
+from resolver import CachingResolver, StubResolver
+
+from . import FakeClock, LocalTlsServer, load_localhost_x509, start_server
+
+
+class TestCachingResolver(AsyncTestCase):
+    def setUp(self):
+        super(TestCachingResolver, self).setUp()
+        self.clock = FakeClock()
+        self.stub = StubResolver({'example.com': ['192.0.2.1', '2001:db8::1']})
+        self.resolver = CachingResolver(
+            resolver=self.stub, ttl=60, negative_ttl=10, clock=self.clock)
+
+    @gen_test
+    def test_returns_addresses_of_both_families(self):
+        addrinfo = yield self.resolver.resolve('example.com', 443)
+
+        assert_equal([
+            (socket.AF_INET, ('192.0.2.1', 443)),
+            (socket.AF_INET6, ('2001:db8::1', 443)),
+        ], addrinfo)
+
+    @gen_test
+    def test_answers_are_cached_until_ttl(self):
+        yield self.resolver.resolve('example.com', 443)
+        yield self.resolver.resolve('example.com', 443)
+        assert_equal(1, self.stub.lookups)
+
+        self.clock.now += 61
+        yield self.resolver.resolve('example.com', 443)
+        assert_equal(2, self.stub.lookups)
+
+    @gen_test
+    def test_failures_are_cached_until_negative_ttl(self):
+        for _ in range(2):
+            with assert_raises(socket.gaierror):
+                yield self.resolver.resolve('nonexistent.example', 443)
+        assert_equal(1, self.stub.lookups)
+        assert_equal(1, self.resolver.stats()['negative_hits'])
+
+        self.clock.now += 11
+        with assert_raises(socket.gaierror):
+            yield self.resolver.resolve('nonexistent.example', 443)
+        assert_equal(2, self.stub.lookups)
+
+    @gen_test
+    def test_concurrent_lookups_share_one_query(self):
+        yield [self.resolver.resolve('example.com', 443) for _ in range(5)]
+
+        assert_equal(1, self.stub.lookups)
+
+    @gen_test
+    def test_size_is_bounded(self):
+        self.stub.hosts = dict(
+            ('host{}.example'.format(i), ['192.0.2.1']) for i in range(5))
+        resolver = CachingResolver(resolver=self.stub, max_entries=3)
+
+        yield [resolver.resolve(host, 443) for host in self.stub.hosts]
+
+        assert_equal(3, resolver.stats()['entries'])
+
+
+class TestFetchThroughStubResolver(AsyncTestCase):
+    def setUp(self):
+        super(TestFetchThroughStubResolver, self).setUp()
+        self.server, self.port = start_server(LocalTlsServer())
+
+    def tearDown(self):
+        self.server.stop()
+        super(TestFetchThroughStubResolver, self).tearDown()
+
+    @gen_test
+    def test_connects_to_resolved_address(self):
+        resolver = StubResolver({'test.invalid': ['127.0.0.1']})
+
+        x509 = yield fetch_certificate(
+            'test.invalid', self.port, resolver=resolver)
+
+        assert_equal(
+            load_localhost_x509().get_serial_number(),
+            x509.get_serial_number())
+
+    @gen_test
+    def test_falls_back_to_next_address(self):
+        # The server only listens on IPv4, so the IPv6 attempt fails over
+        resolver = StubResolver({'test.invalid': ['::1', '127.0.0.1']})
+
+        x509 = yield fetch_certificate(
+            'test.invalid', self.port, resolver=resolver)
+
+        assert_equal(
+            load_localhost_x509().get_serial_number(),
+            x509.get_serial_number())
+
+
+def test_blocking_connect_tries_each_address():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+
+    try:
+        s = _connect([
+            (socket.AF_INET, ('127.0.0.1', _closed_port())),
+            (socket.AF_INET, ('127.0.0.1', port)),
+        ])
+        assert_equal(port, s.getpeername()[1])
+        s.close()
+    finally:
+        listener.close()
+
+
+def test_blocking_connect_raises_last_error():
+    with assert_raises(socket.error):
+        _connect([(socket.AF_INET, ('127.0.0.1', _closed_port()))])
+
+
+def _closed_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
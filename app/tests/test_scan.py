@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from nose.tools import assert_equal, assert_in, assert_is_none
+
+import scan
+
+from . import load_localhost_x509, local_tls_server_in_thread
+
+
+class TestScan(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.hosts = os.path.join(self.directory, 'hosts.txt')
+        self.report = os.path.join(self.directory, 'report')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _scan(self, targets, *args):
+        with io.open(self.hosts, 'w') as f:
+            f.write(u'\n'.join(targets) + u'\n')
+
+        scan.main([self.hosts, '--output', self.report, '--processes', '1',
+                   '--timeout', '2'] + list(args))
+
+    def _read_csv(self):
+        with io.open(self.report, newline='') as f:
+            return list(csv.DictReader(f))
+
+    def test_writes_csv_row_per_target(self):
+        with local_tls_server_in_thread() as port:
+            self._scan(['localhost:{}'.format(port), 'bad host!'])
+
+        rows = self._read_csv()
+        assert_equal(2, len(rows))
+        assert_equal(
+            scan.format_response('localhost', port, load_localhost_x509())[
+                'cert']['serial_number'],
+            rows[0]['serial_number'])
+        assert_in('Invalid target', rows[1]['error'])
+
+    def test_writes_jsonl(self):
+        with local_tls_server_in_thread() as port:
+            self._scan(['localhost:{}'.format(port)], '--format', 'jsonl')
+
+        with io.open(self.report) as f:
+            [row] = [json.loads(line) for line in f]
+
+        assert_equal(port, row['port'])
+        assert_is_none(row['error'])
+
+    def test_resumes_skipping_completed_targets(self):
+        with local_tls_server_in_thread() as port:
+            target = 'localhost:{}'.format(port)
+            self._scan([target])
+            self._scan([target, 'bad host!'])
+
+        rows = self._read_csv()
+        assert_equal([target, 'bad host!'], [row['target'] for row in rows])
+
+    def test_resume_skips_failed_targets_by_default(self):
+        self._scan(['bad host!'])
+        self._scan(['bad host!'])
+
+        assert_equal(1, len(self._read_csv()))
+
+    def test_retry_failed_scans_failed_targets_again(self):
+        self._scan(['bad host!'])
+        self._scan(['bad host!'], '--retry-failed')
+
+        assert_equal(2, len(self._read_csv()))
+
+    def test_retry_failed_skips_targets_that_later_succeeded(self):
+        with local_tls_server_in_thread() as port:
+            target = 'localhost:{}'.format(port)
+            with io.open(self.report, 'w') as f:
+                f.write(u'target,error\n{0},Timeout\n{0},\n'.format(target))
+
+            self._scan([target], '--retry-failed')
+
+        assert_equal(2, len(self._read_csv()))
+
+
+def test_read_targets_skips_blanks_and_comments():
+    assert_equal(
+        ['a.com', 'b.com:8443'],
+        list(scan.read_targets(['a.com\n', '\n', '# note\n',
+                                'b.com:8443  # staging\n'])))
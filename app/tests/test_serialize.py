@@ -0,0 +1,64 @@
+import json
+
+import mock
+
+from nose.tools import assert_equal, assert_is
+
+from format_response import format_response
+from serialize import certificate_body, encode_json
+
+from . import load_example_x509
+
+
+CERT = format_response('example.com', 443, load_example_x509())['cert']
+
+
+def test_pretty_json_matches_indented_json_dumps():
+    obj = {'serial_number': '0e:64', 'expiry_datetime': '2018'}
+
+    assert_equal(json.dumps(obj, indent=4).encode('utf-8'), encode_json(obj))
+
+
+def test_compact_json_has_no_whitespace():
+    assert_equal(b'{"a":[1,2]}', encode_json({'a': [1, 2]}, pretty=False))
+
+
+def test_compact_json_without_orjson():
+    with mock.patch('serialize.orjson', None):
+        assert_equal(
+            b'{"a":[1,2]}', encode_json({'a': [1, 2]}, pretty=False))
+
+
+def test_json_body_has_json_fields():
+    body = certificate_body(CERT, 'json', pretty=False)
+
+    assert_equal(
+        ['serial_number', 'expiry_datetime'],
+        list(json.loads(body.decode('utf-8'))))
+
+
+def test_text_fields_are_encoded_as_utf8():
+    assert_equal(
+        CERT['certificate.pem'].encode('utf-8'),
+        certificate_body(CERT, 'certificate.pem'))
+
+
+def test_list_fields_have_one_value_per_line():
+    body = certificate_body(CERT, 'subject_alt_names')
+
+    assert_equal(CERT['subject_alt_names'], tuple(
+        body.decode('utf-8').split('\n')))
+
+
+def test_number_fields_are_encoded_as_text():
+    assert_equal(b'2048', certificate_body(CERT, 'public_key_bits'))
+
+
+def test_bodies_are_encoded_once():
+    first = certificate_body(CERT, 'certificate.txt')
+
+    with mock.patch('serialize._encode') as encode:
+        second = certificate_body(CERT, 'certificate.txt')
+
+    assert_is(first, second)
+    assert_equal(0, encode.call_count)
@@ -0,0 +1,128 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import unittest
+
+import mock
+
+from nose.tools import assert_equal, assert_raises
+
+import main
+import metrics
+
+from . import unused_port
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEVNULL = open(os.devnull, 'wb')
+
+
+def test_parse_args_defaults_to_one_process_on_8001():
+    with mock.patch.dict('os.environ', clear=True):
+        args = main.parse_args([])
+
+    assert_equal((8001, 1), (args.port, args.processes))
+
+
+def test_parse_args_reads_environment():
+    with mock.patch.dict(
+            'os.environ', {'SSLDUMP_PROCESSES': '0', 'SSLDUMP_PORT': '8002'}):
+        args = main.parse_args([])
+
+    assert_equal((8002, 0), (args.port, args.processes))
+
+
+def test_shutdown_stops_accepting_then_stops_io_loop_when_idle():
+    server, io_loop = mock.Mock(), mock.Mock()
+    io_loop.time.return_value = 0
+
+    main.make_shutdown_handler(
+        server, io_loop, grace_period=3, in_flight=metrics.Gauge('g', ''))()
+
+    server.stop.assert_called_once_with()
+    io_loop.stop.assert_called_once_with()
+
+
+def test_shutdown_waits_for_in_flight_requests_to_finish():
+    server, io_loop = mock.Mock(), mock.Mock()
+    io_loop.time.return_value = 0
+    in_flight = metrics.Gauge('g', '')
+    in_flight.inc()
+
+    main.make_shutdown_handler(
+        server, io_loop, grace_period=3, in_flight=in_flight)()
+    assert_equal(0, io_loop.stop.call_count)
+
+    in_flight.dec()
+    io_loop.call_later.call_args[0][1]()
+    io_loop.stop.assert_called_once_with()
+
+
+def test_shutdown_stops_io_loop_after_grace_period_regardless():
+    server, io_loop = mock.Mock(), mock.Mock()
+    io_loop.time.return_value = 0
+    in_flight = metrics.Gauge('g', '')
+    in_flight.inc()
+
+    main.make_shutdown_handler(
+        server, io_loop, grace_period=3, in_flight=in_flight)()
+
+    io_loop.time.return_value = 3
+    io_loop.call_later.call_args[0][1]()
+    io_loop.stop.assert_called_once_with()
+
+
+def test_shutdown_ignores_repeated_signals():
+    server, io_loop = mock.Mock(), mock.Mock()
+    io_loop.time.return_value = 0
+    shutdown = main.make_shutdown_handler(
+        server, io_loop, in_flight=metrics.Gauge('g', ''))
+
+    shutdown()
+    shutdown()
+
+    server.stop.assert_called_once_with()
+
+
+class TestPreForkedServer(unittest.TestCase):
+    def test_sigterm_to_parent_stops_every_worker(self):
+        port = unused_port()
+        process = subprocess.Popen(
+            [sys.executable, 'main.py', '--port', str(port),
+             '--processes', '2'],
+            cwd=APP_DIR, stdout=DEVNULL, stderr=DEVNULL)
+
+        try:
+            _wait_until_listening(port)
+
+            process.send_signal(signal.SIGTERM)
+            assert_equal(0, _wait(process, timeout=10))
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+        with assert_raises(socket.error):
+            socket.create_connection(('127.0.0.1', port), timeout=1)
+
+
+def _wait_until_listening(port, timeout=10):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def _wait(process, timeout):
+    deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() > deadline:
+            raise AssertionError('Process still running')
+        time.sleep(0.1)
+    return process.returncode
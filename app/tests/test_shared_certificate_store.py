@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from nose.tools import (
+    assert_equal, assert_is_none, assert_not_equal, assert_not_in)
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+import main
+
+from fetch_certificate import fetch_certificate_chain
+from get_certificate import get_certificate
+from shared_certificate_store import SharedCertificateStore
+
+from . import (
+    FakeClock, LocalTlsServer, load_example_x509, load_localhost_x509,
+    start_server)
+
+
+class TestSharedCertificateStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'certificates.sqlite')
+        self.clock = FakeClock()
+        self.store = SharedCertificateStore(
+            self.filename, ttl=60, clock=self.clock)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trips_certificate(self):
+        self.store.put('example.com', 443, [load_example_x509()])
+
+        [x509] = self.store.get('example.com', 443)
+        assert_equal(
+            load_example_x509().get_serial_number(),
+            x509.get_serial_number())
+
+    def test_round_trips_chain_in_order(self):
+        chain = [load_example_x509(), load_localhost_x509()]
+        self.store.put('example.com', 443, chain)
+
+        assert_equal(
+            [x509.get_serial_number() for x509 in chain],
+            [x509.get_serial_number()
+             for x509 in self.store.get('example.com', 443)])
+
+    def test_entries_are_keyed_by_port(self):
+        self.store.put('example.com', 443, [load_example_x509()])
+        assert_is_none(self.store.get('example.com', 8443))
+
+    def test_entries_expire_after_ttl(self):
+        self.store.put('example.com', 443, [load_example_x509()])
+        self.clock.now += 60
+
+        assert_is_none(self.store.get('example.com', 443))
+
+    def test_entries_are_visible_to_other_instances(self):
+        self.store.put('example.com', 443, [load_example_x509()])
+        other_store = SharedCertificateStore(
+            self.filename, ttl=60, clock=self.clock)
+
+        assert_equal(
+            load_example_x509().get_serial_number(),
+            other_store.get('example.com', 443)[0].get_serial_number())
+
+    def test_purge_expired_deletes_old_rows(self):
+        self.store.put('example.com', 443, [load_example_x509()])
+        self.clock.now += 61
+        self.store.purge_expired()
+
+        count = self.store._connection().execute(
+            'SELECT COUNT(*) FROM certificates').fetchone()[0]
+        assert_equal(0, count)
+
+    def test_get_certificate_reads_store_before_downloading(self):
+        self.store.put('example.com', 443, [load_example_x509()])
+
+        with mock.patch(
+                'get_certificate.download_certificate_chain_for') as dl:
+            get_certificate('example.com', 443, shared_store=self.store)
+
+        assert_equal(0, dl.call_count)
+
+    def test_get_certificate_writes_store_after_downloading(self):
+        with mock.patch(
+                'get_certificate.download_certificate_chain_for') as dl:
+            dl.return_value = [load_example_x509()]
+            get_certificate('example.com', 443, shared_store=self.store)
+
+        assert_equal(1, dl.call_count)
+        assert_equal(
+            load_example_x509().get_serial_number(),
+            self.store.get('example.com', 443)[0].get_serial_number())
+
+
+class TestSharedCertificateStoreOnIOLoop(AsyncTestCase):
+    def setUp(self):
+        super(TestSharedCertificateStoreOnIOLoop, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = SharedCertificateStore(
+            os.path.join(self.directory, 'certificates.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestSharedCertificateStoreOnIOLoop, self).tearDown()
+
+    @gen_test
+    def test_fetch_reads_store_off_the_io_loop_thread(self):
+        self.store.put('example.com', 443, [load_example_x509()])
+        threads = []
+
+        def get(hostname, port):
+            threads.append(threading.current_thread())
+            return SharedCertificateStore.get(self.store, hostname, port)
+
+        with mock.patch.object(self.store, 'get', side_effect=get):
+            chain = yield fetch_certificate_chain(
+                'example.com', 443, shared_store=self.store)
+
+        assert_equal(
+            load_example_x509().get_serial_number(),
+            chain[0].get_serial_number())
+        assert_not_equal([threading.current_thread()], threads)
+
+    @gen_test
+    def test_fetch_writes_store_after_downloading(self):
+        server, port = start_server(LocalTlsServer())
+        try:
+            yield fetch_certificate_chain(
+                'localhost', port, shared_store=self.store)
+        finally:
+            server.stop()
+
+        for _ in range(100):  # written in the background
+            if self.store.get('localhost', port) is not None:
+                break
+            yield gen.sleep(0.01)
+
+        assert_equal(
+            load_localhost_x509().get_serial_number(),
+            self.store.get('localhost', port)[0].get_serial_number())
+
+
+def test_make_app_drops_shared_cache_ttl_without_a_store():
+    app = main.make_app(shared_cache_filename=None, shared_cache_ttl=60)
+
+    assert_is_none(app.settings.get('shared_certificate_store'))
+    assert_not_in('shared_cache_ttl', app.settings)
@@ -0,0 +1,195 @@
+import ssl
+
+from nose.tools import assert_equal, assert_is_none, assert_raises
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.tcpserver import TCPServer
+from tornado.testing import AsyncTestCase, gen_test
+
+from fetch_certificate import fetch_certificate
+from starttls import (
+    MAX_RESPONSE_BYTES, POSTGRES_SSL_REQUEST, StartTlsError, select_protocol)
+
+from . import LOCALHOST_SSL_OPTIONS, load_localhost_x509, start_server
+
+
+SMTP_DIALOGUE = [
+    (None, b'220 mx.localhost ESMTP\r\n'),
+    (b'\r\n', b'250-mx.localhost\r\n250-PIPELINING\r\n250 STARTTLS\r\n'),
+    (b'STARTTLS\r\n', b'220 Ready to start TLS\r\n'),
+]
+
+IMAP_DIALOGUE = [
+    (None, b'* OK IMAP4rev1 ready\r\n'),
+    (b'a STARTTLS\r\n', b'* NO [ALERT] Untagged\r\na OK Begin TLS\r\n'),
+]
+
+POP3_DIALOGUE = [
+    (None, b'+OK POP3 ready\r\n'),
+    (b'STLS\r\n', b'+OK Begin TLS\r\n'),
+]
+
+XMPP_FEATURES = (
+    b"<?xml version='1.0'?><stream:stream from='localhost' "
+    b"xmlns='jabber:client' xmlns:stream='http://etherx.jabber.org/streams' "
+    b"version='1.0'><stream:features>"
+    b"<starttls xmlns='urn:ietf:params:xml:ns:xmpp-tls'><required/>"
+    b"</starttls></stream:features>")
+
+XMPP_DIALOGUE = [
+    (b"version='1.0'>", XMPP_FEATURES),
+    (b"xmpp-tls'/>", b"<proceed xmlns='urn:ietf:params:xml:ns:xmpp-tls'/>"),
+]
+
+POSTGRES_DIALOGUE = [
+    (POSTGRES_SSL_REQUEST, b'S'),
+]
+
+
+class StartTlsServer(TCPServer):
+    """
+    Stand-in for a server that starts in plaintext: for each (expected,
+    reply) in `dialogue`, reads up to `expected` (unless None) and writes
+    `reply`, then switches to TLS with the localhost certificate if
+    `upgrade`.
+    """
+    def __init__(self, dialogue, upgrade=True):
+        super(StartTlsServer, self).__init__()
+        self.dialogue = dialogue
+        self.upgrade = upgrade
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        try:
+            for expected, reply in self.dialogue:
+                if expected is not None:
+                    yield stream.read_until(expected)
+                yield stream.write(reply)
+
+            if self.upgrade:
+                stream = yield stream.start_tls(
+                    True, ssl_options=LOCALHOST_SSL_OPTIONS)
+            yield stream.read_until_close()
+        except (StreamClosedError, ssl.SSLError):
+            pass
+
+
+class TestStartTls(AsyncTestCase):
+    def setUp(self):
+        super(TestStartTls, self).setUp()
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        super(TestStartTls, self).tearDown()
+
+    def _serve(self, dialogue, upgrade=True):
+        server, port = start_server(StartTlsServer(dialogue, upgrade))
+        self.servers.append(server)
+        return port
+
+    @gen.coroutine
+    def _assert_fetches_localhost_certificate(self, protocol, dialogue):
+        port = self._serve(dialogue)
+
+        x509 = yield fetch_certificate('localhost', port, starttls=protocol)
+
+        assert_equal(
+            load_localhost_x509().get_serial_number(),
+            x509.get_serial_number())
+
+    @gen_test
+    def test_smtp(self):
+        yield self._assert_fetches_localhost_certificate('smtp', SMTP_DIALOGUE)
+
+    @gen_test
+    def test_imap(self):
+        yield self._assert_fetches_localhost_certificate('imap', IMAP_DIALOGUE)
+
+    @gen_test
+    def test_pop3(self):
+        yield self._assert_fetches_localhost_certificate('pop3', POP3_DIALOGUE)
+
+    @gen_test
+    def test_xmpp(self):
+        yield self._assert_fetches_localhost_certificate('xmpp', XMPP_DIALOGUE)
+
+    @gen_test
+    def test_postgres(self):
+        yield self._assert_fetches_localhost_certificate(
+            'postgres', POSTGRES_DIALOGUE)
+
+    @gen_test
+    def test_smtp_server_without_starttls_raises(self):
+        port = self._serve([
+            (None, b'220 mx.localhost ESMTP\r\n'),
+            (b'\r\n', b'250-mx.localhost\r\n250 PIPELINING\r\n'),
+        ], upgrade=False)
+
+        with assert_raises(StartTlsError):
+            yield fetch_certificate('localhost', port, starttls='smtp')
+
+    @gen_test
+    def test_smtp_server_refusing_starttls_raises(self):
+        port = self._serve(SMTP_DIALOGUE[:2] + [
+            (b'STARTTLS\r\n', b'454 TLS not available\r\n'),
+        ], upgrade=False)
+
+        with assert_raises(StartTlsError):
+            yield fetch_certificate('localhost', port, starttls='smtp')
+
+    @gen_test
+    def test_imap_server_refusing_starttls_raises(self):
+        port = self._serve([
+            (None, b'* OK IMAP4rev1 ready\r\n'),
+            (b'a STARTTLS\r\n', b'a BAD Unknown command\r\n'),
+        ], upgrade=False)
+
+        with assert_raises(StartTlsError):
+            yield fetch_certificate('localhost', port, starttls='imap')
+
+    @gen_test
+    def test_xmpp_server_refusing_starttls_raises(self):
+        port = self._serve([
+            XMPP_DIALOGUE[0],
+            (b"xmpp-tls'/>",
+             b"<failure xmlns='urn:ietf:params:xml:ns:xmpp-tls'/>"),
+        ], upgrade=False)
+
+        with assert_raises(StartTlsError):
+            yield fetch_certificate('localhost', port, starttls='xmpp')
+
+    @gen_test
+    def test_postgres_server_without_ssl_raises(self):
+        port = self._serve([(POSTGRES_SSL_REQUEST, b'N')], upgrade=False)
+
+        with assert_raises(StartTlsError):
+            yield fetch_certificate('localhost', port, starttls='postgres')
+
+    @gen_test
+    def test_overlong_reply_raises(self):
+        port = self._serve(
+            [(None, b'220' + b'-' * MAX_RESPONSE_BYTES)], upgrade=False)
+
+        with assert_raises(StartTlsError):
+            yield fetch_certificate('localhost', port, starttls='smtp')
+
+
+class TestSelectProtocol(object):
+    def test_uses_port_default(self):
+        assert_equal('smtp', select_protocol(25))
+        assert_equal('imap', select_protocol(143))
+
+    def test_port_without_default_handshakes_immediately(self):
+        assert_is_none(select_protocol(443))
+
+    def test_explicit_protocol_overrides_port(self):
+        assert_equal('xmpp', select_protocol(443, 'xmpp'))
+
+    def test_none_disables_port_default(self):
+        assert_is_none(select_protocol(25, 'none'))
+
+    def test_unknown_protocol_raises(self):
+        with assert_raises(ValueError):
+            select_protocol(25, 'gopher')
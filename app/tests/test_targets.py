@@ -0,0 +1,13 @@
+from nose.tools import assert_equal, assert_raises
+
+from targets import parse_target
+
+
+def test_parse_target():
+    assert_equal(('example.com', 443), parse_target('Example.com'))
+    assert_equal(('example.com', 8443), parse_target('example.com:8443'))
+
+
+def test_parse_target_rejects_invalid_port():
+    with assert_raises(ValueError):
+        parse_target('example.com:99999')
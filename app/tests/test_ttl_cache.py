@@ -0,0 +1,124 @@
+from nose.tools import assert_equal, assert_is_none, assert_raises
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from ttl_cache import TtlCache
+
+from . import FakeClock, resolved_future
+
+
+def test_get_returns_none_for_unknown_key():
+    assert_is_none(TtlCache(10, 10).get(('example.com', 443, None)))
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TtlCache(ttl=10, max_entries=10, clock=clock)
+    cache.put('key', 'value')
+
+    clock.now += 9
+    assert_equal('value', cache.get('key'))
+
+    clock.now += 1
+    assert_is_none(cache.get('key'))
+    assert_equal(1, cache.expirations)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TtlCache(ttl=10, max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert_equal(1, cache.get('a'))
+    assert_is_none(cache.get('b'))
+    assert_equal(3, cache.get('c'))
+    assert_equal(1, cache.evictions)
+
+
+def test_zero_ttl_disables_caching():
+    cache = TtlCache(ttl=0, max_entries=10)
+    cache.put('a', 1)
+    assert_equal(0, len(cache))
+
+
+class TestGetOrFetch(AsyncTestCase):
+    @gen_test
+    def test_second_lookup_is_a_hit(self):
+        cache = TtlCache(ttl=10, max_entries=10)
+        fetches = []
+
+        def fetch():
+            fetches.append(1)
+            return resolved_future('x509')
+
+        yield cache.get_or_fetch('key', fetch)
+        result = yield cache.get_or_fetch('key', fetch)
+
+        assert_equal('x509', result)
+        assert_equal(1, len(fetches))
+        assert_equal((1, 1), (cache.hits, cache.misses))
+
+    @gen_test
+    def test_concurrent_lookups_share_one_fetch(self):
+        cache = TtlCache(ttl=10, max_entries=10)
+        pending = Future()
+        fetches = []
+
+        def fetch():
+            fetches.append(1)
+            return pending
+
+        lookups = [cache.get_or_fetch('key', fetch) for _ in range(5)]
+        pending.set_result('x509')
+        results = yield lookups
+
+        assert_equal(['x509'] * 5, results)
+        assert_equal(1, len(fetches))
+        assert_equal(4, cache.coalesced)
+
+    @gen_test
+    def test_stale_entry_is_served_while_it_is_refreshed(self):
+        clock = FakeClock()
+        cache = TtlCache(ttl=10, max_entries=10, stale_ttl=5, clock=clock)
+        cache.put('key', 'old')
+        clock.now += 12
+        pending = Future()
+
+        result = yield cache.get_or_fetch('key', lambda: pending)
+
+        assert_equal('old', result)
+        assert_equal((1, 1), (cache.stale_hits, cache.stats()['in_flight']))
+
+        pending.set_result('new')
+        yield gen.moment
+        assert_equal('new', cache.get('key'))
+
+    @gen_test
+    def test_entry_is_not_served_once_past_stale_ttl(self):
+        clock = FakeClock()
+        cache = TtlCache(ttl=10, max_entries=10, stale_ttl=5, clock=clock)
+        cache.put('key', 'old')
+        clock.now += 15
+
+        result = yield cache.get_or_fetch(
+            'key', lambda: resolved_future('new'))
+
+        assert_equal('new', result)
+        assert_equal((0, 1), (cache.stale_hits, cache.misses))
+
+    @gen_test
+    def test_failures_are_not_cached(self):
+        cache = TtlCache(ttl=10, max_entries=10)
+
+        @gen.coroutine
+        def failing_fetch():
+            raise ValueError('handshake failed')
+
+        with assert_raises(ValueError):
+            yield cache.get_or_fetch('key', failing_fetch)
+
+        assert_equal(0, len(cache))
+        assert_equal(0, cache.stats()['in_flight'])
@@ -0,0 +1,171 @@
+from __future__ import unicode_literals
+
+import logging
+import time
+
+from collections import OrderedDict
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+
+LOG = logging.getLogger(__name__)
+
+
+class TtlCache(object):
+    """
+    Process-local LRU cache of at most `max_entries` values, each kept for
+    `ttl` seconds.
+
+    Concurrent `get_or_fetch` calls for a key that is already being fetched
+    wait on the same fetch ("single-flight").
+
+    With a `stale_ttl`, an entry is kept that many seconds past its expiry:
+    `get_or_fetch` returns it immediately and refreshes it in the
+    background, rather than making the caller wait for the fetch.
+    """
+
+    def __init__(self, ttl, max_entries, stale_ttl=0, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight = {}  # key -> Future
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        try:
+            expires_at, value = self._entries[key]
+        except KeyError:
+            return None
+
+        if expires_at <= self._clock():
+            if expires_at + self.stale_ttl <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+            return None
+
+        self._move_to_end(key)
+        return value
+
+    def get_stale(self, key):
+        """
+        Return the value for `key` if it has expired but is within
+        `stale_ttl` of its expiry, otherwise None.
+        """
+        try:
+            expires_at, value = self._entries[key]
+        except KeyError:
+            return None
+
+        if expires_at <= self._clock() < expires_at + self.stale_ttl:
+            return value
+
+        return None
+
+    def expires_at(self, key):
+        """
+        Return the time `key` expires (or expired, if stale), or None if it
+        isn't cached.
+        """
+        try:
+            return self._entries[key][0]
+        except KeyError:
+            return None
+
+    def put(self, key, value):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+
+        self._entries.pop(key, None)
+        self._entries[key] = (self._clock() + self.ttl, value)
+
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            LOG.debug('Evicted {} from {}'.format(
+                evicted_key, type(self).__name__))
+            self.evictions += 1
+
+    @gen.coroutine
+    def get_or_fetch(self, key, fetch):
+        """
+        Return the cached value for `key`, otherwise call `fetch()` (which
+        must return a Future) and cache its result. Failures are not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            raise gen.Return(value)
+
+        value = self.get_stale(key)
+        if value is not None:
+            self.stale_hits += 1
+            if key not in self._in_flight:
+                IOLoop.current().add_future(
+                    self.refresh(key, fetch), _log_refresh_failure)
+            raise gen.Return(value)
+
+        if key in self._in_flight:
+            self.coalesced += 1
+            value = yield self._in_flight[key]
+            raise gen.Return(value)
+
+        self.misses += 1
+        value = yield self.refresh(key, fetch)
+        raise gen.Return(value)
+
+    @gen.coroutine
+    def refresh(self, key, fetch):
+        """
+        Call `fetch()` and cache its result, whether or not `key` is cached
+        already. If a fetch for `key` is in flight, wait for that instead.
+        """
+        if key in self._in_flight:
+            value = yield self._in_flight[key]
+            raise gen.Return(value)
+
+        future = self._in_flight[key] = fetch()
+        try:
+            value = yield future
+        finally:
+            del self._in_flight[key]
+
+        self.put(key, value)
+        raise gen.Return(value)
+
+    def stats(self):
+        return OrderedDict([
+            ('entries', len(self._entries)),
+            ('max_entries', self.max_entries),
+            ('ttl', self.ttl),
+            ('stale_ttl', self.stale_ttl),
+            ('in_flight', len(self._in_flight)),
+            ('hits', self.hits),
+            ('misses', self.misses),
+            ('coalesced', self.coalesced),
+            ('stale_hits', self.stale_hits),
+            ('evictions', self.evictions),
+            ('expirations', self.expirations),
+        ])
+
+    def _move_to_end(self, key):
+        try:
+            self._entries.move_to_end(key)
+        except AttributeError:  # Python 2's OrderedDict has no move_to_end()
+            self._entries[key] = self._entries.pop(key)
+
+
+def _log_refresh_failure(future):
+    if future.exception() is not None:
+        LOG.info('Background refresh failed: {!r}'.format(future.exception()))